@@ -0,0 +1,200 @@
+"""
+Debug Artifacts
+Screenshots and page HTML captured during automation runs, for diagnosing
+failures without growing ./uploads/logs forever.
+
+- Policy: "always", "on_error" (default) or "sampled" (errors plus a
+  percentage of successful steps); "off" disables capture
+- Screenshots are clipped to the element of interest when one is given,
+  otherwise the viewport; HTML is gzip-compressed
+- Files are written (and the directory indexed on first use) by a
+  background thread, so the automation loop only pays for taking the screenshot
+- The directory is a ring buffer: the oldest artifacts are deleted once the
+  total size cap is exceeded or they pass the retention age
+"""
+
+import gzip
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+from config import get_settings
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+POLICIES = ('always', 'on_error', 'sampled', 'off')
+
+# Names capture() generates; nothing else in the artifact directory is ever evicted
+ARTIFACT_FILE = re.compile(r'_\d{8}_\d{6}_\d{3}\.(png|html\.gz)$')
+
+
+def should_capture(error: bool) -> bool:
+    """Decide from the configured policy whether to keep artifacts for this step"""
+    policy = settings.artifact_policy
+    if policy not in POLICIES:
+        policy = 'on_error'
+    if policy == 'off':
+        return False
+    if policy == 'always' or error:
+        return True
+    if policy == 'sampled':
+        return random.random() * 100 < settings.artifact_sample_percent
+    return False
+
+
+class ArtifactWriter:
+    """
+    Background writer and ring-buffer index for the artifact directory
+
+    Files are queued with put() and written in order by a daemon thread, which
+    then evicts the oldest artifacts over the size cap or past the age limit.
+    """
+
+    def __init__(self, directory: Optional[str] = None):
+        self.directory = directory or settings.artifact_dir
+        self._queue: queue.Queue = queue.Queue(maxsize=settings.artifact_queue_size)
+        self._index: "OrderedDict[str, tuple]" = OrderedDict()  # path -> (size, written_at), oldest first
+        self._total = 0
+        self._dropped = 0
+        self._evicted = 0
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._work, name="artifact-writer", daemon=True)
+                self._thread.start()
+
+    def _scan(self):
+        """Index artifacts left by earlier runs so they count against the budget"""
+        found = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and ARTIFACT_FILE.search(entry.name):
+                stat = entry.stat()
+                found.append((stat.st_mtime, entry.path, stat.st_size))
+        for mtime, path, size in sorted(found):
+            self._index[path] = (size, mtime)
+            self._total += size
+        self._evict()
+
+    def put(self, path: str, data: bytes, compress: bool = False):
+        """Queue a file for writing (gzipped on the writer thread if `compress`); dropped if the writer is backed up"""
+        self._start()
+        try:
+            self._queue.put_nowait((path, data, compress))
+        except queue.Full:
+            self._dropped += 1
+            logger.warning(f"Artifact queue full, dropping {path}")
+
+    def flush(self, timeout: float = 10.0):
+        """Wait until queued files are written (used on shutdown)"""
+        if self._thread is None:
+            return
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+    def _work(self):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            self._scan()
+        except Exception as e:
+            logger.warning(f"Could not index artifact directory {self.directory}: {str(e)}")
+        while True:
+            path, data, compress = self._queue.get()
+            try:
+                if compress:
+                    data = gzip.compress(data, compresslevel=6)
+                with open(path, 'wb') as f:
+                    f.write(data)
+                self._index.pop(path, None)
+                self._index[path] = (len(data), time.time())
+                self._total += len(data)
+                self._evict()
+            except Exception as e:
+                logger.warning(f"Could not write artifact {path}: {str(e)}")
+            finally:
+                self._queue.task_done()
+
+    def _evict(self):
+        cap = settings.artifact_max_total_mb * 1024 * 1024
+        oldest_allowed = time.time() - settings.artifact_max_age_days * 86400
+        while self._index:
+            path, (size, written_at) = next(iter(self._index.items()))
+            if self._total <= cap and written_at >= oldest_allowed:
+                break
+            self._index.popitem(last=False)
+            self._total -= size
+            self._evicted += 1
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                logger.warning(f"Could not delete artifact {path}: {str(e)}")
+
+    def stats(self) -> Dict:
+        return {
+            "files": len(self._index),
+            "total_bytes": self._total,
+            "queued": self._queue.qsize(),
+            "dropped": self._dropped,
+            "evicted": self._evicted
+        }
+
+
+writer = ArtifactWriter()
+
+
+async def capture(
+    page,
+    name: str,
+    error: bool = False,
+    selector: Optional[str] = None,
+    html: bool = True,
+    force: bool = False,
+    full_page: bool = False
+) -> Dict[str, Optional[str]]:
+    """
+    Capture a screenshot (and the page HTML) if the policy keeps this step
+
+    `selector` clips the screenshot to that element when it is on the page,
+    otherwise the viewport (or the whole page with `full_page`) is taken.
+    `force` captures regardless of policy, for artifacts a person needs to
+    see (e.g. a code the automation could not read). Returns the paths the
+    files will be written to; they appear once the writer catches up.
+    """
+    paths = {"screenshot_path": None, "html_path": None}
+    if page is None or not (force or should_capture(error)):
+        return paths
+
+    base = os.path.join(writer.directory, f"{name}_{time.strftime('%Y%m%d_%H%M%S')}_{int(time.time() * 1000) % 1000:03d}")
+    try:
+        element = await page.query_selector(selector) if selector else None
+        if element:
+            image = await element.screenshot(type='png', timeout=5000)
+        else:
+            image = await page.screenshot(type='png', full_page=full_page, timeout=5000)
+        paths["screenshot_path"] = f"{base}.png"
+        writer.put(paths["screenshot_path"], image)
+    except Exception as e:
+        logger.debug(f"Screenshot for {name} failed: {str(e)}")
+
+    if html:
+        try:
+            content = await page.content()
+            paths["html_path"] = f"{base}.html.gz"
+            writer.put(paths["html_path"], content.encode('utf-8'), compress=True)
+        except Exception as e:
+            logger.debug(f"HTML capture for {name} failed: {str(e)}")
+
+    if paths["screenshot_path"] or paths["html_path"]:
+        logger.info(f"Artifacts for {name}: {paths['screenshot_path'] or paths['html_path']}")
+    return paths
@@ -0,0 +1,176 @@
+"""
+Automation Runtime
+The one long-lived event loop, in its own thread, that owns every browser and
+runs every automation job, and the mailboxes API handlers use to talk to jobs.
+
+Each job is an actor addressed by its job id. Handlers on any thread send it
+messages (otp_submitted, payment_verified, cancel) with send(); delivery is a
+single hop onto the runtime loop. A message for a parked job starts its
+registered continuation on the next free worker slot. A message that arrives
+while the job is still running waits in its mailbox until the job parks, so
+each job handles one message at a time, in order.
+"""
+
+import sys
+import asyncio
+
+# Fix for Windows Playwright async issue
+if sys.platform == 'win32':
+    asyncio.set_event_loop_policy(asyncio.WindowsProactorEventLoopPolicy())
+
+import logging
+from collections import deque
+from concurrent.futures import Future
+from threading import Thread, Lock
+from typing import Callable, Coroutine, Deque, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Playwright objects are bound to the loop that created them, so every job
+# runs on one long-lived loop instead of a throwaway asyncio.run per thread.
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = Lock()
+
+
+def get_automation_loop() -> asyncio.AbstractEventLoop:
+    """Return the event loop that owns all pooled browsers, starting it on first use"""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            thread = Thread(target=_loop.run_forever, name="automation-loop")
+            thread.daemon = True
+            thread.start()
+            logger.info("Started automation event loop thread")
+    return _loop
+
+
+def run_on_automation_loop(coro) -> Future:
+    """Schedule a coroutine on the automation loop from any thread"""
+    return asyncio.run_coroutine_threadsafe(coro, get_automation_loop())
+
+
+# What a parked job is waiting for when it expects each message
+MESSAGE_TRIGGERS = {
+    "otp_submitted": "otp",
+    "payment_verified": "payment",
+}
+
+
+class JobActor:
+    """A job's mailbox and, while it is running, its task"""
+
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+        self.task: Optional[asyncio.Task] = None
+        self.mailbox: Deque[Tuple[str, str, str, Dict]] = deque()  # (portal, application_id, message, payload)
+
+
+class AutomationRuntime:
+    """
+    Job actors and message routing; all state lives on the automation loop
+
+    Portals register a handler per message with on(); a handler takes
+    (application_id, job_id, **payload) and returns the coroutine to run.
+    "cancel" handlers run after the job's task (if any) has been cancelled.
+    """
+
+    def __init__(self):
+        self._actors: Dict[str, JobActor] = {}
+        self._handlers: Dict[Tuple[str, str], Callable[..., Coroutine]] = {}
+        self._idle_listeners: List[Callable[[str], None]] = []
+        self.draining = False  # Set on shutdown; long jobs stop at their next checkpoint
+
+    def on(self, portal: str, message: str, handler: Callable[..., Coroutine]):
+        self._handlers[(portal, message)] = handler
+
+    def on_idle(self, listener: Callable[[str], None]):
+        """Call listener(job_id) whenever a job stops running with nothing left in its mailbox"""
+        self._idle_listeners.append(listener)
+
+    def send(self, portal: str, application_id: str, job_id: str, message: str, **payload) -> Future:
+        """Deliver a message to a job from any thread; the future resolves to True if it was accepted"""
+        return run_on_automation_loop(self.deliver(portal, application_id, job_id, message, payload))
+
+    def attach(self, job_id: str, task: asyncio.Task):
+        """Called when a job's task takes a worker slot"""
+        self._actor(job_id).task = task
+
+    def detach(self, job_id: str, task: asyncio.Task):
+        """Called when a job's task ends (finished or parked); starts the next queued message"""
+        actor = self._actors.get(job_id)
+        if actor is None or actor.task is not task:
+            return
+        actor.task = None
+        if actor.mailbox:
+            self._start(actor, *actor.mailbox.popleft())
+            return
+        self._actors.pop(job_id, None)
+        for listener in self._idle_listeners:
+            try:
+                listener(job_id)
+            except Exception as e:
+                logger.error(f"Idle listener failed for job {job_id}: {str(e)}")
+
+    def _actor(self, job_id: str) -> JobActor:
+        if job_id not in self._actors:
+            self._actors[job_id] = JobActor(job_id)
+        return self._actors[job_id]
+
+    def _start(self, actor: JobActor, portal: str, application_id: str, message: str, payload: Dict):
+        from job_scheduler import scheduler
+
+        logger.info(f"Delivering {message} to job {actor.job_id}")
+        handler = self._handlers[(portal, message)]
+        trigger = MESSAGE_TRIGGERS.get(message, message)
+        task = asyncio.get_running_loop().create_task(
+            scheduler.resume(actor.job_id, trigger, handler(application_id, actor.job_id, **payload))
+        )
+        # The job is busy from now on, even while its continuation waits for a slot
+        actor.task = task
+        task.add_done_callback(lambda t: self.detach(actor.job_id, t))
+
+    async def deliver(self, portal: str, application_id: str, job_id: str, message: str, payload: Dict) -> bool:
+        """Deliver a message to a job (on the automation loop)"""
+        handler = self._handlers.get((portal, message))
+        if handler is None:
+            logger.warning(f"No {portal} handler for message {message} (job {job_id})")
+            return False
+
+        actor = self._actor(job_id)
+        if message == "cancel":
+            actor.mailbox.clear()
+            task = actor.task
+            if task and not task.done():
+                logger.info(f"Cancelling running job {job_id}")
+                task.cancel()
+                try:
+                    await task
+                except (asyncio.CancelledError, Exception):
+                    pass
+            self._actors.pop(job_id, None)
+            await handler(application_id, job_id, **payload)
+            return True
+
+        if actor.task is not None:
+            # Still running (e.g. the OTP arrived before the job finished parking)
+            logger.info(f"Job {job_id} is busy, queueing {message}")
+            actor.mailbox.append((portal, application_id, message, payload))
+            return True
+
+        self._start(actor, portal, application_id, message, payload)
+        return True
+
+    def tasks(self) -> Dict[str, asyncio.Task]:
+        """Running (or slot-waiting) task per job"""
+        return {job_id: actor.task for job_id, actor in self._actors.items() if actor.task}
+
+    def stats(self) -> Dict:
+        return {
+            "actors": len(self._actors),
+            "running": sum(1 for a in list(self._actors.values()) if a.task),
+            "queued_messages": sum(len(a.mailbox) for a in list(self._actors.values()))
+        }
+
+
+runtime = AutomationRuntime()
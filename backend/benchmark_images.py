@@ -0,0 +1,98 @@
+"""
+Image Decode Benchmark
+Compares the full decode the photo processors used to do with load_image's
+reduced (draft) decode, on camera-sized versions of the sample photos.
+
+The samples in uploads/photos are already processed (300x300 or 470x610), so
+each is upscaled to --size and re-encoded as a JPEG to stand in for a phone
+upload. For every spec the script reports decode+resize time and the size of
+the decoded image, which is what dominates peak memory per image.
+
+Usage: python benchmark_images.py [--size 4000x3000] [--repeat 3] [--limit 10]
+"""
+
+import argparse
+import glob
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from PIL import Image
+from photo_utils import load_image, DU_PHOTO, BUP_PHOTO, BUP_SIGNATURE, REDUCING_GAP
+
+SPECS = {"du_photo": DU_PHOTO, "bup_photo": BUP_PHOTO, "bup_signature": BUP_SIGNATURE}
+
+
+def camera_jpeg(path: str, size) -> bytes:
+    """A sample photo upscaled to camera resolution, as upload bytes"""
+    img = Image.open(path).convert('RGB').resize(size, Image.Resampling.BICUBIC)
+    buffer = io.BytesIO()
+    img.save(buffer, 'JPEG', quality=92)
+    return buffer.getvalue()
+
+
+def full_decode(data: bytes, spec):
+    """The old path: decode every pixel, then resize"""
+    img = Image.open(io.BytesIO(data))
+    img = img.convert('RGB')
+    decoded = img.size
+    return img.resize((spec.width, spec.height), Image.Resampling.LANCZOS), decoded
+
+
+def reduced_decode(data: bytes, spec):
+    """The new path: draft decode near the target size, then resize"""
+    img = load_image(data, (spec.width, spec.height))
+    decoded = img.size
+    return img.resize((spec.width, spec.height), Image.Resampling.LANCZOS, reducing_gap=REDUCING_GAP), decoded
+
+
+def timed(fn, data, spec, repeat: int):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        _, decoded = fn(data, spec)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, decoded
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--photos", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "uploads", "photos"))
+    parser.add_argument("--size", default="4000x3000", help="Camera resolution to simulate (WxH)")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per measurement (best is kept)")
+    parser.add_argument("--limit", type=int, default=10, help="Sample photos to use")
+    args = parser.parse_args()
+
+    size = tuple(int(part) for part in args.size.lower().split("x"))
+    paths = sorted(glob.glob(os.path.join(args.photos, "*.jpg")))[:args.limit]
+    if not paths:
+        print(f"No sample photos in {args.photos}")
+        return
+
+    print(f"{len(paths)} sample photos upscaled to {size[0]}x{size[1]}, best of {args.repeat}\n")
+    print(f"{'spec':<14} {'full ms':>9} {'draft ms':>9} {'speedup':>8} {'full MB':>9} {'draft MB':>9} {'memory':>7}")
+    for name, spec in SPECS.items():
+        totals = [0.0, 0.0, 0, 0]
+        for path in paths:
+            data = camera_jpeg(path, size)
+            full_time, full_size = timed(full_decode, data, spec, args.repeat)
+            draft_time, draft_size = timed(reduced_decode, data, spec, args.repeat)
+            totals[0] += full_time
+            totals[1] += draft_time
+            totals[2] += full_size[0] * full_size[1] * 3
+            totals[3] += draft_size[0] * draft_size[1] * 3
+        count = len(paths)
+        full_ms, draft_ms = totals[0] / count * 1000, totals[1] / count * 1000
+        full_mb, draft_mb = totals[2] / count / 1e6, totals[3] / count / 1e6
+        print(
+            f"{name:<14} {full_ms:>9.1f} {draft_ms:>9.1f} {full_ms / draft_ms:>7.1f}x "
+            f"{full_mb:>9.1f} {draft_mb:>9.2f} {full_mb / draft_mb:>6.0f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,310 @@
+"""
+Shared Chromium Pool
+A few long-lived browsers hand out isolated BrowserContexts to automation jobs
+"""
+
+import sys
+import asyncio
+
+# Fix for Windows Playwright async issue
+if sys.platform == 'win32':
+    asyncio.set_event_loop_policy(asyncio.WindowsProactorEventLoopPolicy())
+
+from playwright.async_api import async_playwright, Browser, BrowserContext
+from typing import Awaitable, Callable, Dict, List, Optional
+from config import get_settings
+import logging
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+LAUNCH_ARGS = ['--no-sandbox', '--disable-setuid-sandbox', '--disable-dev-shm-usage']
+
+# Called when a pool is full; each may free a context (e.g. hibernate an idle
+# paused session) and returns True if it did
+_pressure_hooks: List[Callable[[], Awaitable[bool]]] = []
+
+
+def register_pressure_hook(hook: Callable[[], Awaitable[bool]]):
+    """Register a coroutine function that can give a leased context back under pressure"""
+    _pressure_hooks.append(hook)
+
+
+class PooledBrowser:
+    """A launched browser and its lease counters"""
+
+    def __init__(self, browser: Browser):
+        self.browser = browser
+        self.active = 0     # contexts currently leased out
+        self.served = 0     # contexts handed out over this browser's lifetime
+        self.retiring = False
+
+    @property
+    def usable(self) -> bool:
+        return self.browser.is_connected() and not self.retiring
+
+
+class BrowserPool:
+    """
+    Process-wide pool of Chromium instances
+
+    - At most `max_browsers` browsers are running at once
+    - Each browser serves up to `contexts_per_browser` concurrent contexts
+    - A browser is retired (closed once idle, then relaunched on demand)
+      after it has served `restart_after` contexts
+    - Disconnected or unresponsive browsers are dropped by the health check
+
+    Launching, probing and closing browsers happen outside the lease lock, so
+    a slow launch never holds up other acquires and releases.
+
+    All methods must be awaited on the same event loop (see automation_runtime.get_automation_loop).
+    """
+
+    def __init__(
+        self,
+        headless: bool = True,
+        max_browsers: Optional[int] = None,
+        contexts_per_browser: Optional[int] = None,
+        restart_after: Optional[int] = None,
+        health_interval: Optional[int] = None
+    ):
+        self.headless = headless
+        self.max_browsers = max_browsers or settings.browser_pool_max_browsers
+        self.contexts_per_browser = contexts_per_browser or settings.browser_pool_contexts_per_browser
+        self.restart_after = restart_after or settings.browser_pool_restart_after
+        self.health_interval = settings.browser_pool_health_interval if health_interval is None else health_interval
+
+        self.playwright = None
+        self._browsers: List[PooledBrowser] = []
+        self._launching = 0  # launches in progress, counted against max_browsers
+        self._owners: Dict[BrowserContext, PooledBrowser] = {}
+        self._cond: Optional[asyncio.Condition] = None
+        self._health_task: Optional[asyncio.Task] = None
+        self._relief_task: Optional[asyncio.Task] = None
+        self._closed = False
+
+    async def start(self):
+        """Start Playwright and the background health check"""
+        if self._cond is None:
+            self._cond = asyncio.Condition()
+        async with self._cond:
+            if self.playwright:
+                return
+            self.playwright = await async_playwright().start()
+            if self.health_interval > 0:
+                self._health_task = asyncio.create_task(self._health_loop())
+            logger.info(
+                f"Browser pool started (headless={self.headless}, max_browsers={self.max_browsers}, "
+                f"contexts_per_browser={self.contexts_per_browser}, restart_after={self.restart_after})"
+            )
+
+    async def acquire(self, **context_options) -> BrowserContext:
+        """
+        Lease an isolated BrowserContext, waiting for capacity if the pool is full
+        `context_options` are passed to Browser.new_context (viewport, locale, timezone_id, ...)
+        """
+        await self.start()
+
+        retired: List[PooledBrowser] = []
+        async with self._cond:
+            while True:
+                if self._closed:
+                    raise RuntimeError("Browser pool is closed")
+                retired += self._prune()
+                pooled = self._pick()
+                if pooled or len(self._browsers) + self._launching < self.max_browsers:
+                    break
+                self._request_relief()
+                await self._cond.wait()
+
+            if pooled:
+                self._lease(pooled)
+            else:
+                self._launching += 1
+        await self._close_browsers(retired)
+
+        if pooled is None:
+            pooled = await self._launch()
+
+        try:
+            context = await pooled.browser.new_context(**context_options)
+        except Exception:
+            await self._finish_lease(pooled)
+            raise
+
+        self._owners[context] = pooled
+        return context
+
+    async def release(self, context: BrowserContext):
+        """Close a leased context and return its slot to the pool"""
+        pooled = self._owners.pop(context, None)
+        try:
+            await context.close()
+        except Exception as e:
+            logger.debug(f"Context close error: {str(e)}")
+        if pooled:
+            await self._finish_lease(pooled)
+
+    async def health_check(self):
+        """Drop disconnected browsers and probe idle ones with a throwaway context"""
+        if not self._cond:
+            return
+        async with self._cond:
+            retired = self._prune()
+            idle = [pooled for pooled in self._browsers if pooled.usable and not pooled.active]
+        await self._close_browsers(retired)
+
+        failed = []
+        for pooled in idle:
+            try:
+                probe = await asyncio.wait_for(pooled.browser.new_context(), timeout=10)
+                await probe.close()
+            except Exception as e:
+                logger.warning(f"Browser failed health check, restarting: {str(e)}")
+                failed.append(pooled)
+
+        async with self._cond:
+            retired = []
+            for pooled in failed:
+                # Leased while it was probed: close it once those leases end
+                pooled.retiring = True
+                if not pooled.active and pooled in self._browsers:
+                    self._browsers.remove(pooled)
+                    retired.append(pooled)
+            self._cond.notify_all()
+        await self._close_browsers(retired)
+
+    def stats(self) -> Dict:
+        """Current pool occupancy"""
+        return {
+            "headless": self.headless,
+            "browsers": len(self._browsers),
+            "max_browsers": self.max_browsers,
+            "active_contexts": sum(p.active for p in self._browsers),
+            "capacity": self.max_browsers * self.contexts_per_browser,
+            "served": [p.served for p in self._browsers]
+        }
+
+    async def close(self):
+        """Close every browser and stop Playwright"""
+        self._closed = True
+        if self._health_task:
+            self._health_task.cancel()
+            self._health_task = None
+        for pooled in list(self._browsers):
+            await self._close_browser(pooled)
+        self._owners.clear()
+        if self.playwright:
+            await self.playwright.stop()
+            self.playwright = None
+        logger.info("Browser pool closed")
+
+    def _pick(self) -> Optional[PooledBrowser]:
+        """Least-loaded usable browser with a free context slot"""
+        candidates = [
+            p for p in self._browsers
+            if p.usable and p.active < self.contexts_per_browser
+        ]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda p: p.active)
+
+    def _lease(self, pooled: PooledBrowser):
+        pooled.active += 1
+        pooled.served += 1
+        if pooled.served >= self.restart_after:
+            pooled.retiring = True
+
+    async def _launch(self) -> PooledBrowser:
+        """Launch a browser for a slot reserved in _launching (outside the lock), leased to the caller"""
+        browser = None
+        try:
+            browser = await self.playwright.chromium.launch(headless=self.headless, args=LAUNCH_ARGS)
+        finally:
+            async with self._cond:
+                self._launching -= 1
+                pooled = None
+                if browser and self._closed:
+                    await browser.close()
+                    raise RuntimeError("Browser pool is closed")
+                if browser:
+                    pooled = PooledBrowser(browser)
+                    self._lease(pooled)
+                    self._browsers.append(pooled)
+                self._cond.notify_all()
+        logger.info(f"Launched pooled browser ({len(self._browsers)}/{self.max_browsers})")
+        return pooled
+
+    def _prune(self) -> List[PooledBrowser]:
+        """Remove browsers that crashed or finished retiring; returns those still to be closed"""
+        retired = []
+        for pooled in list(self._browsers):
+            if not pooled.browser.is_connected():
+                logger.warning("Pooled browser disconnected, removing from pool")
+                self._browsers.remove(pooled)
+            elif pooled.retiring and pooled.active == 0:
+                self._browsers.remove(pooled)
+                retired.append(pooled)
+        return retired
+
+    async def _close_browser(self, pooled: PooledBrowser):
+        if pooled in self._browsers:
+            self._browsers.remove(pooled)
+        try:
+            await pooled.browser.close()
+        except Exception as e:
+            logger.debug(f"Browser close error: {str(e)}")
+        logger.info(f"Closed pooled browser after {pooled.served} contexts")
+
+    async def _close_browsers(self, retired: List[PooledBrowser]):
+        for pooled in retired:
+            await self._close_browser(pooled)
+
+    async def _finish_lease(self, pooled: PooledBrowser):
+        retired = []
+        async with self._cond:
+            pooled.active = max(0, pooled.active - 1)
+            if pooled.retiring and pooled.active == 0 and pooled in self._browsers:
+                self._browsers.remove(pooled)
+                retired.append(pooled)
+            self._cond.notify_all()
+        await self._close_browsers(retired)
+
+    def _request_relief(self):
+        """Ask the pressure hooks to free a context; runs outside the lease lock"""
+        if _pressure_hooks and (self._relief_task is None or self._relief_task.done()):
+            self._relief_task = asyncio.create_task(self._relieve())
+
+    async def _relieve(self):
+        for hook in _pressure_hooks:
+            try:
+                if await hook():
+                    return
+            except Exception as e:
+                logger.error(f"Browser pool pressure hook error: {str(e)}")
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(self.health_interval)
+            try:
+                await self.health_check()
+            except Exception as e:
+                logger.error(f"Browser pool health check error: {str(e)}")
+
+
+# One pool per launch mode; pools live on the automation loop
+_pools: Dict[bool, BrowserPool] = {}
+
+
+def get_browser_pool(headless: bool = True) -> BrowserPool:
+    """Get the process-wide pool for the given launch mode"""
+    if headless not in _pools:
+        _pools[headless] = BrowserPool(headless=headless)
+    return _pools[headless]
+
+
+async def shutdown_browser_pools():
+    """Close all pools (call on the automation loop)"""
+    for pool in list(_pools.values()):
+        await pool.close()
+    _pools.clear()
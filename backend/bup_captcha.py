@@ -7,11 +7,87 @@ during the BUP admission process.
 
 import asyncio
 import logging
-from typing import Dict, Optional
+import time
+from threading import Lock
+from typing import Callable, Dict, Optional
 from playwright.async_api import Page
+from job_scheduler import scheduler
 
 logger = logging.getLogger(__name__)
 
+# Elements worth cropping for the relay, most specific first
+CAPTCHA_IMAGE_SELECTORS = [
+    'img[src*="captcha" i]',
+    'img[id*="captcha" i]',
+    'canvas',
+    'iframe[src*="recaptcha"]',
+]
+
+CAPTCHA_INPUT_SELECTORS = [
+    'input[name*="captcha" i]',
+    'input[id*="captcha" i]',
+]
+
+
+class CaptchaChallenge:
+    """A CAPTCHA image waiting for a human answer"""
+
+    def __init__(self, application_id: str, image: bytes, captcha_type: str, attempt: int):
+        self.application_id = application_id
+        self.image = image
+        self.captcha_type = captcha_type
+        self.attempt = attempt
+        self.created_at = time.time()
+        self.loop = asyncio.get_running_loop()
+        self.solution: asyncio.Future = self.loop.create_future()
+
+
+class CaptchaRelay:
+    """
+    Hands CAPTCHA images to the API and solutions back to the waiting automation
+
+    Challenges are created on the automation loop; images are read and
+    solutions submitted from API request handlers on another thread.
+    """
+
+    def __init__(self):
+        self._challenges: Dict[str, CaptchaChallenge] = {}
+        self._lock = Lock()
+
+    def open(self, application_id: str, image: bytes, captcha_type: str, attempt: int = 1) -> CaptchaChallenge:
+        challenge = CaptchaChallenge(application_id, image, captcha_type, attempt)
+        with self._lock:
+            previous = self._challenges.get(application_id)
+            self._challenges[application_id] = challenge
+        if previous and not previous.solution.done():
+            previous.loop.call_soon_threadsafe(previous.solution.cancel)
+        return challenge
+
+    def get(self, application_id: str) -> Optional[CaptchaChallenge]:
+        with self._lock:
+            return self._challenges.get(application_id)
+
+    def submit(self, application_id: str, solution: str) -> bool:
+        """Deliver an answer; returns False if nothing is waiting for this application"""
+        with self._lock:
+            challenge = self._challenges.get(application_id)
+        if not challenge or challenge.solution.done():
+            return False
+
+        def resolve():
+            if not challenge.solution.done():
+                challenge.solution.set_result(solution)
+
+        challenge.loop.call_soon_threadsafe(resolve)
+        return True
+
+    def close(self, application_id: str):
+        with self._lock:
+            self._challenges.pop(application_id, None)
+
+
+captcha_relay = CaptchaRelay()
+
 
 async def detect_captcha(page: Page) -> Dict:
     """
@@ -150,18 +226,114 @@ async def wait_for_captcha_solution(page: Page, timeout: int = 300) -> Dict:
         }
 
 
-async def handle_captcha_if_present(page: Page, timeout: int = 300) -> Dict:
+async def capture_captcha_image(page: Page) -> Optional[bytes]:
+    """
+    Screenshot just the CAPTCHA element (falls back to the visible viewport)
+    """
+    for selector in CAPTCHA_IMAGE_SELECTORS:
+        try:
+            element = await page.query_selector(selector)
+            if element and await element.is_visible():
+                return await element.screenshot(type='png')
+        except:
+            continue
+    try:
+        return await page.screenshot(type='png')
+    except Exception as e:
+        logger.error(f"Could not capture CAPTCHA image: {str(e)}")
+        return None
+
+
+async def relay_captcha_solution(
+    page: Page,
+    application_id: str,
+    captcha_type: str,
+    submit_selector: Optional[str] = None,
+    timeout: int = 300,
+    max_attempts: int = 3,
+    on_challenge: Optional[Callable[[CaptchaChallenge], None]] = None
+) -> Dict:
+    """
+    Publish the CAPTCHA image through the relay, type the submitted answer
+    into the page and submit it. Retries with a fresh image if the portal
+    shows a CAPTCHA again (wrong answer).
+    
+    Returns:
+        Dict with 'success' and 'message' keys
+    """
+    try:
+        for attempt in range(1, max_attempts + 1):
+            image = await capture_captcha_image(page)
+            if not image:
+                return {"success": False, "message": "Could not capture CAPTCHA image"}
+            
+            challenge = captcha_relay.open(application_id, image, captcha_type, attempt)
+            logger.info(f"[{application_id}] CAPTCHA published to relay (attempt {attempt})")
+            if on_challenge:
+                on_challenge(challenge)
+            
+            try:
+                # The worker slot is free for other jobs while a human reads the image
+                async with scheduler.parked("captcha"):
+                    solution = await asyncio.wait_for(challenge.solution, timeout=timeout)
+            except asyncio.TimeoutError:
+                return {
+                    "success": False,
+                    "message": f"CAPTCHA solution timeout after {timeout} seconds"
+                }
+            
+            input_selector = None
+            for selector in CAPTCHA_INPUT_SELECTORS:
+                if await page.query_selector(selector):
+                    input_selector = selector
+                    break
+            if not input_selector:
+                return {"success": False, "message": "CAPTCHA input field not found"}
+            
+            await page.fill(input_selector, solution)
+            if submit_selector:
+                await page.click(submit_selector)
+            else:
+                await page.press(input_selector, 'Enter')
+            
+            # Solved when the personal information page shows up
+            try:
+                await page.wait_for_selector('input#MainContent_txtName', state='visible', timeout=30000)
+                return {"success": True, "message": "CAPTCHA solved via relay"}
+            except:
+                captcha_status = await detect_captcha(page)
+                if not captcha_status["present"]:
+                    return {"success": True, "message": "CAPTCHA solved via relay"}
+                logger.warning(f"[{application_id}] CAPTCHA answer rejected, requesting a new one")
+        
+        return {"success": False, "message": f"CAPTCHA not solved after {max_attempts} attempts"}
+        
+    finally:
+        captcha_relay.close(application_id)
+
+
+async def handle_captcha_if_present(
+    page: Page,
+    timeout: int = 300,
+    application_id: Optional[str] = None,
+    submit_selector: Optional[str] = None,
+    on_challenge: Optional[Callable[[CaptchaChallenge], None]] = None
+) -> Dict:
     """
     Detect and handle CAPTCHA if present
     
     This function:
     1. Detects if CAPTCHA is present
-    2. If present, waits for user to solve it manually
+    2. If present, relays it to the API for a human answer (when an
+       application_id is given) or waits for it to be solved in a visible browser
     3. Returns success/failure status
     
     Args:
         page: Playwright page object
         timeout: Maximum time to wait for solution (default 5 minutes)
+        application_id: Publish the CAPTCHA through the relay for this application
+        submit_selector: Button to click after typing a relayed answer
+        on_challenge: Called each time a new CAPTCHA image is published
     
     Returns:
         Dict with 'captcha_present', 'success', and 'message' keys
@@ -181,7 +353,14 @@ async def handle_captcha_if_present(page: Page, timeout: int = 300) -> Dict:
         logger.warning(f"CAPTCHA detected: {captcha_status['type']}")
         
         # Wait for user to solve it
-        solution_result = await wait_for_captcha_solution(page, timeout)
+        if application_id:
+            solution_result = await relay_captcha_solution(
+                page, application_id, captcha_status["type"], submit_selector, timeout,
+                on_challenge=on_challenge
+            )
+        else:
+            async with scheduler.parked("captcha"):
+                solution_result = await wait_for_captcha_solution(page, timeout)
         
         return {
             "captcha_present": True,
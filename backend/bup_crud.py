@@ -4,8 +4,11 @@ Database operations for BUP applications
 """
 
 from sqlalchemy.orm import Session
-from bup_models import BUPApplication, BUPJob, BUPDocument, BUPPayment
-from datetime import datetime
+from bup_models import BUPApplication, BUPJob, BUPDocument, BUPPayment, BUPCheckpoint
+from datetime import datetime, timedelta
+import status_events
+from status_cache import status_cache
+from queue_crud import QUEUED_MESSAGE
 
 
 def create_bup_application(db: Session, app_data: dict) -> BUPApplication:
@@ -22,6 +25,57 @@ def get_bup_application(db: Session, application_id: str) -> BUPApplication:
     return db.query(BUPApplication).filter(BUPApplication.id == application_id).first()
 
 
+def get_bup_application_status(db: Session, application_id: str) -> dict:
+    """Status projection for the status cache (None if the application doesn't exist)"""
+    row = db.query(
+        BUPApplication.job_status,
+        BUPApplication.current_stage,
+        BUPApplication.stage_message,
+        BUPApplication.admission_slip_path,
+        BUPApplication.receipt_path
+    ).filter(BUPApplication.id == application_id).first()
+    return dict(row._mapping) if row else None
+
+
+def get_bup_application_statuses(db: Session, application_ids: list, since: datetime = None) -> dict:
+    """Application id -> status projection with updated_at, for those changed since `since`"""
+    if not application_ids:
+        return {}
+    query = db.query(
+        BUPApplication.id,
+        BUPApplication.job_status,
+        BUPApplication.current_stage,
+        BUPApplication.stage_message,
+        BUPApplication.admission_slip_path,
+        BUPApplication.receipt_path,
+        BUPApplication.updated_at
+    ).filter(BUPApplication.id.in_(application_ids))
+    if since is not None:
+        query = query.filter(BUPApplication.updated_at >= since)
+    return {row.id: dict(row._mapping) for row in query.all()}
+
+
+def get_bup_applications_by_status(db: Session, job_statuses) -> list:
+    """BUP applications whose job_status is one of job_statuses"""
+    return db.query(BUPApplication).filter(BUPApplication.job_status.in_(job_statuses)).all()
+
+
+def get_bup_user_ids(db: Session, application_ids: list) -> dict:
+    """Application id -> user_id for those of the given applications that have one"""
+    if not application_ids:
+        return {}
+    rows = db.query(BUPApplication.id, BUPApplication.user_id).filter(
+        BUPApplication.id.in_(application_ids),
+        BUPApplication.user_id.isnot(None)
+    ).all()
+    return {app_id: user_id for app_id, user_id in rows}
+
+
+def get_bup_application_by_transaction(db: Session, transaction_id: str) -> BUPApplication:
+    """Get BUP application by payment transaction ID"""
+    return db.query(BUPApplication).filter(BUPApplication.transaction_id == transaction_id).first()
+
+
 def update_bup_job_id(db: Session, application_id: str, job_id: str):
     """Update job ID for application"""
     db.query(BUPApplication).filter(BUPApplication.id == application_id).update({
@@ -30,28 +84,45 @@ def update_bup_job_id(db: Session, application_id: str, job_id: str):
     db.commit()
 
 
+def mark_bup_application_queued(db: Session, application_id: str, job_id: str) -> dict:
+    """Point the application at job_id and mark it queued, without committing; returns the status fields set"""
+    fields = {"job_status": "queued", "current_stage": "queued", "stage_message": QUEUED_MESSAGE}
+    db.query(BUPApplication).filter(BUPApplication.id == application_id).update(
+        {**fields, "job_id": job_id, "updated_at": datetime.utcnow()}, synchronize_session=False
+    )
+    status_events.record(db, "bup", application_id, "stage", fields)
+    return fields
+
+
 def update_bup_application_status(db: Session, application_id: str, job_status: str, current_stage: str, stage_message: str):
     """Update application status"""
     db.query(BUPApplication).filter(BUPApplication.id == application_id).update({
         "job_status": job_status,
         "current_stage": current_stage,
         "stage_message": stage_message,
-        "updated_at": datetime.now()
+        "updated_at": datetime.utcnow()
+    })
+    status_events.record(db, "bup", application_id, "stage", {
+        "job_status": job_status, "current_stage": current_stage, "stage_message": stage_message
     })
     db.commit()
+    status_events.bus.notify()
+    status_cache.update("bup", application_id, job_status=job_status, current_stage=current_stage, stage_message=stage_message)
 
 
 def update_bup_payment_status(db: Session, application_id: str, payment_status: str, transaction_id: str = None):
     """Update payment status"""
     update_data = {
         "payment_status": payment_status,
-        "updated_at": datetime.now()
+        "updated_at": datetime.utcnow()
     }
     if transaction_id:
         update_data["transaction_id"] = transaction_id
     
     db.query(BUPApplication).filter(BUPApplication.id == application_id).update(update_data)
+    status_events.record(db, "bup", application_id, "payment", {"payment_status": payment_status})
     db.commit()
+    status_events.bus.notify()
 
 
 def save_bup_document(db: Session, application_id: str, doc_type: str, file_path: str):
@@ -59,11 +130,13 @@ def save_bup_document(db: Session, application_id: str, doc_type: str, file_path
     # Update application table
     if doc_type == "admission_slip":
         db.query(BUPApplication).filter(BUPApplication.id == application_id).update({
-            "admission_slip_path": file_path
+            "admission_slip_path": file_path,
+            "updated_at": datetime.utcnow()
         })
     elif doc_type == "receipt":
         db.query(BUPApplication).filter(BUPApplication.id == application_id).update({
-            "receipt_path": file_path
+            "receipt_path": file_path,
+            "updated_at": datetime.utcnow()
         })
     
     # Create document record
@@ -73,7 +146,11 @@ def save_bup_document(db: Session, application_id: str, doc_type: str, file_path
         file_path=file_path
     )
     db.add(doc)
+    status_events.record(db, "bup", application_id, "document", {"document_type": doc_type})
     db.commit()
+    status_events.bus.notify()
+    if doc_type in ("admission_slip", "receipt"):
+        status_cache.update("bup", application_id, **{f"{doc_type}_path": file_path})
 
 
 def create_bup_job(db: Session, job_data: dict) -> BUPJob:
@@ -125,3 +202,75 @@ def update_bup_payment(db: Session, transaction_id: str, update_data: dict):
     """Update payment record"""
     db.query(BUPPayment).filter(BUPPayment.transaction_id == transaction_id).update(update_data)
     db.commit()
+
+
+def get_bup_job(db: Session, job_id: str) -> BUPJob:
+    """Get BUP job by ID"""
+    return db.query(BUPJob).filter(BUPJob.id == job_id).first()
+
+
+def save_bup_job_snapshot(db: Session, job_id: str, storage_state: dict, paused_for: str):
+    """Store the paused browser session so the job can resume without a live browser"""
+    db.query(BUPJob).filter(BUPJob.id == job_id).update({
+        "status": "paused",
+        "storage_state": storage_state,
+        "browser_cookies": storage_state.get("cookies"),
+        "paused_for": paused_for,
+        "pause_timestamp": datetime.utcnow()
+    })
+    db.commit()
+
+
+
+def get_previous_bup_job(db: Session, application_id: str, job_id: str) -> BUPJob:
+    """Most recent earlier job for an application (the attempt a retry follows)"""
+    return db.query(BUPJob).filter(
+        BUPJob.application_id == application_id, BUPJob.id != job_id
+    ).order_by(BUPJob.created_at.desc()).first()
+
+
+def record_bup_stage(db: Session, job_id: str, stage: str, storage_state: dict = None):
+    """Mark a stage completed, with the session snapshot taken after it if any"""
+    job = db.query(BUPJob).filter(BUPJob.id == job_id).first()
+    if job:
+        job.stages_completed = (job.stages_completed or []) + [stage]
+        if storage_state is not None:
+            job.storage_state = storage_state
+            job.browser_cookies = storage_state.get("cookies")
+        db.commit()
+
+
+def save_bup_checkpoint(db: Session, application_id: str, job_id: str, stage: str, snapshot: dict):
+    """Store a resumable checkpoint"""
+    db.add(BUPCheckpoint(
+        application_id=application_id, job_id=job_id, stage=stage, snapshot=snapshot, created_at=datetime.utcnow()
+    ))
+    db.commit()
+
+
+def get_bup_checkpoints(db: Session, application_id: str, max_age_minutes: int):
+    """Checkpoints recent enough that the portal session may still be alive, newest first"""
+    cutoff = datetime.utcnow() - timedelta(minutes=max_age_minutes)
+    return db.query(BUPCheckpoint).filter(
+        BUPCheckpoint.application_id == application_id,
+        BUPCheckpoint.created_at >= cutoff
+    ).order_by(BUPCheckpoint.id.desc()).all()
+
+
+def was_bup_application_submitted(db: Session, application_id: str) -> bool:
+    """True if any job for the application got past submission"""
+    jobs = db.query(BUPJob).filter(BUPJob.application_id == application_id).all()
+    return any("submission" in (job.stages_completed or []) for job in jobs)
+
+
+def clear_bup_checkpoints(db: Session, application_id: str):
+    """Drop an application's checkpoints (they hold session cookies)"""
+    db.query(BUPCheckpoint).filter(BUPCheckpoint.application_id == application_id).delete()
+    db.commit()
+
+
+def bup_application_uses_image(db: Session, path: str) -> bool:
+    return db.query(BUPApplication.id).filter(
+        (BUPApplication.photo_path == path) | (BUPApplication.signature_path == path)
+    ).first() is not None
+
@@ -0,0 +1,263 @@
+"""
+BUP Address Gazetteer
+Local index of the BUP portal's division -> district -> thana dropdowns and
+their option values.
+
+Addresses are resolved against it when an application is submitted, so typos
+are rejected immediately instead of minutes into a run, and the RPA selects
+dropdown options by value. The index is filled from the portal itself: every
+run records the option lists it loads, and a maintenance job (see
+bup_tasks.refresh_gazetteer_async) walks the whole cascade when it is missing
+or stale.
+"""
+
+import difflib
+import json
+import logging
+import os
+import re
+import time
+from threading import Lock
+from typing import Dict, List, Optional, Tuple
+from config import get_settings
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# Official spelling changes and common alternates, mapped to one key
+SPELLING_VARIANTS = {
+    'chattogram': 'chittagong',
+    'chattagram': 'chittagong',
+    'barishal': 'barisal',
+    'cumilla': 'comilla',
+    'jashore': 'jessore',
+    'bogura': 'bogra',
+    'jhalokathi': 'jhalokati',
+    'moulvibazar': 'maulvibazar',
+    'netrokona': 'netrakona',
+    'chapainawabganj': 'nawabganj',
+}
+
+# Words that don't distinguish one place from another
+FILLER_WORDS = {'division', 'district', 'zila', 'zilla', 'thana', 'upazila', 'upazilla', 'ps'}
+
+PLACEHOLDER = re.compile(r'^\s*(--|select|choose)', re.IGNORECASE)
+
+LEVELS = ('division', 'district', 'thana')
+
+
+def normalize(text: str) -> str:
+    """Comparison key: lowercase letters/digits only, filler words dropped, spelling variants unified"""
+    tokens = [t for t in re.sub(r'[^a-z0-9]+', ' ', (text or '').lower()).split() if t not in FILLER_WORDS]
+    key = ''.join(SPELLING_VARIANTS.get(t, t) for t in tokens)
+    return SPELLING_VARIANTS.get(key, key)
+
+
+def real_options(options: Dict[str, str]) -> Dict[str, str]:
+    """Drop placeholder entries like '-- Select District --'"""
+    return {
+        value: label for value, label in options.items()
+        if value not in ('', '0', '-1') and label and not PLACEHOLDER.match(label)
+    }
+
+
+def match_option(query: str, options: Dict[str, str]) -> Tuple[Optional[Tuple[str, str]], List[str]]:
+    """
+    Find the option for free text
+    Returns ((value, label), []) on a confident match, else (None, suggested labels)
+    """
+    options = real_options(options)
+    key = normalize(query)
+    if not key:
+        return None, []
+
+    for value, label in options.items():
+        if normalize(label) == key:
+            return (value, label), []
+
+    scored = sorted(
+        (
+            (difflib.SequenceMatcher(None, key, normalize(label)).ratio(), value, label)
+            for value, label in options.items()
+        ),
+        reverse=True
+    )
+    if not scored:
+        return None, []
+
+    best_score, best_value, best_label = scored[0]
+    runner_up = scored[1][0] if len(scored) > 1 else 0.0
+    if best_score >= settings.bup_gazetteer_cutoff and best_score - runner_up >= 0.05:
+        return (best_value, best_label), []
+
+    return None, [label for score, _, label in scored[:3] if score >= 0.5]
+
+
+class Gazetteer:
+    """
+    Division/district/thana index persisted as JSON
+
+    {"updated_at": ..., "divisions": {value: {"label": ..., "districts":
+        {value: {"label": ..., "thanas": {value: label}}}}}}
+
+    Read from API handlers and written from the automation loop, so access is locked.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or settings.bup_gazetteer_path
+        self._data: Optional[Dict] = None
+        self._mtime: Optional[float] = None  # Of the file when it was last read or written
+        self._lock = Lock()
+
+    def _file_mtime(self) -> Optional[float]:
+        try:
+            return os.path.getmtime(self.path)
+        except OSError:
+            return None
+
+    def _load(self) -> Dict:
+        # Re-read when another process (e.g. the refresh job of another worker) replaced the file
+        mtime = self._file_mtime()
+        if self._data is not None and mtime is not None and (self._mtime is None or mtime > self._mtime):
+            self._data = None
+        if self._data is None:
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self._data = json.load(f)
+            except FileNotFoundError:
+                self._data = {"updated_at": None, "divisions": {}}
+            except Exception as e:
+                logger.warning(f"Could not read BUP gazetteer, starting empty: {str(e)}")
+                self._data = {"updated_at": None, "divisions": {}}
+            self._mtime = mtime
+        return self._data
+
+    def save(self):
+        with self._lock:
+            # Write what this process merged, even if the file changed since
+            data = self._data if self._data is not None else self._load()
+            data["updated_at"] = time.time()
+            try:
+                os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+                tmp_path = f"{self.path}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(data, f, indent=2, sort_keys=True, ensure_ascii=False)
+                os.replace(tmp_path, self.path)
+                self._mtime = self._file_mtime()
+            except Exception as e:
+                logger.warning(f"Could not write BUP gazetteer: {str(e)}")
+
+    def is_empty(self) -> bool:
+        with self._lock:
+            return not self._load()["divisions"]
+
+    def needs_refresh(self) -> bool:
+        """True if nothing is indexed or the last full refresh is older than the max age"""
+        with self._lock:
+            data = self._load()
+            refreshed_at = data.get("refreshed_at")
+        if not data["divisions"] or not refreshed_at:
+            return True
+        return time.time() - refreshed_at > settings.bup_gazetteer_max_age_days * 86400
+
+    def mark_refreshed(self):
+        with self._lock:
+            self._load()["refreshed_at"] = time.time()
+        self.save()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            data = self._load()
+            districts = [d for div in data["divisions"].values() for d in div.get("districts", {}).values()]
+            return {
+                "divisions": len(data["divisions"]),
+                "districts": len(districts),
+                "thanas": sum(len(d.get("thanas", {})) for d in districts),
+                "updated_at": data.get("updated_at"),
+                "refreshed_at": data.get("refreshed_at")
+            }
+
+    def record_divisions(self, options: Dict[str, str]) -> bool:
+        """Merge the division dropdown; returns True if anything changed"""
+        with self._lock:
+            return self._merge(self._load()["divisions"], real_options(options), "districts")
+
+    def record_districts(self, division_value: str, options: Dict[str, str]) -> bool:
+        with self._lock:
+            division = self._load()["divisions"].get(division_value)
+            if division is None:
+                return False
+            return self._merge(division.setdefault("districts", {}), real_options(options), "thanas")
+
+    def record_thanas(self, division_value: str, district_value: str, options: Dict[str, str]) -> bool:
+        with self._lock:
+            district = self._load()["divisions"].get(division_value, {}).get("districts", {}).get(district_value)
+            if district is None:
+                return False
+            thanas = real_options(options)
+            if district.get("thanas") == thanas:
+                return False
+            district["thanas"] = thanas
+            return True
+
+    def _merge(self, level: Dict, options: Dict[str, str], child_key: str) -> bool:
+        """Replace a level's options, keeping the already indexed children of values still offered"""
+        current = {value: entry["label"] for value, entry in level.items()}
+        if current == options:
+            return False
+        for value in list(level):
+            if value not in options:
+                del level[value]
+        for value, label in options.items():
+            entry = level.setdefault(value, {child_key: {}})
+            entry["label"] = label
+        return True
+
+    def resolve(self, division: str, district: str, thana: str) -> Dict:
+        """
+        Resolve free-text address parts to portal labels and option values
+
+        Levels that are not indexed yet keep the given text (value None) and are
+        matched on the portal during the run.
+        """
+        result = {
+            "success": True,
+            "message": "Address resolved",
+            "field": None,
+            "suggestions": [],
+            "division": division,
+            "district": district,
+            "thana": thana,
+            "values": {"division": None, "district": None, "thana": None}
+        }
+
+        with self._lock:
+            level_options = self._load()["divisions"]
+            levels = (("division", division, "districts"), ("district", district, "thanas"), ("thana", thana, None))
+            for field, query, child_key in levels:
+                if not level_options:
+                    break
+                labels = {
+                    value: (entry if isinstance(entry, str) else entry["label"])
+                    for value, entry in level_options.items()
+                }
+                matched, suggestions = match_option(query, labels)
+                if not matched:
+                    hint = f" Did you mean: {', '.join(suggestions)}?" if suggestions else ""
+                    result.update({
+                        "success": False,
+                        "message": f"Unknown {field} '{query}'.{hint}",
+                        "field": field,
+                        "suggestions": suggestions
+                    })
+                    return result
+
+                value, label = matched
+                result[field] = label
+                result["values"][field] = value
+                level_options = level_options[value].get(child_key, {}) if child_key else {}
+
+        return result
+
+
+gazetteer = Gazetteer()
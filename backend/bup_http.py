@@ -0,0 +1,548 @@
+"""
+BUP Admission HTTP Automation
+Browserless driver for the BUP ASP.NET WebForms portal
+
+Replays the portal's postbacks with httpx (see webforms.py) instead of
+rendering every page in Chromium, so one process can drive many applications
+at once. A browser is only borrowed from the pool for a CAPTCHA or for a page
+the driver does not recognize: the current page is handed to Playwright, the
+step runs there, and the session is taken back over HTTP afterwards.
+"""
+
+import sys
+import asyncio
+
+# Fix for Windows Playwright async issue
+if sys.platform == 'win32':
+    asyncio.set_event_loop_policy(asyncio.WindowsProactorEventLoopPolicy())
+
+import os
+import re
+import logging
+from typing import Callable, Dict, Optional
+from urllib.parse import urlparse
+import httpx
+from config import get_settings
+from bup_rpa import BUPAutomation, BOARD_MAPPING, EXAM_TYPE_MAPPING
+from bup_gazetteer import gazetteer, match_option, real_options
+from bup_waits import WaitRecorder
+from request_filter import RequestStats
+from webforms import WebFormsClient, UnknownPage, POSTBACK_CALL
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+PROGRAM_PATH = '/Admission/Candidate/SelectProgramV3?ecat=4'
+
+
+def create_bup_automation(snapshot: Optional[Dict] = None):
+    """BUP automation for the configured driver (or the driver a snapshot was taken with)"""
+    driver = snapshot.get("driver") if snapshot else settings.bup_driver
+    if driver == "http":
+        return BUPHttpAutomation()
+    return BUPAutomation()
+
+
+def page_has_captcha(page) -> bool:
+    """Same indicators detect_captcha() looks for in a browser"""
+    if any('captcha' in (img["src"] + img["id"]).lower() for img in page.images):
+        return True
+    if any('recaptcha' in (c.attrs.get('src') or '') for c in page.controls):
+        return True
+    if 'recaptcha' in page.html.lower():
+        return True
+    return any('captcha' in ((c.name or '') + (c.id or '')).lower() for c in page.controls)
+
+
+def page_error(page) -> Optional[str]:
+    """The portal's validation message (span.text-danger), if the page shows one"""
+    if page is None:
+        return None
+    return next((text for cls, text in page.spans if 'text-danger' in cls.split() and text), None)
+
+
+class BUPHttpAutomation:
+    """HTTP automation for BUP admission process (same interface as BUPAutomation)"""
+
+    def __init__(self, transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.transport = transport
+        self.waits = WaitRecorder()
+        self.request_stats = RequestStats("bup")
+        self.client: Optional[WebFormsClient] = None
+        self.browser: Optional[BUPAutomation] = None  # only while a step runs in Playwright
+        self.preloaded_url: Optional[str] = None
+
+    async def initialize(self):
+        """Open an HTTP session"""
+        self.client = WebFormsClient(transport=self.transport, recorder=self.waits)
+        logger.info("BUP HTTP automation session initialized")
+
+    async def preload(self):
+        """Fetch the program list ahead of time (prewarm)"""
+        url = f"{settings.bup_base_url}{PROGRAM_PATH}"
+        await self.client.get(url, "program_page")
+        self.preloaded_url = url
+
+    async def snapshot(self) -> Dict:
+        """Cookies and the current page, so the session can be restored without re-navigating"""
+        if self.browser:
+            await self._take_back()
+        return {
+            "driver": "http",
+            "cookies": self.client.cookies(),
+            "origins": [],
+            "url": self.client.page.url,
+            "html": self.client.page.html
+        }
+
+    async def restore(self, snapshot: Dict):
+        """Restore a paused session from a snapshot (taken by either driver)"""
+        await self.initialize()
+        self.client.set_cookies(snapshot.get("cookies", []))
+        if snapshot.get("html"):
+            self.client.load(snapshot["url"], snapshot["html"])
+        else:
+            await self.client.get(snapshot["url"], "restore")
+        logger.info(f"BUP HTTP session restored at {snapshot['url']}")
+
+    async def probe(self, url: str) -> bool:
+        """True if the portal still serves `url` to this session instead of sending it back to the start"""
+        try:
+            response = await self.client.fetch(url, name="session_probe")
+            return response.status_code == 200 and urlparse(str(response.url)).path == urlparse(url).path
+        except Exception as e:
+            logger.warning(f"Session probe failed: {str(e)}")
+            return False
+
+    async def close(self):
+        """Close the HTTP session (and a borrowed browser, if any)"""
+        try:
+            self._update_request_stats()
+            logger.info(f"HTTP driver requests: {self.request_stats.summary()}")
+            if self.browser:
+                await self.browser.close()
+                self.browser = None
+            if self.client:
+                await self.client.close()
+                self.client = None
+            logger.info("BUP HTTP automation session closed")
+        except Exception as e:
+            logger.error(f"HTTP session close error: {str(e)}")
+
+    # ------------------------------------------------------------------
+    # Steps (same names, arguments and results as BUPAutomation)
+    # ------------------------------------------------------------------
+
+    async def navigate_and_select_faculty(self, faculty: str) -> Dict:
+        return await self._run("navigate_and_select_faculty", self._navigate_and_select_faculty, faculty)
+
+    async def select_education_type_ssc_hsc(self) -> Dict:
+        return await self._run("select_education_type_ssc_hsc", self._select_education_type_ssc_hsc)
+
+    async def fill_ssc_information(self, ssc_data: Dict) -> Dict:
+        return await self._run("fill_ssc_information", self._fill_exam_information, "SSC", {
+            "examination": ssc_data['ssc_examination'],
+            "roll": ssc_data['ssc_roll'],
+            "registration": ssc_data['ssc_registration'],
+            "passing_year": ssc_data['ssc_passing_year'],
+            "board": ssc_data['ssc_board']
+        })
+
+    async def fill_hsc_information(self, hsc_data: Dict) -> Dict:
+        return await self._run("fill_hsc_information", self._fill_exam_information, "HSC", {
+            "examination": hsc_data['hsc_examination'],
+            "roll": hsc_data['hsc_roll'],
+            "registration": hsc_data['hsc_registration'],
+            "passing_year": hsc_data['hsc_passing_year'],
+            "board": hsc_data['hsc_board']
+        })
+
+    async def click_verify_information(
+        self,
+        application_id: Optional[str] = None,
+        on_captcha: Optional[Callable] = None
+    ) -> Dict:
+        return await self._run(
+            "click_verify_information", self._click_verify_information, application_id, on_captcha
+        )
+
+    async def fill_personal_information(self, personal_data: Dict) -> Dict:
+        return await self._run("fill_personal_information", self._fill_personal_information, personal_data)
+
+    async def harvest_address_options(self, prefix: str = 'Permanent') -> Dict:
+        return await self._run("harvest_address_options", self._harvest_address_options, prefix)
+
+    async def fill_present_address(self, address_data: Dict) -> Dict:
+        return await self._run("fill_present_address", self._fill_present_address, address_data)
+
+    async def handle_permanent_address(self, address_data: Dict, same_as_present: bool = False) -> Dict:
+        return await self._run(
+            "handle_permanent_address", self._handle_permanent_address, address_data, same_as_present
+        )
+
+    async def upload_photo(self, photo_path: str) -> Dict:
+        return await self._run("upload_photo", self._upload_file, 0, photo_path, "Photo")
+
+    async def upload_signature(self, signature_path: str) -> Dict:
+        return await self._run("upload_signature", self._upload_file, 1, signature_path, "Signature")
+
+    async def submit_application(self) -> Dict:
+        return await self._run("submit_application", self._submit_application)
+
+    async def get_payment_info(self) -> Dict:
+        return await self._run("get_payment_info", self._get_payment_info)
+
+    async def download_documents(self, application_id: str) -> Dict:
+        return await self._run("download_documents", self._download_documents, application_id)
+
+    # ------------------------------------------------------------------
+    # HTTP implementations
+    # ------------------------------------------------------------------
+
+    async def _navigate_and_select_faculty(self, faculty: str) -> Dict:
+        logger.info(f"Loading BUP program list over HTTP and selecting: {faculty}")
+        url = f"{settings.bup_base_url}{PROGRAM_PATH}"
+        if self.preloaded_url == url and self.client.page is not None:
+            page = self.client.page
+        else:
+            page = await self.client.get(url, "program_page")
+        self.preloaded_url = None
+
+        # Program names are in span.fw-medium, in the same order as the
+        # MainContent_lvAdmSetup_CheckBox1_{i} checkboxes
+        programs = [text for cls, text in page.spans if 'fw-medium' in cls.split()]
+        if not programs:
+            raise UnknownPage("Program list not found")
+        index = next((i for i, text in enumerate(programs) if faculty.lower() in text.lower()), None)
+        if index is None:
+            raise Exception(f"Program not found: {faculty}")
+
+        checkbox_id = f'MainContent_lvAdmSetup_CheckBox1_{index}'
+        logger.info(f"Found program at index {index}: {programs[index]}")
+        self.client.check(checkbox_id)
+        if self.client.page.require(checkbox_id).postback_target:
+            await self.client.postback(checkbox_id, name="program_checkbox_postback")
+
+        await self.client.click('MainContent_btnApply1', name="apply_postback")
+        logger.info(f"Applied, now at {self.client.page.url}")
+        return {"success": True, "message": f"Selected faculty: {faculty}"}
+
+    async def _select_education_type_ssc_hsc(self) -> Dict:
+        await self.client.click('MainContent_btnSSCHSC', name="ssc_hsc_postback")
+        self.client.page.require('MainContent_ddlExamTypeSSC')
+        return {"success": True, "message": "Selected SSC/HSC education type"}
+
+    async def _fill_exam_information(self, level: str, data: Dict) -> Dict:
+        logger.info(f"Filling {level} information over HTTP...")
+        exam_value = EXAM_TYPE_MAPPING.get(data['examination'].upper(), level.lower())
+        await self._select(f'MainContent_ddlExamType{level}', exam_value, f"{level.lower()}_exam_postback")
+
+        self.client.set(f'MainContent_txtRoll{level}', data['roll'])
+        self.client.set(f'MainContent_txtReg{level}', data['registration'])
+        await self._select(f'MainContent_ddlPassYear{level}', str(data['passing_year']), f"{level.lower()}_year_postback")
+
+        board_value = BOARD_MAPPING.get(data['board'].upper(), '6')
+        await self._select(f'MainContent_ddlBoard{level}', board_value, f"{level.lower()}_board_postback")
+        logger.info(f"{level} information set (board value: {board_value})")
+        return {"success": True, "message": f"{level} information filled successfully"}
+
+    async def _click_verify_information(self, application_id: Optional[str], on_captcha: Optional[Callable]) -> Dict:
+        logger.info("Verifying information over HTTP...")
+        await self.client.click('MainContent_btnVerifyInformation', name="verify_postback")
+
+        if page_has_captcha(self.client.page):
+            logger.warning("CAPTCHA on verification page, borrowing a browser to solve it")
+            from bup_captcha import handle_captcha_if_present
+            await self._hand_off()
+            captcha_result = await handle_captcha_if_present(
+                self.browser.page,
+                timeout=settings.bup_captcha_timeout,
+                application_id=application_id,
+                submit_selector='input#MainContent_btnVerifyInformation',
+                on_challenge=on_captcha
+            )
+            if not captcha_result["success"]:
+                await self.browser.close()
+                self.browser = None
+                return {
+                    "success": False,
+                    "captcha_required": True,
+                    "message": f"CAPTCHA solution required: {captcha_result['message']}"
+                }
+            await self._take_back()
+            try:
+                self.client.page.require('MainContent_txtName')
+            except UnknownPage as e:
+                # Verify was already submitted from the browser; never submit it again in a fresh one
+                raise Exception(page_error(self.client.page) or f"Unexpected page after CAPTCHA: {str(e)}")
+
+        self.client.page.require('MainContent_txtName')
+        return {"success": True, "message": "Information verified successfully"}
+
+    async def _fill_personal_information(self, personal_data: Dict) -> Dict:
+        page = self.client.page
+        logger.info(f"Candidate Name (pre-filled): {page.require('MainContent_txtName').value}")
+
+        year, month, day = str(personal_data['date_of_birth']).split('-')
+        await self._select('MainContent_ddlDay', day, "dob_day_postback")
+        await self._select('MainContent_ddlMonth', month, "dob_month_postback")
+        await self._select('MainContent_ddlYear', year, "dob_year_postback")
+
+        self.client.set('MainContent_txtEmail', personal_data['email'])
+        gender_val = '2' if personal_data['gender'].upper() == 'MALE' else '3'
+        self.client.set('MainContent_ddlGender', gender_val)
+        self.client.set('MainContent_txtSmsMobile', personal_data['mobile_number'])
+        self.client.set('MainContent_txtGuardianMobile', personal_data.get('guardian_mobile', personal_data['mobile_number']))
+
+        nationality = self.client.page.control('MainContent_ddlNationality')
+        if nationality:
+            for value, text in self.client.page.options('MainContent_ddlNationality').items():
+                if text == 'Bangladeshi':
+                    self.client.set('MainContent_ddlNationality', value)
+        return {"success": True, "message": "Personal information filled"}
+
+    async def _harvest_address_options(self, prefix: str) -> Dict:
+        logger.info("Refreshing BUP address gazetteer over HTTP...")
+        division_id = f'MainContent_ddl{prefix}Division'
+        district_id = f'MainContent_ddl{prefix}District'
+        thana_id = f'MainContent_ddl{prefix}Thana'
+
+        divisions = real_options(self.client.page.options(division_id))
+        gazetteer.record_divisions(divisions)
+        for division_value in divisions:
+            await self._select(division_id, division_value, "gazetteer_districts")
+            districts = real_options(self.client.page.options(district_id))
+            gazetteer.record_districts(division_value, districts)
+            for district_value in districts:
+                await self._select(district_id, district_value, "gazetteer_thanas")
+                gazetteer.record_thanas(division_value, district_value, self.client.page.options(thana_id))
+
+        gazetteer.mark_refreshed()
+        stats = gazetteer.stats()
+        logger.info(f"Gazetteer refreshed: {stats}")
+        return {"success": True, "message": "Gazetteer refreshed", "stats": stats}
+
+    async def _fill_address_dropdowns(self, prefix: str, division: str, district: str, thana: str):
+        division_id = f'MainContent_ddl{prefix}Division'
+        district_id = f'MainContent_ddl{prefix}District'
+        thana_id = f'MainContent_ddl{prefix}Thana'
+        resolved = gazetteer.resolve(division, district, thana)
+        values = resolved["values"]
+        changed = gazetteer.record_divisions(self.client.page.options(division_id))
+
+        division_value = await self._choose(division_id, "division", resolved["division"], values["division"])
+        changed |= gazetteer.record_districts(division_value, self.client.page.options(district_id))
+        district_value = await self._choose(district_id, "district", resolved["district"], values["district"])
+
+        if self.client.page.has(thana_id):
+            changed |= gazetteer.record_thanas(division_value, district_value, self.client.page.options(thana_id))
+            await self._choose(thana_id, "thana", resolved["thana"], values["thana"])
+        else:
+            self.client.set(f'MainContent_txt{prefix}Thana', thana)
+
+        if changed:
+            gazetteer.save()
+
+    async def _fill_present_address(self, address_data: Dict) -> Dict:
+        await self._fill_address_dropdowns(
+            'Present', address_data['present_division'], address_data['present_district'], address_data['present_thana']
+        )
+        if address_data.get('present_post_office'):
+            self.client.set('MainContent_txtPresentPostOffice', address_data['present_post_office'])
+        self.client.set('MainContent_txtPresentVillage', address_data['present_village'])
+        if address_data.get('present_zip'):
+            self.client.set('MainContent_txtPresentZIP', address_data['present_zip'])
+        return {"success": True, "message": "Present address filled successfully"}
+
+    async def _handle_permanent_address(self, address_data: Dict, same_as_present: bool) -> Dict:
+        if same_as_present:
+            checkboxes = self.client.page.find_controls('checkbox', 'Same')
+            if checkboxes:
+                self.client.check(checkboxes[0].id)
+                if checkboxes[0].postback_target:
+                    await self.client.postback(checkboxes[0].id, name="same_as_present_postback")
+                return {"success": True, "message": "Permanent address set to same as present"}
+            logger.warning("Same as present checkbox not found, filling permanent address manually")
+
+        await self._fill_address_dropdowns(
+            'Permanent',
+            address_data.get('permanent_division') or address_data['present_division'],
+            address_data.get('permanent_district') or address_data['present_district'],
+            address_data.get('permanent_thana') or address_data['present_thana']
+        )
+        if address_data.get('permanent_post_office') or address_data.get('present_post_office'):
+            self.client.set('MainContent_txtPermanentPostOffice',
+                            address_data.get('permanent_post_office', address_data.get('present_post_office', '')))
+        self.client.set('MainContent_txtPermanentVillage',
+                        address_data.get('permanent_village', address_data['present_village']))
+        if address_data.get('permanent_zip') or address_data.get('present_zip'):
+            self.client.set('MainContent_txtPermanentZIP',
+                            address_data.get('permanent_zip', address_data.get('present_zip', '')))
+        return {"success": True, "message": "Permanent address filled successfully"}
+
+    async def _upload_file(self, index: int, path: str, label: str) -> Dict:
+        file_inputs = self.client.page.find_controls('file')
+        if len(file_inputs) <= index:
+            raise UnknownPage(f"{label} upload input not found")
+        file_input = file_inputs[index]
+        self.client.attach(file_input.id or file_input.name, path)
+        # Inputs wired to a postback upload now; others go with the final submit
+        if file_input.postback_target:
+            await self.client.postback(file_input.id or file_input.name, name=f"{label.lower()}_upload_postback")
+        logger.info(f"{label} attached: {path}")
+        return {"success": True, "message": f"{label} uploaded successfully"}
+
+    async def _submit_application(self) -> Dict:
+        buttons = [
+            c for c in self.client.page.find_controls('submit')
+            if 'submit' in (c.value or '').lower()
+        ]
+        if not buttons:
+            raise UnknownPage("Submit button not found")
+        await self.client.click(buttons[0].id or buttons[0].name, name="submit_postback")
+        return {"success": True, "message": "Application submitted successfully"}
+
+    async def _get_payment_info(self) -> Dict:
+        payment_amount = 1000.00  # Default BUP fee
+        amount_match = re.search(r'(?:BDT|Tk|Amount)[^\d]{0,20}(\d+(?:\.\d{2})?)', self.client.page.text)
+        if amount_match:
+            payment_amount = float(amount_match.group(1))
+        return {
+            "success": True,
+            "payment_required": True,
+            "payment_url": self.client.page.url,
+            "amount": payment_amount,
+            "message": "Payment information extracted"
+        }
+
+    async def _download_documents(self, application_id: str) -> Dict:
+        docs_dir = "./uploads/docs"
+        os.makedirs(docs_dir, exist_ok=True)
+
+        admission_slip_path = await self._download_link(
+            ("Admission Slip", "Download"), os.path.join(docs_dir, f"{application_id}_admission_slip.pdf")
+        )
+        receipt_path = await self._download_link(
+            ("Receipt",), os.path.join(docs_dir, f"{application_id}_receipt.pdf")
+        )
+
+        if admission_slip_path or receipt_path:
+            return {
+                "success": True,
+                "admission_slip_path": admission_slip_path,
+                "receipt_path": receipt_path,
+                "message": "Documents downloaded"
+            }
+        return {"success": False, "message": "Could not find download links"}
+
+    # ------------------------------------------------------------------
+    # Helpers
+    # ------------------------------------------------------------------
+
+    async def _select(self, select_id: str, value: str, name: str):
+        """Set a dropdown and replay its AutoPostBack, if it has one"""
+        control = self.client.page.require(select_id)
+        if value not in self.client.page.options(select_id):
+            raise Exception(f"Option {value} not offered by {select_id}")
+        self.client.set(select_id, value)
+        if control.postback_target:
+            await self.client.postback(select_id, name=name)
+
+    async def _choose(self, select_id: str, field: str, query: str, indexed_value: Optional[str]) -> str:
+        """Select by the gazetteer's value if still offered, otherwise by the best match"""
+        options = self.client.page.options(select_id)
+        if indexed_value and indexed_value in options:
+            value = indexed_value
+        else:
+            matched, suggestions = match_option(query, options)
+            if not matched:
+                hint = f" (did you mean: {', '.join(suggestions)})" if suggestions else ""
+                raise Exception(f"No {field} option matches '{query}'{hint}")
+            value = matched[0]
+        await self._select(select_id, value, f"{select_id}_postback")
+        logger.info(f"Selected {field}: {options[value]} (value: {value})")
+        return value
+
+    async def _download_link(self, texts, path: str) -> Optional[str]:
+        link = next(
+            (l for l in self.client.page.links if any(t.lower() in l["text"].lower() for t in texts)),
+            None
+        )
+        if not link:
+            logger.warning(f"{texts[0]} link not found")
+            return None
+        try:
+            postback = POSTBACK_CALL.search(link["href"])
+            if postback:
+                current = self.client.page
+                response = await self.client.postback(postback.group(1), postback.group(2), name="download_postback")
+                self.client.page = current
+            else:
+                response = await self.client.fetch(link["href"], name="download")
+            if response.status_code != 200 or 'html' in response.headers.get('content-type', ''):
+                logger.warning(f"{texts[0]} download did not return a document")
+                return None
+            with open(path, 'wb') as f:
+                f.write(response.content)
+            logger.info(f"{texts[0]} downloaded: {path}")
+            return path
+        except Exception as e:
+            logger.warning(f"{texts[0]} download failed: {str(e)}")
+            return None
+
+    async def _run(self, step: str, http_step, *args) -> Dict:
+        """
+        Run a step over HTTP; on an unrecognized page, run the same step in a
+        browser from the current page and then continue over HTTP. A page
+        showing a portal validation message fails the step instead, since the
+        browser would only be rejected the same way.
+        """
+        try:
+            if self.browser is None:
+                try:
+                    return await http_step(*args)
+                except UnknownPage as e:
+                    error = page_error(self.client.page)
+                    if error:
+                        raise Exception(error)
+                    logger.warning(f"HTTP driver cannot handle {step} ({str(e)}), falling back to Playwright")
+                    await self._hand_off()
+            result = await getattr(self.browser, step)(*args)
+            await self._take_back()
+            return result
+        except Exception as e:
+            logger.error(f"{step} error: {str(e)}")
+            if self.browser:
+                # The browser's page can't be trusted after a failure; later steps start over HTTP
+                await self.browser.close()
+                self.browser = None
+            return {"success": False, "message": f"{step.replace('_', ' ').capitalize()} failed: {str(e)}"}
+        finally:
+            self._update_request_stats()
+
+    async def _hand_off(self):
+        """Open the current page, exactly as the server last rendered it, in a pooled browser"""
+        self.browser = BUPAutomation()
+        await self.browser.initialize()
+        page = self.client.page
+        if page is None:
+            return
+        await self.browser.context.add_cookies(self.client.cookies())
+        await self.browser.open_page(page.url, page.html)
+
+    async def _take_back(self):
+        """Continue over HTTP from the browser's current page and release the browser"""
+        if not self.browser:
+            return
+        html = await self.browser.page.content()
+        url = self.browser.page.url
+        self.client.set_cookies(await self.browser.context.cookies())
+        self.client.load(url, html)
+        await self.browser.close()
+        self.browser = None
+        logger.info(f"Continuing over HTTP from {url}")
+
+    def _update_request_stats(self):
+        if self.client:
+            self.request_stats.requests = self.client.requests
+            self.request_stats.bytes_received = self.client.bytes_received
@@ -173,3 +173,17 @@ class BUPPayment(Base):
     # Timestamps
     initiated_at = Column(DateTime, server_default=func.now())
     completed_at = Column(DateTime, nullable=True)
+
+
+class BUPCheckpoint(Base):
+    """Session snapshot taken after a BUP stage the portal keeps server-side"""
+    __tablename__ = "bup_checkpoints"
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    application_id = Column(String(50), nullable=False, index=True)
+    job_id = Column(String(50), nullable=False)
+    
+    stage = Column(String(50), nullable=False)  # faculty, verification, submission
+    snapshot = Column(JSON, nullable=False)  # cookies, url and page HTML
+    
+    created_at = Column(DateTime, server_default=func.now())
@@ -4,11 +4,12 @@ Image processing utilities for BUP admission requirements
 """
 
 from PIL import Image
-import io
 import os
+from typing import Union
+from photo_utils import load_image, write_file, encode_jpeg, BUP_PHOTO, BUP_SIGNATURE, REDUCING_GAP
 
 
-def process_bup_photo(input_path: str, output_path: str):
+def process_bup_photo(source: Union[str, bytes], output_path: str):
     """
     Process candidate photo to meet BUP requirements:
     - Dimensions: 300x300 pixels
@@ -18,38 +19,29 @@ def process_bup_photo(input_path: str, output_path: str):
     Returns: (success: bool, message: str, file_size: int)
     """
     try:
-        # Open and validate image
-        img = Image.open(input_path)
-        
-        # Convert to RGB (remove alpha channel if present)
-        if img.mode != 'RGB':
-            img = img.convert('RGB')
+        # Open and validate image, decoded near the target size, upright, in RGB
+        img = load_image(source, (BUP_PHOTO.width, BUP_PHOTO.height))
         
         # Resize to exact dimensions (300x300)
-        img = img.resize((300, 300), Image.Resampling.LANCZOS)
-        
-        # Compress to meet size requirement (100 KB)
-        quality = 95
-        while quality >= 50:
-            buffer = io.BytesIO()
-            img.save(buffer, format='JPEG', quality=quality, optimize=True)
-            size = buffer.tell()
-            
-            if size <= 100 * 1024:  # 100 KB
-                # Save final image
-                with open(output_path, 'wb') as f:
-                    f.write(buffer.getvalue())
-                return True, f"Photo processed successfully ({size/1024:.1f} KB, 300x300px)", size
-            
-            quality -= 5
-        
-        return False, "Could not compress photo to under 100KB while maintaining quality", 0
+        img = img.resize((BUP_PHOTO.width, BUP_PHOTO.height), Image.Resampling.LANCZOS, reducing_gap=REDUCING_GAP)
+        
+        # Compress to meet size requirement (100 KB), highest quality that fits
+        result = encode_jpeg(img, BUP_PHOTO)
+        if result.data is None:
+            return False, "Could not compress photo to under 100KB while maintaining quality", 0
+        
+        # Save final image
+        write_file(output_path, result.data)
+        return True, (
+            f"Photo processed successfully ({result.size/1024:.1f} KB, 300x300px, "
+            f"quality {result.quality}, encodes: {result.passes})"
+        ), result.size
         
     except Exception as e:
         return False, f"Photo processing error: {str(e)}", 0
 
 
-def process_bup_signature(input_path: str, output_path: str):
+def process_bup_signature(source: Union[str, bytes], output_path: str):
     """
     Process signature to meet BUP requirements:
     - Dimensions: 300x80 pixels
@@ -59,30 +51,23 @@ def process_bup_signature(input_path: str, output_path: str):
     Returns: (success: bool, message: str, file_size: int)
     """
     try:
-        img = Image.open(input_path)
-        
-        # Convert to RGB
-        if img.mode != 'RGB':
-            img = img.convert('RGB')
+        img = load_image(source, (BUP_SIGNATURE.width, BUP_SIGNATURE.height))
         
         # Resize to 300x80 (may distort if aspect ratio very different)
-        img = img.resize((300, 80), Image.Resampling.LANCZOS)
-        
-        # Compress to meet size requirement (60 KB)
-        quality = 95
-        while quality >= 50:
-            buffer = io.BytesIO()
-            img.save(buffer, format='JPEG', quality=quality, optimize=True)
-            size = buffer.tell()
-            
-            if size <= 60 * 1024:  # 60 KB
-                with open(output_path, 'wb') as f:
-                    f.write(buffer.getvalue())
-                return True, f"Signature processed successfully ({size/1024:.1f} KB, 300x80px)", size
-            
-            quality -= 5
-        
-        return False, "Could not compress signature to under 60KB while maintaining quality", 0
+        img = img.resize(
+            (BUP_SIGNATURE.width, BUP_SIGNATURE.height), Image.Resampling.LANCZOS, reducing_gap=REDUCING_GAP
+        )
+        
+        # Compress to meet size requirement (60 KB), highest quality that fits
+        result = encode_jpeg(img, BUP_SIGNATURE)
+        if result.data is None:
+            return False, "Could not compress signature to under 60KB while maintaining quality", 0
+        
+        write_file(output_path, result.data)
+        return True, (
+            f"Signature processed successfully ({result.size/1024:.1f} KB, 300x80px, "
+            f"quality {result.quality}, encodes: {result.passes})"
+        ), result.size
         
     except Exception as e:
         return False, f"Signature processing error: {str(e)}", 0
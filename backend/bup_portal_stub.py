@@ -0,0 +1,395 @@
+"""
+BUP Portal Stand-in
+A small local imitation of the BUP admission portal's WebForms flow, for
+exercising both BUP drivers without touching the real site.
+
+It issues and checks __VIEWSTATE / __EVENTVALIDATION the way ASP.NET does
+(stale view state or an option that was never rendered is rejected), renders
+AutoPostBack controls with __doPostBack, cascades the address dropdowns, and
+can put a CAPTCHA in front of verification.
+
+Run:   uvicorn bup_portal_stub:app --port 8100
+Then:  BUP_BASE_URL=http://localhost:8100 (or pass httpx.ASGITransport(app=app)
+       to BUPHttpAutomation with bup_base_url pointed at http://stub)
+"""
+
+import base64
+import html
+import json
+import secrets
+from typing import Dict, List, Optional, Tuple
+from fastapi import FastAPI, Request
+from fastapi.responses import HTMLResponse, RedirectResponse, Response, JSONResponse
+
+app = FastAPI(title="BUP Portal Stand-in")
+
+PROGRAMS = [
+    "Bachelor of Business Administration (General)",
+    "Bachelor of Arts in English",
+    "BSc in Computer Science and Engineering",
+]
+
+EXAMS = [("ssc", "SSC"), ("hsc", "HSC"), ("olevel", "O-Level"), ("alevel", "A-Level")]
+YEARS = [str(y) for y in range(2015, 2025)]
+BOARDS = [("2", "Dhaka"), ("3", "Rajshahi"), ("4", "Comilla"), ("5", "Jessore"), ("6", "Chittagong"),
+          ("7", "Barisal"), ("8", "Sylhet"), ("9", "Dinajpur"), ("16", "Mymensingh"), ("10", "Madrasah")]
+
+# division value -> (label, {district value -> (label, {thana value -> label})})
+ADDRESSES = {
+    "1": ("Dhaka", {
+        "11": ("Dhaka", {"111": "Dhanmondi", "112": "Mirpur", "113": "Mohammadpur"}),
+        "12": ("Gazipur", {"121": "Tongi", "122": "Gazipur Sadar"}),
+    }),
+    "2": ("Chittagong", {
+        "21": ("Comilla", {"211": "Comilla Sadar"}),
+        "22": ("Chittagong", {"221": "Pahartali", "222": "Kotwali"}),
+    }),
+    "3": ("Barisal", {
+        "31": ("Barisal", {"311": "Barisal Sadar"}),
+    }),
+}
+
+CAPTCHA_ANSWER = "x7Kp2"
+
+SELECTED = ' selected="selected"'
+
+# Stand-in settings, adjustable at /_stub/config
+stub_config = {"captcha": False}
+
+# Per-session server state {session_id: {...}} and accepted applications
+_sessions: Dict[str, Dict] = {}
+submissions: List[Dict] = []
+
+
+def _name(control: str) -> str:
+    return f"ctl00$MainContent${control}"
+
+
+def _id(control: str) -> str:
+    return f"MainContent_{control}"
+
+
+def _autopostback(name: str) -> str:
+    return html.escape(f"javascript:setTimeout('__doPostBack(\\'{name}\\',\\'\\')', 0)", quote=True)
+
+
+class _Form:
+    """Renders controls and remembers what event validation must accept"""
+
+    def __init__(self, session: Dict):
+        self.session = session
+        self.allowed: Dict[str, List[str]] = {}
+        self.targets: List[str] = []
+        self.parts: List[str] = []
+
+    def add(self, markup: str):
+        self.parts.append(markup)
+
+    def text(self, control: str, label: str, readonly: bool = False):
+        value = html.escape(self.session["fields"].get(_name(control), ""), quote=True)
+        extra = ' readonly="readonly"' if readonly else ''
+        self.add(f'<label>{label}</label><input name="{_name(control)}" type="text" id="{_id(control)}" value="{value}"{extra} />')
+
+    def select(self, control: str, label: str, options: List[Tuple[str, str]], autopostback: bool = True):
+        name = _name(control)
+        current = self.session["fields"].get(name, "")
+        handler = f' onchange="{_autopostback(name)}"' if autopostback else ''
+        if autopostback:
+            self.targets.append(name)
+        rendered = [("", "-- Select --")] + options
+        self.allowed[name] = [value for value, _ in rendered]
+        markup = "".join(
+            f'<option{SELECTED if value == current else ""} value="{value}">{html.escape(text)}</option>'
+            for value, text in rendered
+        )
+        self.add(f'<label>{label}</label><select name="{name}" id="{_id(control)}"{handler}>{markup}</select>')
+
+    def checkbox(self, control: str, id_: str, label: str, name: Optional[str] = None):
+        name = name or _name(control)
+        checked = ' checked="checked"' if self.session["fields"].get(name) else ''
+        self.targets.append(name)
+        self.add(
+            f'<input id="{id_}" type="checkbox" name="{name}"{checked} onclick="{_autopostback(name)}" />'
+            f'<label for="{id_}">{label}</label>'
+        )
+
+    def button(self, control: str, value: str, disabled: bool = False):
+        extra = ' disabled="disabled"' if disabled else ''
+        self.add(f'<input type="submit" name="{_name(control)}" value="{value}" id="{_id(control)}"{extra} />')
+
+    def page(self, action: str) -> HTMLResponse:
+        view_state = base64.b64encode(secrets.token_bytes(24)).decode()
+        validation = base64.b64encode(json.dumps({"allowed": self.allowed, "targets": self.targets}).encode()).decode()
+        # Any page issued to the session may be posted back (e.g. after the back
+        # button), as ASP.NET only checks that the view state is its own
+        self.session["issued"][view_state] = {"validation": validation, "allowed": self.allowed, "targets": self.targets}
+        body = "\n".join(self.parts)
+        return HTMLResponse(f'''<!DOCTYPE html>
+<html><head><title>BUP Admission</title>
+<script type="text/javascript">
+function __doPostBack(t, a) {{ var f = document.forms[0]; f.__EVENTTARGET.value = t; f.__EVENTARGUMENT.value = a; f.submit(); }}
+</script></head>
+<body><form method="post" action="{action}" id="form1" enctype="multipart/form-data">
+<input type="hidden" name="__EVENTTARGET" id="__EVENTTARGET" value="" />
+<input type="hidden" name="__EVENTARGUMENT" id="__EVENTARGUMENT" value="" />
+<input type="hidden" name="__VIEWSTATE" id="__VIEWSTATE" value="{view_state}" />
+<input type="hidden" name="__VIEWSTATEGENERATOR" id="__VIEWSTATEGENERATOR" value="5A7C2E11" />
+<input type="hidden" name="__EVENTVALIDATION" id="__EVENTVALIDATION" value="{validation}" />
+{body}
+</form></body></html>''')
+
+
+def _session(request: Request) -> Tuple[str, Dict]:
+    session_id = request.cookies.get("ASP.NET_SessionId")
+    if not session_id or session_id not in _sessions:
+        session_id = secrets.token_hex(12)
+        _sessions[session_id] = {"stage": "programs", "fields": {}, "files": {}, "issued": {}}
+    return session_id, _sessions[session_id]
+
+
+def _with_cookie(response: Response, session_id: str) -> Response:
+    response.set_cookie("ASP.NET_SessionId", session_id, httponly=True)
+    return response
+
+
+def _error(message: str) -> HTMLResponse:
+    return HTMLResponse(f"<html><body><h1>Server Error</h1><p>{html.escape(message)}</p></body></html>", status_code=500)
+
+
+async def _postback(request: Request, session: Dict) -> Tuple[Optional[Dict], Optional[HTMLResponse]]:
+    """Check view state and event validation, then merge the posted fields into the session"""
+    form = await request.form()
+    issued = session["issued"].get(form.get("__VIEWSTATE"))
+    if issued is None:
+        return None, _error("Validation of viewstate MAC failed.")
+    if form.get("__EVENTVALIDATION") != issued["validation"]:
+        return None, _error("Invalid postback or callback argument (event validation).")
+    target = form.get("__EVENTTARGET") or ""
+    if target and target not in issued["targets"]:
+        return None, _error(f"Invalid postback or callback argument: {target}")
+    for name, allowed in issued["allowed"].items():
+        if name in form and form[name] not in allowed:
+            return None, _error(f"Invalid postback or callback argument: {name}={form[name]}")
+
+    posted = {}
+    for name, value in form.multi_items():
+        if hasattr(value, "read"):
+            if value.filename:
+                session["files"][name] = {"filename": value.filename, "size": len(await value.read())}
+        elif not name.startswith("__"):
+            posted[name] = value
+    # Unchecked checkboxes are simply absent from the post
+    for name in list(session["fields"]):
+        if ("CheckBox" in name or "chk" in name) and name not in posted:
+            session["fields"].pop(name)
+    session["fields"].update(posted)
+    return {"target": target, "form": form}, None
+
+
+@app.get("/Admission/Candidate/SelectProgramV3")
+async def programs_page(request: Request):
+    session_id, session = _session(request)
+    session.update({"stage": "programs", "fields": {}, "files": {}})
+    return _with_cookie(_render_programs(session), session_id)
+
+
+@app.post("/Admission/Candidate/SelectProgramV3")
+async def programs_postback(request: Request):
+    session_id, session = _session(request)
+    posted, error = await _postback(request, session)
+    if error:
+        return error
+    if _name("btnApply1") in posted["form"]:
+        chosen = [i for i in range(len(PROGRAMS)) if session["fields"].get(_program_checkbox(i))]
+        if not chosen:
+            return _error("No program selected")
+        session.update({"stage": "purchase", "program": PROGRAMS[chosen[0]], "fields": {}})
+        return _with_cookie(RedirectResponse("/Admission/Candidate/PurchaseForm", status_code=302), session_id)
+    return _with_cookie(_render_programs(session), session_id)
+
+
+def _program_checkbox(index: int) -> str:
+    return f"ctl00$MainContent$lvAdmSetup$ctrl{index}$CheckBox1"
+
+
+def _render_programs(session: Dict) -> HTMLResponse:
+    form = _Form(session)
+    form.add("<table>")
+    for i, program in enumerate(PROGRAMS):
+        form.add(f'<tr><td><span class="fw-medium">{html.escape(program)}</span></td><td>')
+        form.checkbox("", f"MainContent_lvAdmSetup_CheckBox1_{i}", "Select", name=_program_checkbox(i))
+        form.add("</td></tr>")
+    form.add("</table>")
+    selected = any(session["fields"].get(_program_checkbox(i)) for i in range(len(PROGRAMS)))
+    form.button("btnApply1", "Apply", disabled=not selected)
+    return form.page("./SelectProgramV3?ecat=4")
+
+
+@app.get("/Admission/Candidate/PurchaseForm")
+async def purchase_page(request: Request):
+    session_id, session = _session(request)
+    if session["stage"] not in ("purchase", "exam", "captcha", "personal"):
+        return RedirectResponse("/Admission/Candidate/SelectProgramV3?ecat=4", status_code=302)
+    return _with_cookie(_render_purchase(session), session_id)
+
+
+@app.post("/Admission/Candidate/PurchaseForm")
+async def purchase_postback(request: Request):
+    session_id, session = _session(request)
+    posted, error = await _postback(request, session)
+    if error:
+        return error
+    form, target, fields = posted["form"], posted["target"], session["fields"]
+
+    if _name("btnSSCHSC") in form:
+        session["stage"] = "exam"
+    elif _name("btnVerifyInformation") in form:
+        if session["stage"] == "captcha":
+            if fields.get(_name("txtCaptcha")) != CAPTCHA_ANSWER:
+                return _with_cookie(_render_purchase(session, "Invalid CAPTCHA"), session_id)
+            session["stage"] = "personal"
+        else:
+            for level in ("SSC", "HSC"):
+                if len(fields.get(_name(f"txtRoll{level}"), "")) != 6:
+                    return _with_cookie(_render_purchase(session, f"Invalid {level} roll"), session_id)
+            session["stage"] = "captcha" if stub_config["captcha"] else "personal"
+    elif _name("btnSubmit") in form:
+        missing = [f for f in ("fuPhoto", "fuSignature") if _name(f) not in session["files"]]
+        if missing:
+            return _with_cookie(_render_purchase(session, f"Missing upload: {', '.join(missing)}"), session_id)
+        submissions.append({"program": session["program"], "fields": dict(fields), "files": dict(session["files"])})
+        session["stage"] = "payment"
+        return _with_cookie(RedirectResponse("/Admission/Candidate/Payment", status_code=302), session_id)
+    elif target.endswith("Division"):
+        prefix = "Present" if "Present" in target else "Permanent"
+        fields.pop(_name(f"ddl{prefix}District"), None)
+        fields.pop(_name(f"ddl{prefix}Thana"), None)
+    elif target.endswith("District"):
+        prefix = "Present" if "Present" in target else "Permanent"
+        fields.pop(_name(f"ddl{prefix}Thana"), None)
+    elif target == _name("chkSameAsPresent") and fields.get(target):
+        for part in ("Division", "District", "Thana"):
+            fields[_name(f"ddlPermanent{part}")] = fields.get(_name(f"ddlPresent{part}"), "")
+        for part in ("PostOffice", "Village", "ZIP"):
+            fields[_name(f"txtPermanent{part}")] = fields.get(_name(f"txtPresent{part}"), "")
+
+    return _with_cookie(_render_purchase(session), session_id)
+
+
+def _render_purchase(session: Dict, message: str = "") -> HTMLResponse:
+    form = _Form(session)
+    stage = session["stage"]
+    form.add(f"<h2>{html.escape(session.get('program', ''))}</h2>")
+    if message:
+        form.add(f'<span class="text-danger">{html.escape(message)}</span>')
+
+    if stage == "purchase":
+        form.button("btnSSCHSC", "SSC/HSC")
+    elif stage == "exam":
+        for level in ("SSC", "HSC"):
+            form.add(f"<h3>{level} Information</h3>")
+            form.select(f"ddlExamType{level}", "Examination", EXAMS)
+            form.text(f"txtRoll{level}", "Roll")
+            form.text(f"txtReg{level}", "Registration")
+            form.select(f"ddlPassYear{level}", "Passing Year", [(y, y) for y in YEARS])
+            form.select(f"ddlBoard{level}", "Board", BOARDS)
+        form.button("btnVerifyInformation", "Verify Information")
+    elif stage == "captcha":
+        form.add('<img id="MainContent_imgCaptcha" src="/Captcha.ashx" alt="captcha" />')
+        form.text("txtCaptcha", "Enter the code")
+        form.button("btnVerifyInformation", "Verify Information")
+    elif stage == "personal":
+        _render_personal(form)
+    return form.page("./PurchaseForm")
+
+
+def _render_personal(form: _Form):
+    fields = form.session["fields"]
+    fields.setdefault(_name("txtName"), "TEST CANDIDATE")
+    form.text("txtName", "Name", readonly=True)
+    form.select("ddlDay", "Day", [(f"{d:02d}", str(d)) for d in range(1, 32)])
+    form.select("ddlMonth", "Month", [(f"{m:02d}", str(m)) for m in range(1, 13)])
+    form.select("ddlYear", "Year", [(str(y), str(y)) for y in range(1995, 2011)])
+    form.text("txtEmail", "Email")
+    form.select("ddlGender", "Gender", [("2", "Male"), ("3", "Female")], autopostback=False)
+    form.text("txtSmsMobile", "Mobile")
+    form.text("txtGuardianMobile", "Guardian Mobile")
+
+    for prefix in ("Present", "Permanent"):
+        form.add(f"<h3>{prefix} Address</h3>")
+        if prefix == "Permanent":
+            form.checkbox("chkSameAsPresent", _id("chkSameAsPresent"), "Same as Present Address")
+        division = fields.get(_name(f"ddl{prefix}Division"), "")
+        district = fields.get(_name(f"ddl{prefix}District"), "")
+        districts = ADDRESSES.get(division, ("", {}))[1]
+        thanas = districts.get(district, ("", {}))[1]
+        form.select(f"ddl{prefix}Division", "Division", [(v, label) for v, (label, _) in ADDRESSES.items()])
+        form.select(f"ddl{prefix}District", "District", [(v, label) for v, (label, _) in districts.items()])
+        form.select(f"ddl{prefix}Thana", "Thana", list(thanas.items()), autopostback=False)
+        form.text(f"txt{prefix}PostOffice", "Post Office")
+        form.text(f"txt{prefix}Village", "Village/Road/House")
+        form.text(f"txt{prefix}ZIP", "ZIP")
+
+    form.add(f'<input type="file" name="{_name("fuPhoto")}" id="{_id("fuPhoto")}" />')
+    form.add(f'<input type="file" name="{_name("fuSignature")}" id="{_id("fuSignature")}" />')
+    form.button("btnSubmit", "Submit Application")
+
+
+@app.get("/Captcha.ashx")
+async def captcha_image():
+    # 1x1 PNG; the answer is CAPTCHA_ANSWER
+    return Response(base64.b64decode(
+        "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNk+M9QDwADhgGAWjR9awAAAABJRU5ErkJggg=="
+    ), media_type="image/png")
+
+
+@app.get("/Admission/Candidate/Payment")
+async def payment_page(request: Request):
+    session_id, session = _session(request)
+    if session["stage"] != "payment":
+        return RedirectResponse("/Admission/Candidate/SelectProgramV3?ecat=4", status_code=302)
+    form = _Form(session)
+    form.targets.append(_name("lnkReceipt"))
+    form.add("<p>Application Fee Amount: BDT 1000.00</p>")
+    form.add('<a id="MainContent_lnkSlip" href="/Admission/Candidate/AdmissionSlip.ashx">Download Admission Slip</a>')
+    form.add(f'<a id="MainContent_lnkReceipt" href="javascript:__doPostBack(&#39;{_name("lnkReceipt")}&#39;,&#39;&#39;)">Money Receipt</a>')
+    return _with_cookie(form.page("./Payment"), session_id)
+
+
+@app.post("/Admission/Candidate/Payment")
+async def payment_postback(request: Request):
+    session_id, session = _session(request)
+    posted, error = await _postback(request, session)
+    if error:
+        return error
+    if posted["target"] == _name("lnkReceipt"):
+        return Response(b"%PDF-1.4 receipt", media_type="application/pdf",
+                        headers={"Content-Disposition": "attachment; filename=receipt.pdf"})
+    return _error("Unexpected postback")
+
+
+@app.get("/Admission/Candidate/AdmissionSlip.ashx")
+async def admission_slip(request: Request):
+    _, session = _session(request)
+    if session["stage"] != "payment":
+        return _error("Session expired")
+    return Response(b"%PDF-1.4 admission slip", media_type="application/pdf",
+                    headers={"Content-Disposition": "attachment; filename=slip.pdf"})
+
+
+@app.get("/_stub/submissions")
+async def list_submissions():
+    return JSONResponse(submissions)
+
+
+@app.post("/_stub/expire")
+async def expire_sessions():
+    """Drop every session, as the portal does after its session timeout"""
+    _sessions.clear()
+    return {"expired": True}
+
+
+@app.post("/_stub/config")
+async def configure(captcha: bool = False):
+    stub_config["captcha"] = captcha
+    return stub_config
@@ -11,11 +11,24 @@ import asyncio
 if sys.platform == 'win32':
     asyncio.set_event_loop_policy(asyncio.WindowsProactorEventLoopPolicy())
 
-from playwright.async_api import async_playwright, Page, Browser
+from playwright.async_api import Page, BrowserContext
 from config import get_settings
+from browser_pool import get_browser_pool
+from request_filter import attach_request_filter
+from artifacts import capture
+from bup_gazetteer import gazetteer, match_option, real_options
+from bup_waits import (
+    WaitRecorder,
+    postback_after,
+    option_signature,
+    wait_for_options_changed,
+    wait_for_enabled,
+    wait_for_visible
+)
 import logging
-from typing import Optional, Dict
+from typing import Callable, Optional, Dict
 import os
+from urllib.parse import urlparse
 
 settings = get_settings()
 logger = logging.getLogger(__name__)
@@ -48,53 +61,101 @@ EXAM_TYPE_MAPPING = {
     'A-LEVEL': 'alevel'
 }
 
-DIVISION_MAPPING = {
-    'DHAKA': 'Dhaka',
-    'CHATTAGRAM': 'Chittagong',
-    'CHITTAGONG': 'Chittagong',
-    'RAJSHAHI': 'Rajshahi',
-    'KHULNA': 'Khulna',
-    'BARISAL': 'Barisal',
-    'SYLHET': 'Sylhet',
-    'RANGPUR': 'Rangpur',
-    'MYMENSINGH': 'Mymensingh'
+# Browser context settings the BUP portal expects
+BUP_CONTEXT_OPTIONS = {
+    'viewport': {'width': 1920, 'height': 1080},
+    'locale': 'en-BD',
+    'timezone_id': 'Asia/Dhaka'
 }
 
 
 class BUPAutomation:
     """Playwright automation for BUP admission process"""
     
-    def __init__(self):
-        self.browser: Optional[Browser] = None
+    def __init__(self, headless: Optional[bool] = None):
+        self.headless = settings.bup_headless if headless is None else headless
+        self.context: Optional[BrowserContext] = None
         self.page: Optional[Page] = None
-        self.playwright = None
+        self.waits = WaitRecorder()
+        self.request_stats = None
+        self.preloaded_url: Optional[str] = None
+        
+    def _pool(self):
+        # Headless by default; CAPTCHAs are relayed through the API
+        return get_browser_pool(headless=self.headless)
         
     async def initialize(self):
-        """Initialize browser and page"""
+        """Lease a browser context from the shared pool and open a page"""
         try:
-            self.playwright = await async_playwright().start()
-            self.browser = await self.playwright.chromium.launch(
-                headless=False,  # Run in visible mode for CAPTCHA solving
-                args=['--no-sandbox', '--disable-setuid-sandbox']
-            )
-            self.page = await self.browser.new_page(
-                viewport={'width': 1920, 'height': 1080},
-                locale='en-BD',
-                timezone_id='Asia/Dhaka'
-            )
-            logger.info("BUP automation browser initialized (visible mode for CAPTCHA)")
+            self.context = await self._pool().acquire(**BUP_CONTEXT_OPTIONS)
+            self.request_stats = await attach_request_filter(self.context, "bup")
+            self.page = await self.context.new_page()
+            logger.info(f"BUP automation context initialized (headless={self.headless})")
         except Exception as e:
             logger.error(f"Browser initialization error: {str(e)}")
             raise
             
+    async def preload(self):
+        """Open the program list ahead of time (prewarm); navigate_and_select_faculty then skips its navigation"""
+        url = f'{settings.bup_base_url}/Admission/Candidate/SelectProgramV3?ecat=4'
+        await self.page.goto(url, wait_until='networkidle', timeout=60000)
+        self.preloaded_url = url
+            
+    async def snapshot(self) -> Dict:
+        """Capture cookies, local storage, the current URL and page so the session can be restored later"""
+        state = await self.context.storage_state()
+        state["url"] = self.page.url
+        state["html"] = await self.page.content()
+        return state
+        
+    async def restore(self, snapshot: Dict):
+        """Start a fresh pooled context from a snapshot and reopen the paused page"""
+        storage_state = {"cookies": snapshot.get("cookies", []), "origins": snapshot.get("origins", [])}
+        self.context = await self._pool().acquire(storage_state=storage_state, **BUP_CONTEXT_OPTIONS)
+        self.request_stats = await attach_request_filter(self.context, "bup")
+        self.page = await self.context.new_page()
+        if snapshot.get("html"):
+            await self.open_page(snapshot["url"], snapshot["html"])
+        else:
+            await self.page.goto(snapshot["url"], wait_until='domcontentloaded', timeout=60000)
+        logger.info(f"BUP session restored at {snapshot['url']}")
+    
+    async def open_page(self, url: str, html: str):
+        """
+        Show a page exactly as the server last rendered it (view state included),
+        so the next postback continues from it instead of a fresh GET
+        """
+        def is_page(request_url: str) -> bool:
+            return request_url == url
+        
+        async def serve(route):
+            await route.fulfill(status=200, content_type='text/html; charset=utf-8', body=html)
+        
+        await self.page.route(is_page, serve)
+        try:
+            await self.page.goto(url, wait_until='domcontentloaded', timeout=60000)
+        finally:
+            await self.page.unroute(is_page, serve)
+    
+    async def probe(self, url: str) -> bool:
+        """True if the portal still serves `url` to this session instead of sending it back to the start"""
+        try:
+            response = await self.context.request.get(url, timeout=30000)
+            return response.ok and urlparse(response.url).path == urlparse(url).path
+        except Exception as e:
+            logger.warning(f"Session probe failed: {str(e)}")
+            return False
+            
     async def close(self):
-        """Close browser"""
+        """Return the browser context to the pool"""
         try:
-            if self.browser:
-                await self.browser.close()
-            if self.playwright:
-                await self.playwright.stop()
-            logger.info("BUP automation browser closed")
+            if self.request_stats:
+                logger.info(f"Request filter: {self.request_stats.summary()}")
+            if self.context:
+                await self._pool().release(self.context)
+                self.context = None
+                self.page = None
+            logger.info("BUP automation context released")
         except Exception as e:
             logger.error(f"Browser close error: {str(e)}")
     
@@ -105,15 +166,15 @@ class BUPAutomation:
         """
         try:
             logger.info(f"Navigating to BUP admission page and selecting: {faculty}")
-            await self.page.goto(
-                'https://admission.bup.edu.bd/Admission/Candidate/SelectProgramV3?ecat=4',
-                wait_until='networkidle',
-                timeout=60000
-            )
+            url = f'{settings.bup_base_url}/Admission/Candidate/SelectProgramV3?ecat=4'
+            if self.preloaded_url == url:
+                logger.info("Using preloaded program page")
+            else:
+                await self.page.goto(url, wait_until='networkidle', timeout=60000)
+            self.preloaded_url = None
             
             # Wait for page to load
             await self.page.wait_for_selector('input[type="checkbox"]', timeout=15000)
-            await asyncio.sleep(2)
             
             # Find the program by text and click its checkbox
             # Programs are in a table with checkboxes having IDs like MainContent_lvAdmSetup_CheckBox1_0, _1, _2, etc.
@@ -131,13 +192,13 @@ class BUPAutomation:
                     checkbox_id = f'MainContent_lvAdmSetup_CheckBox1_{i}'
                     logger.info(f"Found program at index {i}, clicking checkbox: {checkbox_id}")
                     
-                    # Click checkbox using JavaScript (more reliable)
-                    await self.page.evaluate(f'document.getElementById("{checkbox_id}").click()')
-                    await asyncio.sleep(2)
-                    
-                    # Wait for postback
-                    await self.page.wait_for_load_state('networkidle', timeout=15000)
-                    await asyncio.sleep(2)
+                    # Click checkbox using JavaScript (more reliable) and wait for its postback
+                    await postback_after(
+                        self.page,
+                        lambda: self.page.evaluate(f'document.getElementById("{checkbox_id}").click()'),
+                        "program_checkbox_postback", self.waits,
+                        trigger_selector=f'#{checkbox_id}', timeout=15000
+                    )
                     
                     program_found = True
                     break
@@ -145,21 +206,19 @@ class BUPAutomation:
             if not program_found:
                 raise Exception(f"Program not found: {faculty}")
             
-            # Click Apply/Proceed button
+            # Click Apply/Proceed button once it is enabled
+            await wait_for_enabled(self.page, 'input#MainContent_btnApply1', "apply_enabled", self.waits, timeout=10000)
             apply_btn = await self.page.wait_for_selector('input#MainContent_btnApply1', timeout=10000)
-            await apply_btn.click()
-            logger.info("Clicked Apply button")
             
             # Wait for next page
-            await self.page.wait_for_load_state('networkidle', timeout=30000)
-            await asyncio.sleep(3)
+            await postback_after(self.page, apply_btn.click, "apply_postback", self.waits)
+            logger.info("Clicked Apply button")
             
             # Log current URL for debugging
             current_url = self.page.url
             logger.info(f"Current URL after Apply: {current_url}")
             
-            # Take screenshot for debugging
-            await self._capture_screenshot("after_apply_button")
+            await capture(self.page, "bup_after_apply_button")
             
             return {"success": True, "message": f"Selected faculty: {faculty}"}
             
@@ -175,10 +234,6 @@ class BUPAutomation:
         try:
             logger.info("Selecting SSC/HSC education type...")
             
-            # Wait for the page to be fully loaded first
-            await self.page.wait_for_load_state('networkidle', timeout=30000)
-            await asyncio.sleep(2)
-            
             # Click SSC/HSC button (MainContent_btnSSCHSC)
             logger.info("Looking for SSC/HSC button...")
             ssc_hsc_btn = await self.page.wait_for_selector('input#MainContent_btnSSCHSC', timeout=15000)
@@ -190,12 +245,10 @@ class BUPAutomation:
             is_visible = await ssc_hsc_btn.is_visible()
             logger.info(f"SSC/HSC button visible: {is_visible}")
             
-            await ssc_hsc_btn.click()
-            logger.info("Clicked SSC/HSC button")
-            
-            # Wait for the form to load - this may take time as it's loaded via AJAX
+            # Wait for the form to load - it is delivered by the button's postback
             logger.info("Waiting for SSC/HSC form to load...")
-            await asyncio.sleep(8)  # Give time for AJAX to complete
+            await postback_after(self.page, ssc_hsc_btn.click, "ssc_hsc_postback", self.waits)
+            logger.info("Clicked SSC/HSC button")
             
             # Wait for any of the SSC form elements to appear
             try:
@@ -223,8 +276,8 @@ class BUPAutomation:
                 
                 raise Exception(f"SSC form elements did not appear after clicking button: {str(e)}")
             
-            # Additional wait to ensure all form elements are ready
-            await asyncio.sleep(3)
+            # Ensure the exam dropdown is interactive
+            await wait_for_enabled(self.page, 'select#MainContent_ddlExamTypeSSC', "ssc_form_ready", self.waits)
             
             return {"success": True, "message": "Selected SSC/HSC education type"}
             
@@ -245,27 +298,30 @@ class BUPAutomation:
             exam_value = EXAM_TYPE_MAPPING.get(ssc_data['ssc_examination'].upper(), 'ssc')
             logger.info(f"Selecting SSC Exam: {exam_value}")
             
-            try:
-                await self.page.select_option('select#MainContent_ddlExamTypeSSC', value=exam_value)
-            except Exception as select_err:
-                logger.warning(f"Standard select failed, trying JS: {str(select_err)}")
-                await self.page.evaluate(f'''
-                    const select = document.getElementById('MainContent_ddlExamTypeSSC');
-                    if (select) {{
-                        select.value = '{exam_value}';
-                        select.dispatchEvent(new Event('change', {{ bubbles: true }}));
-                    }}
-                ''')
-            
-            logger.info(f"Selected SSC Exam: {exam_value}")
+            async def select_exam():
+                try:
+                    await self.page.select_option('select#MainContent_ddlExamTypeSSC', value=exam_value)
+                except Exception as select_err:
+                    logger.warning(f"Standard select failed, trying JS: {str(select_err)}")
+                    await self.page.evaluate(f'''
+                        const select = document.getElementById('MainContent_ddlExamTypeSSC');
+                        if (select) {{
+                            select.value = '{exam_value}';
+                            select.dispatchEvent(new Event('change', {{ bubbles: true }}));
+                        }}
+                    ''')
             
             # Wait for postback/AJAX after exam selection
             logger.info("Waiting for form update after exam selection...")
-            await asyncio.sleep(2)
+            await postback_after(
+                self.page, select_exam, "ssc_exam_postback", self.waits,
+                trigger_selector='select#MainContent_ddlExamTypeSSC'
+            )
+            logger.info(f"Selected SSC Exam: {exam_value}")
             
             # SSC Roll (MainContent_txtRollSSC)
             logger.info("Filling SSC Roll...")
-            await self.page.wait_for_selector('input#MainContent_txtRollSSC', state='visible', timeout=10000)
+            await wait_for_enabled(self.page, 'input#MainContent_txtRollSSC', "ssc_roll_ready", self.waits, timeout=10000)
             await self.page.fill('input#MainContent_txtRollSSC', ssc_data['ssc_roll'])
             logger.info(f"Filled SSC Roll: {ssc_data['ssc_roll']}")
             
@@ -274,24 +330,32 @@ class BUPAutomation:
             logger.info(f"Filled SSC Registration: {ssc_data['ssc_registration']}")
             
             # SSC Passing Year (MainContent_ddlPassYearSSC)
-            await self.page.select_option('select#MainContent_ddlPassYearSSC', value=str(ssc_data['ssc_passing_year']))
+            await postback_after(
+                self.page,
+                lambda: self.page.select_option('select#MainContent_ddlPassYearSSC', value=str(ssc_data['ssc_passing_year'])),
+                "ssc_year_postback", self.waits,
+                trigger_selector='select#MainContent_ddlPassYearSSC'
+            )
             logger.info(f"Selected SSC Year: {ssc_data['ssc_passing_year']}")
-            await asyncio.sleep(1)
             
             # SSC Board (MainContent_ddlBoardSSC)
             board_value = BOARD_MAPPING.get(ssc_data['ssc_board'].upper(), '6')
             logger.info(f"Selecting SSC Board: {ssc_data['ssc_board']} (value: {board_value})")
             
             # Use JavaScript to select the board (more reliable for ASP.NET dropdowns)
-            await self.page.evaluate(f'''
-                const select = document.getElementById('MainContent_ddlBoardSSC');
-                if (select) {{
-                    select.value = '{board_value}';
-                    select.dispatchEvent(new Event('change', {{ bubbles: true }}));
-                }}
-            ''')
+            await postback_after(
+                self.page,
+                lambda: self.page.evaluate(f'''
+                    const select = document.getElementById('MainContent_ddlBoardSSC');
+                    if (select) {{
+                        select.value = '{board_value}';
+                        select.dispatchEvent(new Event('change', {{ bubbles: true }}));
+                    }}
+                '''),
+                "ssc_board_postback", self.waits,
+                trigger_selector='select#MainContent_ddlBoardSSC'
+            )
             logger.info(f"Selected SSC Board: {ssc_data['ssc_board']} (value: {board_value})")
-            await asyncio.sleep(2)
             
             return {"success": True, "message": "SSC information filled successfully"}
             
@@ -311,27 +375,30 @@ class BUPAutomation:
             exam_value = EXAM_TYPE_MAPPING.get(hsc_data['hsc_examination'].upper(), 'hsc')
             logger.info(f"Selecting HSC Exam: {exam_value}")
             
-            try:
-                await self.page.select_option('select#MainContent_ddlExamTypeHSC', value=exam_value)
-            except Exception as select_err:
-                logger.warning(f"Standard select failed, trying JS: {str(select_err)}")
-                await self.page.evaluate(f'''
-                    const select = document.getElementById('MainContent_ddlExamTypeHSC');
-                    if (select) {{
-                        select.value = '{exam_value}';
-                        select.dispatchEvent(new Event('change', {{ bubbles: true }}));
-                    }}
-                ''')
-            
-            logger.info(f"Selected HSC Exam: {exam_value}")
+            async def select_exam():
+                try:
+                    await self.page.select_option('select#MainContent_ddlExamTypeHSC', value=exam_value)
+                except Exception as select_err:
+                    logger.warning(f"Standard select failed, trying JS: {str(select_err)}")
+                    await self.page.evaluate(f'''
+                        const select = document.getElementById('MainContent_ddlExamTypeHSC');
+                        if (select) {{
+                            select.value = '{exam_value}';
+                            select.dispatchEvent(new Event('change', {{ bubbles: true }}));
+                        }}
+                    ''')
             
             # Wait for postback/AJAX after exam selection
             logger.info("Waiting for form update after HSC exam selection...")
-            await asyncio.sleep(2)
+            await postback_after(
+                self.page, select_exam, "hsc_exam_postback", self.waits,
+                trigger_selector='select#MainContent_ddlExamTypeHSC'
+            )
+            logger.info(f"Selected HSC Exam: {exam_value}")
             
             # HSC Roll (MainContent_txtRollHSC)
             logger.info("Filling HSC Roll...")
-            await self.page.wait_for_selector('input#MainContent_txtRollHSC', state='visible', timeout=10000)
+            await wait_for_enabled(self.page, 'input#MainContent_txtRollHSC', "hsc_roll_ready", self.waits, timeout=10000)
             await self.page.fill('input#MainContent_txtRollHSC', hsc_data['hsc_roll'])
             logger.info(f"Filled HSC Roll: {hsc_data['hsc_roll']}")
             
@@ -340,24 +407,32 @@ class BUPAutomation:
             logger.info(f"Filled HSC Registration: {hsc_data['hsc_registration']}")
             
             # HSC Passing Year (MainContent_ddlPassYearHSC)
-            await self.page.select_option('select#MainContent_ddlPassYearHSC', value=str(hsc_data['hsc_passing_year']))
+            await postback_after(
+                self.page,
+                lambda: self.page.select_option('select#MainContent_ddlPassYearHSC', value=str(hsc_data['hsc_passing_year'])),
+                "hsc_year_postback", self.waits,
+                trigger_selector='select#MainContent_ddlPassYearHSC'
+            )
             logger.info(f"Selected HSC Year: {hsc_data['hsc_passing_year']}")
-            await asyncio.sleep(1)
             
             # HSC Board (MainContent_ddlBoardHSC)
             board_value = BOARD_MAPPING.get(hsc_data['hsc_board'].upper(), '6')
             logger.info(f"Selecting HSC Board: {hsc_data['hsc_board']} (value: {board_value})")
             
             # Use JavaScript to select the board (more reliable for ASP.NET dropdowns)
-            await self.page.evaluate(f'''
-                const select = document.getElementById('MainContent_ddlBoardHSC');
-                if (select) {{
-                    select.value = '{board_value}';
-                    select.dispatchEvent(new Event('change', {{ bubbles: true }}));
-                }}
-            ''')
+            await postback_after(
+                self.page,
+                lambda: self.page.evaluate(f'''
+                    const select = document.getElementById('MainContent_ddlBoardHSC');
+                    if (select) {{
+                        select.value = '{board_value}';
+                        select.dispatchEvent(new Event('change', {{ bubbles: true }}));
+                    }}
+                '''),
+                "hsc_board_postback", self.waits,
+                trigger_selector='select#MainContent_ddlBoardHSC'
+            )
             logger.info(f"Selected HSC Board: {hsc_data['hsc_board']} (value: {board_value})")
-            await asyncio.sleep(2)
             
             return {"success": True, "message": "HSC information filled successfully"}
             
@@ -366,28 +441,38 @@ class BUPAutomation:
             await self._capture_screenshot("hsc_info_error")
             return {"success": False, "message": f"HSC information failed: {str(e)}"}
     
-    async def click_verify_information(self) -> Dict:
+    async def click_verify_information(
+        self,
+        application_id: Optional[str] = None,
+        on_captcha: Optional[Callable] = None
+    ) -> Dict:
         """
         Click Verify Information button to validate SSC/HSC data
-        Also handles CAPTCHA if present
+        Also handles CAPTCHA if present: relayed through the API when an
+        application_id is given, otherwise solved in the visible browser
         """
         try:
             logger.info("Clicking Verify Information button...")
             
             # Click Verify Information button (MainContent_btnVerifyInformation)
             verify_btn = await self.page.wait_for_selector('input#MainContent_btnVerifyInformation', timeout=10000)
-            await verify_btn.click()
-            logger.info("Clicked Verify Information")
             
-            # Wait for verification (this may take 10-30 seconds)
+            # Wait for verification postback (this may take 10-30 seconds)
             logger.info("Waiting for education board verification...")
-            await asyncio.sleep(15)
+            await postback_after(self.page, verify_btn.click, "verify_postback", self.waits, timeout=60000)
+            logger.info("Clicked Verify Information")
             
             # Check for CAPTCHA
             from bup_captcha import handle_captcha_if_present
             
             logger.info("Checking for CAPTCHA...")
-            captcha_result = await handle_captcha_if_present(self.page, timeout=300)
+            captcha_result = await handle_captcha_if_present(
+                self.page,
+                timeout=settings.bup_captcha_timeout,
+                application_id=application_id,
+                submit_selector='input#MainContent_btnVerifyInformation',
+                on_challenge=on_captcha
+            )
             
             if captcha_result["captcha_present"]:
                 logger.warning(f"CAPTCHA detected: {captcha_result.get('captcha_type', 'unknown')}")
@@ -402,10 +487,9 @@ class BUPAutomation:
                 logger.info("CAPTCHA solved successfully")
             
             # Wait for Personal Information section to appear
-            try:
-                await self.page.wait_for_selector('input#MainContent_txtCandidateName', timeout=30000)
+            if await wait_for_visible(self.page, 'input#MainContent_txtCandidateName', "personal_info_visible", self.waits):
                 logger.info("Personal Information section loaded")
-            except:
+            else:
                 logger.warning("Personal Information section not found, but continuing...")
             
             return {"success": True, "message": "Information verified successfully"}
@@ -434,19 +518,31 @@ class BUPAutomation:
             year, month, day = dob.split('-')
             
             # Day (MainContent_ddlDay)
-            await self.page.select_option('select#MainContent_ddlDay', value=day)
+            await postback_after(
+                self.page,
+                lambda: self.page.select_option('select#MainContent_ddlDay', value=day),
+                "dob_day_postback", self.waits,
+                trigger_selector='select#MainContent_ddlDay'
+            )
             logger.info(f"Selected Day: {day}")
-            await asyncio.sleep(0.5)
             
             # Month (MainContent_ddlMonth)
-            await self.page.select_option('select#MainContent_ddlMonth', value=month)
+            await postback_after(
+                self.page,
+                lambda: self.page.select_option('select#MainContent_ddlMonth', value=month),
+                "dob_month_postback", self.waits,
+                trigger_selector='select#MainContent_ddlMonth'
+            )
             logger.info(f"Selected Month: {month}")
-            await asyncio.sleep(0.5)
             
             # Year (MainContent_ddlYear)
-            await self.page.select_option('select#MainContent_ddlYear', value=year)
+            await postback_after(
+                self.page,
+                lambda: self.page.select_option('select#MainContent_ddlYear', value=year),
+                "dob_year_postback", self.waits,
+                trigger_selector='select#MainContent_ddlYear'
+            )
             logger.info(f"Selected Year: {year}")
-            await asyncio.sleep(1)
             
             # Email (MainContent_txtEmail)
             await self.page.fill('input#MainContent_txtEmail', personal_data['email'])
@@ -494,6 +590,123 @@ class BUPAutomation:
             await self._capture_screenshot("personal_info_error")
             return {"success": False, "message": f"Personal information failed: {str(e)}"}
     
+    async def _read_options(self, select_id: str) -> Dict[str, str]:
+        """Current {value: text} options of a dropdown"""
+        pairs = await self.page.evaluate(
+            '''id => {
+                const select = document.getElementById(id);
+                return select ? Array.from(select.options).map(o => [o.value, o.text.trim()]) : [];
+            }''',
+            select_id
+        )
+        return {value: text for value, text in pairs}
+    
+    async def _choose_option(self, select_id: str, field: str, query: str, indexed_value: Optional[str]) -> str:
+        """
+        Select a dropdown option by value: the gazetteer's value if the portal
+        still offers it, otherwise the best match among the options on the page
+        """
+        options = await self._read_options(select_id)
+        if indexed_value and indexed_value in options:
+            value = indexed_value
+        else:
+            matched, suggestions = match_option(query, options)
+            if not matched:
+                hint = f" (did you mean: {', '.join(suggestions)})" if suggestions else ""
+                raise Exception(f"No {field} option matches '{query}'{hint}")
+            value = matched[0]
+        await self.page.select_option(f'select#{select_id}', value=value)
+        logger.info(f"Selected {field}: {options[value]} (value: {value})")
+        return value
+    
+    async def _fill_address_dropdowns(self, prefix: str, division: str, district: str, thana: str):
+        """
+        Fill the division -> district -> thana cascade for the 'Present' or 'Permanent' address,
+        recording the option lists the portal returns in the gazetteer
+        """
+        division_id = f'MainContent_ddl{prefix}Division'
+        district_id = f'MainContent_ddl{prefix}District'
+        thana_id = f'MainContent_ddl{prefix}Thana'
+        resolved = gazetteer.resolve(division, district, thana)
+        values = resolved["values"]
+        changed = gazetteer.record_divisions(await self._read_options(division_id))
+        
+        districts_before = await option_signature(self.page, district_id)
+        division_value = await self._choose_option(division_id, "division", resolved["division"], values["division"])
+        await wait_for_options_changed(
+            self.page, district_id, districts_before, f"{prefix.lower()}_districts_loaded", self.waits
+        )
+        changed |= gazetteer.record_districts(division_value, await self._read_options(district_id))
+        
+        if await self.page.query_selector(f'select#{thana_id}'):
+            thanas_before = await option_signature(self.page, thana_id)
+            district_value = await self._choose_option(district_id, "district", resolved["district"], values["district"])
+            await wait_for_options_changed(
+                self.page, thana_id, thanas_before, f"{prefix.lower()}_thanas_loaded", self.waits
+            )
+        else:
+            # No thana dropdown to watch (free-text layout): wait for the district postback itself
+            chosen = {}
+            
+            async def choose_district():
+                chosen["value"] = await self._choose_option(district_id, "district", resolved["district"], values["district"])
+            
+            await postback_after(
+                self.page, choose_district, f"{prefix.lower()}_district_posted", self.waits,
+                trigger_selector=f'select#{district_id}'
+            )
+            district_value = chosen["value"]
+        
+        if await self.page.query_selector(f'select#{thana_id}'):
+            changed |= gazetteer.record_thanas(division_value, district_value, await self._read_options(thana_id))
+            await self._choose_option(thana_id, "thana", resolved["thana"], values["thana"])
+        else:
+            # Some layouts take the thana as free text
+            await self.page.fill(f'input#MainContent_txt{prefix}Thana', thana)
+            logger.info(f"Filled {prefix} Thana: {thana}")
+        
+        if changed:
+            gazetteer.save()
+    
+    async def harvest_address_options(self, prefix: str = 'Permanent') -> Dict:
+        """
+        Walk every division and district of an address cascade and store the
+        option lists in the gazetteer (the gazetteer maintenance job; it leaves
+        the dropdowns changed, so never run it on a form that will be submitted).
+        """
+        try:
+            logger.info("Refreshing BUP address gazetteer from the portal...")
+            division_id = f'MainContent_ddl{prefix}Division'
+            district_id = f'MainContent_ddl{prefix}District'
+            thana_id = f'MainContent_ddl{prefix}Thana'
+            
+            divisions = real_options(await self._read_options(division_id))
+            gazetteer.record_divisions(divisions)
+            for division_value in divisions:
+                before = await option_signature(self.page, district_id)
+                await self.page.select_option(f'select#{division_id}', value=division_value)
+                await wait_for_options_changed(self.page, district_id, before, "gazetteer_districts", self.waits)
+                districts = real_options(await self._read_options(district_id))
+                gazetteer.record_districts(division_value, districts)
+                
+                if not await self.page.query_selector(f'select#{thana_id}'):
+                    # Free-text thana layout: nothing more to index for this division
+                    continue
+                for district_value in districts:
+                    before = await option_signature(self.page, thana_id)
+                    await self.page.select_option(f'select#{district_id}', value=district_value)
+                    await wait_for_options_changed(self.page, thana_id, before, "gazetteer_thanas", self.waits)
+                    gazetteer.record_thanas(division_value, district_value, await self._read_options(thana_id))
+            
+            gazetteer.mark_refreshed()
+            stats = gazetteer.stats()
+            logger.info(f"Gazetteer refreshed: {stats}")
+            return {"success": True, "message": "Gazetteer refreshed", "stats": stats}
+            
+        except Exception as e:
+            logger.error(f"Gazetteer refresh error: {str(e)}")
+            return {"success": False, "message": f"Gazetteer refresh failed: {str(e)}"}
+    
     async def fill_present_address(self, address_data: Dict) -> Dict:
         """
         Fill present address with cascading dropdowns
@@ -501,58 +714,13 @@ class BUPAutomation:
         try:
             logger.info("Filling present address...")
             
-            # Division (MainContent_ddlPresentDivision) - Use JavaScript
-            division_label = DIVISION_MAPPING.get(address_data['present_division'].upper(), address_data['present_division'])
-            await self.page.evaluate(f'''
-                const select = document.getElementById('MainContent_ddlPresentDivision');
-                if (select) {{
-                    for (let option of select.options) {{
-                        if (option.text.includes('{division_label}')) {{
-                            select.value = option.value;
-                            select.dispatchEvent(new Event('change', {{ bubbles: true }}));
-                            break;
-                        }}
-                    }}
-                }}
-            ''')
-            logger.info(f"Selected Present Division: {division_label}")
-            await asyncio.sleep(4)  # Wait for district dropdown to populate
-            
-            # District (MainContent_ddlPresentDistrict) - Use JavaScript
-            await self.page.evaluate(f'''
-                const select = document.getElementById('MainContent_ddlPresentDistrict');
-                if (select) {{
-                    for (let option of select.options) {{
-                        if (option.text.includes('{address_data['present_district']}')) {{
-                            select.value = option.value;
-                            select.dispatchEvent(new Event('change', {{ bubbles: true }}));
-                            break;
-                        }}
-                    }}
-                }}
-            ''')
-            logger.info(f"Selected Present District: {address_data['present_district']}")
-            await asyncio.sleep(4)  # Wait for thana dropdown to populate
-            
-            # Thana/Upazila (MainContent_ddlPresentThana or text input)
-            try:
-                await self.page.evaluate(f'''
-                    const select = document.getElementById('MainContent_ddlPresentThana');
-                    if (select) {{
-                        for (let option of select.options) {{
-                            if (option.text.includes('{address_data['present_thana']}')) {{
-                                select.value = option.value;
-                                select.dispatchEvent(new Event('change', {{ bubbles: true }}));
-                                break;
-                            }}
-                        }}
-                    }}
-                ''')
-                logger.info(f"Selected Present Thana: {address_data['present_thana']}")
-            except:
-                # If dropdown doesn't exist, try text input
-                await self.page.fill('input#MainContent_txtPresentThana', address_data['present_thana'])
-                logger.info(f"Filled Present Thana: {address_data['present_thana']}")
+            # Division / District / Thana (MainContent_ddlPresent*) - selected by option value
+            await self._fill_address_dropdowns(
+                'Present',
+                address_data['present_division'],
+                address_data['present_district'],
+                address_data['present_thana']
+            )
             
             # Post Office (MainContent_txtPresentPostOffice) - optional
             if address_data.get('present_post_office'):
@@ -568,8 +736,6 @@ class BUPAutomation:
                 await self.page.fill('input#MainContent_txtPresentZIP', address_data['present_zip'])
                 logger.info(f"Filled Present ZIP: {address_data['present_zip']}")
             
-            await asyncio.sleep(2)
-            
             return {"success": True, "message": "Present address filled successfully"}
             
         except Exception as e:
@@ -588,64 +754,22 @@ class BUPAutomation:
                 # Check \"Same as Present Address\" checkbox (MainContent_chkSameAsPresent or similar)
                 try:
                     same_checkbox = await self.page.wait_for_selector('input[type="checkbox"][id*="Same"]', timeout=5000)
-                    await same_checkbox.click()
+                    await postback_after(
+                        self.page, same_checkbox.click, "same_as_present_postback", self.waits,
+                        trigger_selector='input[type="checkbox"][id*="Same"]'
+                    )
                     logger.info("Checked 'Same as Present Address'")
-                    await asyncio.sleep(1)
                     return {"success": True, "message": "Permanent address set to same as present"}
                 except:
                     logger.warning("Same as present checkbox not found, filling permanent address manually")
             
-            # Fill permanent address fields (similar to present address) - Use JavaScript
-            division_label = DIVISION_MAPPING.get(address_data.get('permanent_division', address_data['present_division']).upper(), 
-                                                   address_data.get('permanent_division', address_data['present_division']))
-            await self.page.evaluate(f'''
-                const select = document.getElementById('MainContent_ddlPermanentDivision');
-                if (select) {{
-                    for (let option of select.options) {{
-                        if (option.text.includes('{division_label}')) {{
-                            select.value = option.value;
-                            select.dispatchEvent(new Event('change', {{ bubbles: true }}));
-                            break;
-                        }}
-                    }}
-                }}
-            ''')
-            logger.info(f"Selected Permanent Division: {division_label}")
-            await asyncio.sleep(4)
-            
-            district_label = address_data.get('permanent_district', address_data['present_district'])
-            await self.page.evaluate(f'''
-                const select = document.getElementById('MainContent_ddlPermanentDistrict');
-                if (select) {{
-                    for (let option of select.options) {{
-                        if (option.text.includes('{district_label}')) {{
-                            select.value = option.value;
-                            select.dispatchEvent(new Event('change', {{ bubbles: true }}));
-                            break;
-                        }}
-                    }}
-                }}
-            ''')
-            logger.info(f"Selected Permanent District: {district_label}")
-            await asyncio.sleep(4)
-            
-            try:
-                thana_label = address_data.get('permanent_thana', address_data['present_thana'])
-                await self.page.evaluate(f'''
-                    const select = document.getElementById('MainContent_ddlPermanentThana');
-                    if (select) {{
-                        for (let option of select.options) {{
-                            if (option.text.includes('{thana_label}')) {{
-                                select.value = option.value;
-                                select.dispatchEvent(new Event('change', {{ bubbles: true }}));
-                                break;
-                            }}
-                        }}
-                    }}
-                ''')
-            except:
-                await self.page.fill('input#MainContent_txtPermanentThana', 
-                                    address_data.get('permanent_thana', address_data['present_thana']))
+            # Division / District / Thana (MainContent_ddlPermanent*) - selected by option value
+            await self._fill_address_dropdowns(
+                'Permanent',
+                address_data.get('permanent_division') or address_data['present_division'],
+                address_data.get('permanent_district') or address_data['present_district'],
+                address_data.get('permanent_thana') or address_data['present_thana']
+            )
             
             if address_data.get('permanent_post_office') or address_data.get('present_post_office'):
                 await self.page.fill('input#MainContent_txtPermanentPostOffice', 
@@ -658,8 +782,6 @@ class BUPAutomation:
                 await self.page.fill('input#MainContent_txtPermanentZIP', 
                                     address_data.get('permanent_zip', address_data.get('present_zip', '')))
             
-            await asyncio.sleep(2)
-            
             return {"success": True, "message": "Permanent address filled successfully"}
             
         except Exception as e:
@@ -676,9 +798,11 @@ class BUPAutomation:
             
             # Find photo file input (MainContent_fuPhoto or first file input)
             file_input = await self.page.wait_for_selector('input[type="file"]', timeout=10000)
-            await file_input.set_input_files(photo_path)
+            await postback_after(
+                self.page, lambda: file_input.set_input_files(photo_path), "photo_upload_postback", self.waits,
+                trigger_selector='input[type="file"]'
+            )
             logger.info("Photo uploaded successfully")
-            await asyncio.sleep(3)  # Wait for preview
             
             return {"success": True, "message": "Photo uploaded successfully"}
             
@@ -697,9 +821,11 @@ class BUPAutomation:
             # Find signature file input (usually second file input)
             all_file_inputs = await self.page.query_selector_all('input[type="file"]')
             if len(all_file_inputs) >= 2:
-                await all_file_inputs[1].set_input_files(signature_path)
+                await postback_after(
+                    self.page, lambda: all_file_inputs[1].set_input_files(signature_path), "signature_upload_postback",
+                    self.waits, trigger_selector='input[type="file"] >> nth=1'
+                )
                 logger.info("Signature uploaded successfully")
-                await asyncio.sleep(3)
                 return {"success": True, "message": "Signature uploaded successfully"}
             else:
                 raise Exception("Signature upload input not found")
@@ -718,12 +844,10 @@ class BUPAutomation:
             
             # Find and click final submit button
             submit_btn = await self.page.wait_for_selector('input[type="submit"][value*="Submit"], button:has-text("Submit")', timeout=10000)
-            await submit_btn.click()
-            logger.info("Clicked submit button")
             
             # Wait for submission processing
-            await asyncio.sleep(5)
-            await self.page.wait_for_load_state('networkidle', timeout=30000)
+            await postback_after(self.page, submit_btn.click, "submit_postback", self.waits, timeout=60000)
+            logger.info("Clicked submit button")
             
             return {"success": True, "message": "Application submitted successfully"}
             
@@ -818,11 +942,6 @@ class BUPAutomation:
             return {"success": False, "message": f"Document download failed: {str(e)}"}
     
     async def _capture_screenshot(self, stage: str):
-        """Capture screenshot on error"""
-        try:
-            screenshot_path = f"./uploads/logs/bup_error_{stage}_{int(asyncio.get_event_loop().time())}.png"
-            await self.page.screenshot(path=screenshot_path, full_page=True)
-            logger.info(f"Error screenshot saved: {screenshot_path}")
-            return screenshot_path
-        except:
-            return None
+        """Capture error artifacts (kept according to the artifact policy)"""
+        artifacts = await capture(self.page, f"bup_error_{stage}", error=True)
+        return artifacts["screenshot_path"]
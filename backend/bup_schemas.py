@@ -88,6 +88,7 @@ class BUPStatusResponse(BaseModel):
     stage_message: Optional[str]
     next_step: Optional[str]
     documents: Optional[dict]
+    captcha_url: Optional[str] = None
 
 
 class BUPPaymentURLResponse(BaseModel):
@@ -102,3 +103,9 @@ class BUPOTPSubmit(BaseModel):
     application_id: str
     job_id: str
     otp_code: str
+
+
+class BUPCaptchaSubmit(BaseModel):
+    """Schema for a relayed CAPTCHA solution"""
+    application_id: str
+    solution: str = Field(..., min_length=1)
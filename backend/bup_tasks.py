@@ -10,31 +10,106 @@ import asyncio
 if sys.platform == 'win32':
     asyncio.set_event_loop_policy(asyncio.WindowsProactorEventLoopPolicy())
 
-from typing import Dict
+from typing import Dict, Optional
 import logging
-from bup_rpa import BUPAutomation
+from config import get_settings
+from bup_http import create_bup_automation
+from bup_captcha import captcha_relay
 from database import SessionLocal
 import bup_crud
-from threading import Thread
+import queue_crud
+from job_scheduler import scheduler
+from session_store import paused_sessions
+from prewarm import prewarm_registry
+from job_queue import job_queue, QueueHandler
+from utils import generate_job_id
+from automation_runtime import runtime
+from datetime import datetime
 
+settings = get_settings()
 logger = logging.getLogger(__name__)
 
-# In-memory job tracking
+# In-memory job tracking (paused browser sessions live in session_store)
 active_bup_jobs: Dict[str, Dict] = {}
-payment_waiting_jobs: Dict[str, BUPAutomation] = {}
+
+
+# Stages in run order; a checkpoint after each is recorded on the job
+STAGES = [
+    "faculty",
+    "education_type",
+    "ssc_info",
+    "hsc_info",
+    "verification",
+    "personal_info",
+    "present_address",
+    "permanent_address",
+    "photo_upload",
+    "signature_upload",
+    "submission",
+]
+
+# Stages whose result the portal keeps server-side (the next page was posted
+# back), so a session snapshot taken after them can be resumed
+RESUMABLE_STAGES = {"faculty", "verification", "submission"}
+
+
+async def record_stage(db, automation, application_id: str, job_id: str, stage: str):
+    """Record a completed stage, with a resumable session snapshot where the portal allows one"""
+    snapshot = None
+    if stage in RESUMABLE_STAGES:
+        try:
+            snapshot = await automation.snapshot()
+            bup_crud.save_bup_checkpoint(db, application_id, job_id, stage, snapshot)
+        except Exception as e:
+            logger.warning(f"[{application_id}] Could not checkpoint {stage}: {str(e)}")
+    bup_crud.record_bup_stage(db, job_id, stage, snapshot)
+    active_bup_jobs[job_id]["stage"] = stage
+
+
+async def resume_from_checkpoint(db, automation, application_id: str) -> Optional[str]:
+    """
+    Restore the newest checkpoint whose portal session is still alive
+    Returns the checkpointed stage, or None to start over (automation left uninitialized)
+    """
+    for cp in bup_crud.get_bup_checkpoints(db, application_id, settings.bup_checkpoint_max_age_minutes):
+        try:
+            await automation.restore(cp.snapshot)
+            if await automation.probe(cp.snapshot["url"]):
+                logger.info(f"[{application_id}] Resuming from checkpoint after {cp.stage} (job {cp.job_id})")
+                return cp.stage
+            logger.info(f"[{application_id}] Portal session for checkpoint {cp.stage} has expired")
+        except Exception as e:
+            logger.warning(f"[{application_id}] Could not restore checkpoint {cp.stage}: {str(e)}")
+        await automation.close()
+    
+    # Never submit the same application twice
+    if bup_crud.was_bup_application_submitted(db, application_id):
+        raise Exception(
+            "Application was already submitted but its portal session has expired; "
+            "complete payment from the BUP portal"
+        )
+    return None
 
 
 async def run_bup_automation_async(application_id: str, job_id: str):
     """
     Main BUP automation orchestrator (async version)
-    Runs the complete BUP admission flow
+    Runs the complete BUP admission flow, resuming a failed earlier attempt
+    from its last checkpoint the portal still accepts
     """
     db = SessionLocal()
-    automation = BUPAutomation()
+    automation = create_bup_automation()
     
     try:
-        # Store automation instance for payment resume
-        payment_waiting_jobs[job_id] = automation
+        previous_job = bup_crud.get_previous_bup_job(db, application_id, job_id)
+        bup_crud.create_bup_job(db, {
+            "id": job_id,
+            "application_id": application_id,
+            "status": "running",
+            "stages_completed": [],
+            "retry_count": (previous_job.retry_count or 0) + 1 if previous_job else 0,
+            "started_at": datetime.utcnow()
+        })
         active_bup_jobs[job_id] = {
             "application_id": application_id,
             "status": "running",
@@ -46,179 +121,232 @@ async def run_bup_automation_async(application_id: str, job_id: str):
         if not app:
             raise Exception("Application not found")
         
-        # Initialize browser
-        logger.info(f"[{application_id}] Initializing browser...")
-        await automation.initialize()
-        bup_crud.update_bup_application_status(
-            db, application_id, "running", "initialization", "Initializing browser..."
-        )
+        # Initialize browser, or restore the session of a failed attempt
+        resumed_stage = None
+        if previous_job and previous_job.status == "failed":
+            resumed_stage = await resume_from_checkpoint(db, automation, application_id)
+        if resumed_stage:
+            for stage in STAGES[:STAGES.index(resumed_stage) + 1]:
+                bup_crud.record_bup_stage(db, job_id, stage)
+            bup_crud.update_bup_application_status(
+                db, application_id, "running", resumed_stage, f"Resuming after {resumed_stage}..."
+            )
+        else:
+            bup_crud.clear_bup_checkpoints(db, application_id)
+            prewarmed = await prewarm_registry.claim(application_id, "bup")
+            if prewarmed:
+                automation = prewarmed
+            else:
+                logger.info(f"[{application_id}] Initializing browser...")
+                await automation.initialize()
+            bup_crud.update_bup_application_status(
+                db, application_id, "running", "initialization", "Initializing browser..."
+            )
+        resume_index = STAGES.index(resumed_stage) + 1 if resumed_stage else 0
         
-        # Step 1: Navigate to admission page and select faculty
-        logger.info(f"[{application_id}] Navigating to BUP admission page...")
-        bup_crud.update_bup_application_status(
-            db, application_id, "running", "navigation", f"Loading BUP admission page and selecting {app.faculty}..."
-        )
+        def pending(stage: str) -> bool:
+            return STAGES.index(stage) >= resume_index
         
-        nav_result = await automation.navigate_and_select_faculty(app.faculty)
-        if not nav_result["success"]:
-            raise Exception(f"Navigation/Faculty selection failed: {nav_result['message']}")
+        async def checkpoint(stage: str):
+            await record_stage(db, automation, application_id, job_id, stage)
+            if runtime.draining and stage in RESUMABLE_STAGES:
+                # Shutting down: stop here; the retry resumes from this checkpoint
+                logger.info(f"[{application_id}] Stopping at checkpoint {stage} for shutdown")
+                raise asyncio.CancelledError()
         
-        # Step 2: Select education type (SSC/HSC)
-        logger.info(f"[{application_id}] Selecting education type...")
-        bup_crud.update_bup_application_status(
-            db, application_id, "running", "education_type", "Selecting SSC/HSC education type..."
-        )
+        # Step 1: Navigate to admission page and select faculty
+        if pending("faculty"):
+            logger.info(f"[{application_id}] Navigating to BUP admission page...")
+            bup_crud.update_bup_application_status(
+                db, application_id, "running", "navigation", f"Loading BUP admission page and selecting {app.faculty}..."
+            )
+            
+            nav_result = await automation.navigate_and_select_faculty(app.faculty)
+            if not nav_result["success"]:
+                raise Exception(f"Navigation/Faculty selection failed: {nav_result['message']}")
+            await checkpoint("faculty")
         
-        edu_type_result = await automation.select_education_type_ssc_hsc()
-        if not edu_type_result["success"]:
-            raise Exception(f"Education type selection failed: {edu_type_result['message']}")
+        # Step 2: Select education type (SSC/HSC)
+        if pending("education_type"):
+            logger.info(f"[{application_id}] Selecting education type...")
+            bup_crud.update_bup_application_status(
+                db, application_id, "running", "education_type", "Selecting SSC/HSC education type..."
+            )
+            
+            edu_type_result = await automation.select_education_type_ssc_hsc()
+            if not edu_type_result["success"]:
+                raise Exception(f"Education type selection failed: {edu_type_result['message']}")
+            await checkpoint("education_type")
         
         # Step 4: Fill SSC information
-        logger.info(f"[{application_id}] Filling SSC information...")
-        bup_crud.update_bup_application_status(
-            db, application_id, "running", "ssc_info", "Filling SSC examination details..."
-        )
-        
-        ssc_data = {
-            "ssc_examination": app.ssc_examination,
-            "ssc_roll": app.ssc_roll,
-            "ssc_registration": app.ssc_registration,
-            "ssc_passing_year": app.ssc_passing_year,
-            "ssc_board": app.ssc_board
-        }
-        
-        ssc_result = await automation.fill_ssc_information(ssc_data)
-        if not ssc_result["success"]:
-            raise Exception(f"SSC information failed: {ssc_result['message']}")
+        if pending("ssc_info"):
+            logger.info(f"[{application_id}] Filling SSC information...")
+            bup_crud.update_bup_application_status(
+                db, application_id, "running", "ssc_info", "Filling SSC examination details..."
+            )
+            
+            ssc_data = {
+                "ssc_examination": app.ssc_examination,
+                "ssc_roll": app.ssc_roll,
+                "ssc_registration": app.ssc_registration,
+                "ssc_passing_year": app.ssc_passing_year,
+                "ssc_board": app.ssc_board
+            }
+            
+            ssc_result = await automation.fill_ssc_information(ssc_data)
+            if not ssc_result["success"]:
+                raise Exception(f"SSC information failed: {ssc_result['message']}")
+            await checkpoint("ssc_info")
         
         # Step 5: Fill HSC information
-        logger.info(f"[{application_id}] Filling HSC information...")
-        bup_crud.update_bup_application_status(
-            db, application_id, "running", "hsc_info", "Filling HSC examination details..."
-        )
-        
-        hsc_data = {
-            "hsc_examination": app.hsc_examination,
-            "hsc_roll": app.hsc_roll,
-            "hsc_registration": app.hsc_registration,
-            "hsc_passing_year": app.hsc_passing_year,
-            "hsc_board": app.hsc_board
-        }
-        
-        hsc_result = await automation.fill_hsc_information(hsc_data)
-        if not hsc_result["success"]:
-            raise Exception(f"HSC information failed: {hsc_result['message']}")
+        if pending("hsc_info"):
+            logger.info(f"[{application_id}] Filling HSC information...")
+            bup_crud.update_bup_application_status(
+                db, application_id, "running", "hsc_info", "Filling HSC examination details..."
+            )
+            
+            hsc_data = {
+                "hsc_examination": app.hsc_examination,
+                "hsc_roll": app.hsc_roll,
+                "hsc_registration": app.hsc_registration,
+                "hsc_passing_year": app.hsc_passing_year,
+                "hsc_board": app.hsc_board
+            }
+            
+            hsc_result = await automation.fill_hsc_information(hsc_data)
+            if not hsc_result["success"]:
+                raise Exception(f"HSC information failed: {hsc_result['message']}")
+            await checkpoint("hsc_info")
         
         # Step 5.5: Click Verify Information
-        logger.info(f"[{application_id}] Verifying SSC/HSC information...")
-        bup_crud.update_bup_application_status(
-            db, application_id, "running", "verification", "Verifying education board information..."
-        )
-        
-        verify_result = await automation.click_verify_information()
-        if not verify_result["success"]:
-            raise Exception(f"Verification failed: {verify_result['message']}")
-        
-        # Step 6: Fill personal information
-        logger.info(f"[{application_id}] Filling personal information...")
-        bup_crud.update_bup_application_status(
-            db, application_id, "running", "personal_info", "Filling personal details..."
-        )
-        
-        personal_data = {
-            "candidate_name": app.candidate_name,
-            "father_name": app.father_name,
-            "mother_name": app.mother_name,
-            "date_of_birth": app.date_of_birth,
-            "gender": app.gender,
-            "nationality": app.nationality,
-            "religion": app.religion,
-            "mobile_number": app.mobile_number,
-            "email": app.email,
-            "nid_birth_cert": app.nid_birth_cert
-        }
-        
-        personal_result = await automation.fill_personal_information(personal_data)
-        if not personal_result["success"]:
-            raise Exception(f"Personal information failed: {personal_result['message']}")
-        
-        # Step 7: Fill present address
-        logger.info(f"[{application_id}] Filling present address...")
-        bup_crud.update_bup_application_status(
-            db, application_id, "running", "present_address", "Filling present address..."
-        )
-        
-        present_address_data = {
-            "present_division": app.present_division,
-            "present_district": app.present_district,
-            "present_thana": app.present_thana,
-            "present_post_office": app.present_post_office,
-            "present_village": app.present_village,
-            "present_zip": app.present_zip
-        }
-        
-        present_address_result = await automation.fill_present_address(present_address_data)
-        if not present_address_result["success"]:
-            raise Exception(f"Present address failed: {present_address_result['message']}")
-        
-        # Step 8: Fill permanent address
-        logger.info(f"[{application_id}] Filling permanent address...")
-        bup_crud.update_bup_application_status(
-            db, application_id, "running", "permanent_address", "Filling permanent address..."
-        )
-        
-        if app.same_as_present:
-            permanent_address_result = await automation.handle_permanent_address(present_address_data, same_as_present=True)
-        else:
-            permanent_address_data = {
-                "permanent_division": app.permanent_division,
-                "permanent_district": app.permanent_district,
-                "permanent_thana": app.permanent_thana,
-                "permanent_post_office": app.permanent_post_office,
-                "permanent_village": app.permanent_village,
-                "permanent_zip": app.permanent_zip,
+        if pending("verification"):
+            logger.info(f"[{application_id}] Verifying SSC/HSC information...")
+            bup_crud.update_bup_application_status(
+                db, application_id, "running", "verification", "Verifying education board information..."
+            )
+            
+            def on_captcha(challenge):
+                active_bup_jobs[job_id]["stage"] = "captcha_required"
+                bup_crud.update_bup_application_status(
+                    db, application_id, "captcha_required", "captcha",
+                    "CAPTCHA detected. Please solve it to continue."
+                )
+            
+            verify_result = await automation.click_verify_information(application_id, on_captcha)
+            if not verify_result["success"]:
+                raise Exception(f"Verification failed: {verify_result['message']}")
+            await checkpoint("verification")
+        
+        # Steps 6-10 fill one form that is only posted on submit, so they are
+        # redone together when resuming from the verification checkpoint
+        if pending("personal_info"):
+            # Step 6: Fill personal information
+            logger.info(f"[{application_id}] Filling personal information...")
+            bup_crud.update_bup_application_status(
+                db, application_id, "running", "personal_info", "Filling personal details..."
+            )
+            
+            personal_data = {
+                "candidate_name": app.candidate_name,
+                "father_name": app.father_name,
+                "mother_name": app.mother_name,
+                "date_of_birth": app.date_of_birth,
+                "gender": app.gender,
+                "nationality": app.nationality,
+                "religion": app.religion,
+                "mobile_number": app.mobile_number,
+                "email": app.email,
+                "nid_birth_cert": app.nid_birth_cert
+            }
+            
+            personal_result = await automation.fill_personal_information(personal_data)
+            if not personal_result["success"]:
+                raise Exception(f"Personal information failed: {personal_result['message']}")
+            await checkpoint("personal_info")
+            
+            # Step 7: Fill present address
+            logger.info(f"[{application_id}] Filling present address...")
+            bup_crud.update_bup_application_status(
+                db, application_id, "running", "present_address", "Filling present address..."
+            )
+            
+            present_address_data = {
                 "present_division": app.present_division,
                 "present_district": app.present_district,
                 "present_thana": app.present_thana,
+                "present_post_office": app.present_post_office,
                 "present_village": app.present_village,
                 "present_zip": app.present_zip
             }
-            permanent_address_result = await automation.handle_permanent_address(permanent_address_data, same_as_present=False)
-        
-        if not permanent_address_result["success"]:
-            raise Exception(f"Permanent address failed: {permanent_address_result['message']}")
-        
-        # Step 9: Upload photo
-        if app.photo_path:
-            logger.info(f"[{application_id}] Uploading photo...")
+            
+            present_address_result = await automation.fill_present_address(present_address_data)
+            if not present_address_result["success"]:
+                raise Exception(f"Present address failed: {present_address_result['message']}")
+            await checkpoint("present_address")
+            
+            # Step 8: Fill permanent address
+            logger.info(f"[{application_id}] Filling permanent address...")
             bup_crud.update_bup_application_status(
-                db, application_id, "running", "photo_upload", "Uploading candidate photo..."
+                db, application_id, "running", "permanent_address", "Filling permanent address..."
             )
             
-            photo_result = await automation.upload_photo(app.photo_path)
-            if not photo_result["success"]:
-                logger.warning(f"Photo upload failed: {photo_result['message']}")
+            if app.same_as_present:
+                permanent_address_result = await automation.handle_permanent_address(present_address_data, same_as_present=True)
+            else:
+                permanent_address_data = {
+                    "permanent_division": app.permanent_division,
+                    "permanent_district": app.permanent_district,
+                    "permanent_thana": app.permanent_thana,
+                    "permanent_post_office": app.permanent_post_office,
+                    "permanent_village": app.permanent_village,
+                    "permanent_zip": app.permanent_zip,
+                    "present_division": app.present_division,
+                    "present_district": app.present_district,
+                    "present_thana": app.present_thana,
+                    "present_village": app.present_village,
+                    "present_zip": app.present_zip
+                }
+                permanent_address_result = await automation.handle_permanent_address(permanent_address_data, same_as_present=False)
+            
+            if not permanent_address_result["success"]:
+                raise Exception(f"Permanent address failed: {permanent_address_result['message']}")
+            await checkpoint("permanent_address")
+            
+            # Step 9: Upload photo
+            if app.photo_path:
+                logger.info(f"[{application_id}] Uploading photo...")
+                bup_crud.update_bup_application_status(
+                    db, application_id, "running", "photo_upload", "Uploading candidate photo..."
+                )
+                
+                photo_result = await automation.upload_photo(app.photo_path)
+                if not photo_result["success"]:
+                    logger.warning(f"Photo upload failed: {photo_result['message']}")
+            await checkpoint("photo_upload")
+            
+            # Step 10: Upload signature
+            if app.signature_path:
+                logger.info(f"[{application_id}] Uploading signature...")
+                bup_crud.update_bup_application_status(
+                    db, application_id, "running", "signature_upload", "Uploading candidate signature..."
+                )
+                
+                signature_result = await automation.upload_signature(app.signature_path)
+                if not signature_result["success"]:
+                    logger.warning(f"Signature upload failed: {signature_result['message']}")
+            await checkpoint("signature_upload")
         
-        # Step 10: Upload signature
-        if app.signature_path:
-            logger.info(f"[{application_id}] Uploading signature...")
+        # Step 11: Submit application
+        if pending("submission"):
+            logger.info(f"[{application_id}] Submitting application...")
             bup_crud.update_bup_application_status(
-                db, application_id, "running", "signature_upload", "Uploading candidate signature..."
+                db, application_id, "running", "submission", "Submitting application form..."
             )
             
-            signature_result = await automation.upload_signature(app.signature_path)
-            if not signature_result["success"]:
-                logger.warning(f"Signature upload failed: {signature_result['message']}")
-        
-        # Step 11: Submit application
-        logger.info(f"[{application_id}] Submitting application...")
-        bup_crud.update_bup_application_status(
-            db, application_id, "running", "submission", "Submitting application form..."
-        )
-        
-        submit_result = await automation.submit_application()
-        if not submit_result["success"]:
-            raise Exception(f"Application submission failed: {submit_result['message']}")
+            submit_result = await automation.submit_application()
+            if not submit_result["success"]:
+                raise Exception(f"Application submission failed: {submit_result['message']}")
+            await checkpoint("submission")
         
         # Step 12: Get payment info
         logger.info(f"[{application_id}] Getting payment information...")
@@ -237,10 +365,18 @@ async def run_bup_automation_async(application_id: str, job_id: str):
         
         # Pause automation - wait for payment
         active_bup_jobs[job_id]["stage"] = "payment_waiting"
+        active_bup_jobs[job_id]["waits"] = automation.waits.summary()
+        if automation.request_stats:
+            active_bup_jobs[job_id]["requests"] = automation.request_stats.summary()
+        logger.info(f"[{application_id}] Portal readiness waits: {automation.waits.summary()}")
         logger.info(f"[{application_id}] Automation paused, waiting for payment completion...")
         
-        # Keep browser alive for document download after payment
+        # Snapshot the session for document download after payment; the context is released once idle
+        await paused_sessions.park(job_id, application_id, "bup", automation, "payment")
         
+    except asyncio.CancelledError:
+        await automation.close()
+        raise
     except Exception as e:
         logger.error(f"[{application_id}] Automation error: {str(e)}")
         bup_crud.update_bup_application_status(
@@ -249,11 +385,11 @@ async def run_bup_automation_async(application_id: str, job_id: str):
         active_bup_jobs[job_id] = {
             "application_id": application_id,
             "status": "failed",
-            "error": str(e)
+            "error": str(e),
+            "waits": automation.waits.summary()
         }
+        bup_crud.update_bup_job_status(db, job_id, "failed", "error", str(e))
         await automation.close()
-        if job_id in payment_waiting_jobs:
-            del payment_waiting_jobs[job_id]
     finally:
         db.close()
 
@@ -264,14 +400,16 @@ async def complete_bup_automation_after_payment(application_id: str, job_id: str
     Download documents
     """
     db = SessionLocal()
+    automation = None
     
     try:
-        # Get the paused automation instance
-        if job_id not in payment_waiting_jobs:
+        # Get the paused automation instance (restored from its snapshot if hibernated)
+        try:
+            automation = await paused_sessions.resume(job_id, "bup")
+        except Exception:
             logger.warning(f"[{application_id}] Job not found, may have already completed")
             return
-        
-        automation = payment_waiting_jobs[job_id]
+        bup_crud.update_bup_job_status(db, job_id, "running", "downloading")
         
         # Step 13: Download documents
         logger.info(f"[{application_id}] Downloading documents...")
@@ -295,7 +433,8 @@ async def complete_bup_automation_after_payment(application_id: str, job_id: str
                 "Application completed successfully! Documents downloaded."
             )
             
-            active_bup_jobs[job_id]["status"] = "completed"
+            if job_id in active_bup_jobs:
+                active_bup_jobs[job_id]["status"] = "completed"
         else:
             logger.warning(f"[{application_id}] Document download failed: {download_result['message']}")
             bup_crud.update_bup_application_status(
@@ -304,34 +443,173 @@ async def complete_bup_automation_after_payment(application_id: str, job_id: str
             )
         
         # Clean up
+        bup_crud.clear_bup_checkpoints(db, application_id)
+        bup_crud.update_bup_job_status(db, job_id, "completed", "completed")
         await automation.close()
-        del payment_waiting_jobs[job_id]
         
+    except asyncio.CancelledError:
+        if automation:
+            await automation.close()
+        raise
     except Exception as e:
         logger.error(f"[{application_id}] Payment completion error: {str(e)}")
         bup_crud.update_bup_application_status(
             db, application_id, "failed", "error", f"Document download failed: {str(e)}"
         )
-        if job_id in payment_waiting_jobs:
-            automation = payment_waiting_jobs[job_id]
+        bup_crud.update_bup_job_status(db, job_id, "failed", "error", str(e))
+        if automation:
             await automation.close()
-            del payment_waiting_jobs[job_id]
     finally:
         db.close()
 
 
-def run_bup_automation(application_id: str, job_id: str):
+def start_bup_automation_background(application_id: str, job_id: str) -> str:
+    """
+    Queue BUP automation; it starts on the automation loop once a worker slot is free.
+    Returns the job id in charge, which is an earlier one if the application already has a run.
+    """
+    return job_queue.enqueue("bup", application_id, job_id)
+
+
+def _retry_abandoned_job(db, application_id: str, old_job_id: str, new_job_id: str):
+    # The retry resumes from the abandoned job's checkpoints
+    bup_crud.update_bup_job_status(db, old_job_id, "failed", "error", "Worker stopped responding")
+    bup_crud.update_bup_job_id(db, application_id, new_job_id)
+
+
+def _fail_abandoned_job(db, application_id: str, job_id: str, message: str):
+    bup_crud.update_bup_job_status(db, job_id, "failed", "error", message)
+    bup_crud.update_bup_application_status(db, application_id, "failed", "error", f"Automation failed: {message}")
+
+
+# Statuses of an application whose job was in progress when the process stopped
+IN_PROGRESS_STATUSES = ("queued", "running", "captcha_required", "payment_pending", "downloading")
+
+
+def _recover_stuck_jobs(db) -> Dict[str, int]:
+    """Startup: requeue (resuming from checkpoints), re-park or fail applications left mid-run by a restart"""
+    outcomes: Dict[str, int] = {}
+    for app in bup_crud.get_bup_applications_by_status(db, IN_PROGRESS_STATUSES):
+        job = bup_crud.get_bup_job(db, app.job_id) if app.job_id else None
+        paused_for = job.paused_for if job and job.storage_state else None
+        outcome = job_queue.recover_job(
+            db, "bup", app.id, app.job_id, paused_for, payment_done=app.payment_status == "completed"
+        )
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+    return outcomes
+
+
+job_queue.register(
+    "bup", QueueHandler(
+        run_bup_automation_async, _retry_abandoned_job, _fail_abandoned_job,
+        bup_crud.mark_bup_application_queued, _recover_stuck_jobs
+    )
+)
+
+
+async def _cancel_job(application_id: str, job_id: str):
+    """Runs after the job's task (if any) was cancelled: drop its queue item, CAPTCHA and paused session"""
+    await paused_sessions.discard(job_id)
+    captcha_relay.close(application_id)
+    db = SessionLocal()
+    try:
+        queue_crud.cancel_queued_job(db, job_id)
+        bup_crud.update_bup_job_status(db, job_id, "cancelled", "cancelled", "Automation cancelled")
+        bup_crud.update_bup_application_status(db, application_id, "cancelled", "cancelled", "Automation cancelled")
+    finally:
+        db.close()
+    active_bup_jobs.pop(job_id, None)
+    logger.info(f"[{application_id}] BUP automation cancelled (job {job_id})")
+
+
+runtime.on("bup", "payment_verified", complete_bup_automation_after_payment)
+runtime.on("bup", "cancel", _cancel_job)
+
+
+# Job id of the gazetteer refresh in progress, if any (one at a time)
+_gazetteer_refresh: Optional[str] = None
+
+GAZETTEER_CAPTCHA_PREFIX = "gazetteer:"
+
+
+async def refresh_gazetteer_async(application_id: str):
+    """
+    Maintenance job: walk every division and district of the portal's address
+    dropdowns into the gazetteer. The address form is only shown after SSC/HSC
+    verification, so it is reached in a portal session of its own using an
+    application's exam details; nothing is submitted and the application's
+    status is left alone. A CAPTCHA is relayed under "gazetteer:<application_id>".
+    """
+    global _gazetteer_refresh
+    db = SessionLocal()
+    automation = create_bup_automation()
+    try:
+        app = bup_crud.get_bup_application(db, application_id)
+        if not app:
+            raise Exception("Application not found")
+        
+        await automation.initialize()
+        ssc_data = {
+            "ssc_examination": app.ssc_examination,
+            "ssc_roll": app.ssc_roll,
+            "ssc_registration": app.ssc_registration,
+            "ssc_passing_year": app.ssc_passing_year,
+            "ssc_board": app.ssc_board
+        }
+        hsc_data = {
+            "hsc_examination": app.hsc_examination,
+            "hsc_roll": app.hsc_roll,
+            "hsc_registration": app.hsc_registration,
+            "hsc_passing_year": app.hsc_passing_year,
+            "hsc_board": app.hsc_board
+        }
+        steps = (
+            ("Faculty selection", lambda: automation.navigate_and_select_faculty(app.faculty)),
+            ("Education type selection", automation.select_education_type_ssc_hsc),
+            ("SSC information", lambda: automation.fill_ssc_information(ssc_data)),
+            ("HSC information", lambda: automation.fill_hsc_information(hsc_data)),
+            ("Verification", lambda: automation.click_verify_information(f"{GAZETTEER_CAPTCHA_PREFIX}{application_id}")),
+            ("Gazetteer refresh", automation.harvest_address_options)
+        )
+        for step, run_step in steps:
+            result = await run_step()
+            if not result["success"]:
+                raise Exception(f"{step} failed: {result['message']}")
+        logger.info(f"Gazetteer refreshed via application {application_id}: {result['stats']}")
+        
+    except Exception as e:
+        logger.error(f"Gazetteer refresh failed: {str(e)}")
+    finally:
+        _gazetteer_refresh = None
+        await automation.close()
+        db.close()
+
+
+def start_gazetteer_refresh(application_id: str) -> Optional[str]:
+    """
+    Start a gazetteer refresh on the next free worker slot (call from any thread)
+    Returns its job id, or None if a refresh is already running
+    """
+    global _gazetteer_refresh
+    if _gazetteer_refresh:
+        return None
+    _gazetteer_refresh = f"gazetteer-{generate_job_id()}"
+    scheduler.submit(_gazetteer_refresh, refresh_gazetteer_async(application_id))
+    logger.info(f"Queued gazetteer refresh {_gazetteer_refresh} using application {application_id}")
+    return _gazetteer_refresh
+
+
+def wake_bup_automation_after_payment(application_id: str, job_id: str):
     """
-    Wrapper to run async automation in a thread
+    Tell the BUP job its payment was verified; it resumes on the next free worker slot of the worker holding it
     """
-    asyncio.run(run_bup_automation_async(application_id, job_id))
+    job_queue.send("bup", application_id, job_id, "payment_verified")
+    logger.info(f"Sent payment confirmation to BUP job {job_id} for application {application_id}")
 
 
-def start_bup_automation_background(application_id: str, job_id: str):
+def cancel_bup_automation(application_id: str, job_id: str):
     """
-    Start BUP automation in background thread
+    Cancel a BUP job whether it is queued, running or parked, on whichever worker holds it
     """
-    thread = Thread(target=run_bup_automation, args=(application_id, job_id))
-    thread.daemon = True
-    thread.start()
-    logger.info(f"Started BUP automation thread for application {application_id}")
+    job_queue.send("bup", application_id, job_id, "cancel")
+    logger.info(f"Sent cancel to BUP job {job_id} for application {application_id}")
@@ -0,0 +1,213 @@
+"""
+BUP Readiness Conditions
+Event-driven waits for the BUP ASP.NET WebForms portal
+
+Each wait returns as soon as the portal is ready instead of sleeping for a
+fixed time, and reports how long it actually took to a WaitRecorder.
+"""
+
+import asyncio
+import time
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional
+from urllib.parse import urlparse
+from playwright.async_api import Page, Response, TimeoutError as PlaywrightTimeoutError
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT = 30000  # ms
+
+
+class WaitRecorder:
+    """Collects the duration and outcome of every readiness wait in a run"""
+
+    def __init__(self):
+        self.records: List[Dict] = []
+
+    def record(self, name: str, started: float, satisfied: bool):
+        elapsed = time.monotonic() - started
+        self.records.append({"name": name, "elapsed": round(elapsed, 3), "satisfied": satisfied})
+        if satisfied:
+            logger.info(f"Wait '{name}' ready after {elapsed:.2f}s")
+        else:
+            logger.warning(f"Wait '{name}' timed out after {elapsed:.2f}s")
+
+    def summary(self) -> Dict:
+        """Total waiting time and the slowest waits"""
+        total = sum(r["elapsed"] for r in self.records)
+        slowest = sorted(self.records, key=lambda r: r["elapsed"], reverse=True)[:5]
+        return {
+            "waits": len(self.records),
+            "total_seconds": round(total, 3),
+            "timeouts": sum(1 for r in self.records if not r["satisfied"]),
+            "slowest": slowest
+        }
+
+
+def _record(recorder: Optional[WaitRecorder], name: str, started: float, satisfied: bool):
+    if recorder:
+        recorder.record(name, started, satisfied)
+
+
+async def triggers_postback(page: Page, selector: str) -> bool:
+    """True if the control is wired to __doPostBack (ASP.NET AutoPostBack)"""
+    try:
+        return await page.eval_on_selector(
+            selector,
+            '''el => {
+                const handlers = [el.getAttribute('onchange'), el.getAttribute('onclick'), el.getAttribute('href')];
+                return handlers.some(h => h && h.includes('__doPostBack'));
+            }'''
+        )
+    except Exception:
+        return False
+
+
+async def wait_for_async_postback_idle(page: Page, timeout: int = DEFAULT_TIMEOUT):
+    """Wait until the ASP.NET AJAX PageRequestManager has finished applying an UpdatePanel response"""
+    await page.wait_for_function(
+        '''() => {
+            const prm = window.Sys && Sys.WebForms && Sys.WebForms.PageRequestManager;
+            return !prm || !prm.getInstance().get_isInAsyncPostBack();
+        }''',
+        timeout=timeout
+    )
+
+
+async def postback_after(
+    page: Page,
+    action: Callable[[], Awaitable],
+    name: str,
+    recorder: Optional[WaitRecorder] = None,
+    trigger_selector: Optional[str] = None,
+    timeout: int = DEFAULT_TIMEOUT
+) -> bool:
+    """
+    Run `action` and wait for the postback it causes (full page POST or UpdatePanel XHR)
+
+    If `trigger_selector` is given and that control does not post back, the
+    action is run without waiting. Returns True if the postback completed.
+
+    A full-page postback is only over once the new document has been
+    committed: until then the old document still answers load-state checks.
+    """
+    started = time.monotonic()
+    if trigger_selector and not await triggers_postback(page, trigger_selector):
+        await action()
+        _record(recorder, name, started, True)
+        return True
+
+    host = urlparse(page.url).netloc
+
+    def is_postback(response: Response) -> bool:
+        request = response.request
+        return (
+            request.method == 'POST'
+            and request.resource_type in ('document', 'xhr', 'fetch')
+            and urlparse(response.url).netloc == host
+        )
+
+    # Whether the postback replaces the document is only known from its
+    # response, so the main frame's navigation is watched from the start
+    navigation = asyncio.ensure_future(page.wait_for_event(
+        'framenavigated', predicate=lambda frame: frame == page.main_frame, timeout=timeout
+    ))
+    try:
+        async with page.expect_response(is_postback, timeout=timeout) as response_info:
+            await action()
+        response = await response_info.value
+        if response.request.resource_type == 'document':
+            await navigation
+            await page.wait_for_load_state('domcontentloaded', timeout=timeout)
+        else:
+            await wait_for_async_postback_idle(page, timeout=timeout)
+        _record(recorder, name, started, True)
+        return True
+    except PlaywrightTimeoutError:
+        _record(recorder, name, started, False)
+        return False
+    finally:
+        if not navigation.done():
+            navigation.cancel()
+        await asyncio.gather(navigation, return_exceptions=True)
+
+
+async def option_signature(page: Page, select_id: str) -> str:
+    """Snapshot of a dropdown's option values, used to detect a cascade refresh"""
+    return await page.evaluate(
+        '''id => {
+            const select = document.getElementById(id);
+            return select ? Array.from(select.options).map(o => o.value).join('|') : '';
+        }''',
+        select_id
+    )
+
+
+async def wait_for_options_changed(
+    page: Page,
+    select_id: str,
+    before: str,
+    name: str,
+    recorder: Optional[WaitRecorder] = None,
+    timeout: int = DEFAULT_TIMEOUT
+) -> bool:
+    """Wait until a dropdown's options differ from `before` (e.g. districts reloaded for a new division)"""
+    started = time.monotonic()
+    try:
+        await page.wait_for_function(
+            '''([id, before]) => {
+                const select = document.getElementById(id);
+                if (!select || select.options.length < 2) return false;
+                return Array.from(select.options).map(o => o.value).join('|') !== before;
+            }''',
+            arg=[select_id, before],
+            timeout=timeout
+        )
+        _record(recorder, name, started, True)
+        return True
+    except PlaywrightTimeoutError:
+        _record(recorder, name, started, False)
+        return False
+
+
+async def wait_for_enabled(
+    page: Page,
+    selector: str,
+    name: str,
+    recorder: Optional[WaitRecorder] = None,
+    timeout: int = DEFAULT_TIMEOUT
+) -> bool:
+    """Wait until the element exists, is visible and is not disabled"""
+    started = time.monotonic()
+    try:
+        await page.wait_for_function(
+            '''sel => {
+                const el = document.querySelector(sel);
+                return !!el && !el.disabled && el.offsetParent !== null;
+            }''',
+            arg=selector,
+            timeout=timeout
+        )
+        _record(recorder, name, started, True)
+        return True
+    except PlaywrightTimeoutError:
+        _record(recorder, name, started, False)
+        return False
+
+
+async def wait_for_visible(
+    page: Page,
+    selector: str,
+    name: str,
+    recorder: Optional[WaitRecorder] = None,
+    timeout: int = DEFAULT_TIMEOUT
+) -> bool:
+    """Wait until any element matching the selector is visible"""
+    started = time.monotonic()
+    try:
+        await page.wait_for_selector(selector, state='visible', timeout=timeout)
+        _record(recorder, name, started, True)
+        return True
+    except PlaywrightTimeoutError:
+        _record(recorder, name, started, False)
+        return False
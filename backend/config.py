@@ -1,5 +1,7 @@
 from pydantic_settings import BaseSettings
 from functools import lru_cache
+from datetime import datetime
+from typing import Dict, Optional
 
 
 class Settings(BaseSettings):
@@ -21,6 +23,112 @@ class Settings(BaseSettings):
     frontend_url: str = "http://localhost:5173"
     backend_url: str = "http://localhost:8000"
     
+    # Photo/signature uploads
+    upload_max_image_bytes: int = 10 * 1024 * 1024  # Photos/signatures larger than this are rejected unread
+    upload_max_image_pixels: int = 50_000_000  # Decompression-bomb cap, checked before decoding
+    
+    # Image processing pool: worker processes (0 = one per CPU), tasks that may
+    # wait beyond those before uploads get a 503, and per-task timeout in seconds
+    image_workers: int = 0
+    image_queue_depth: int = 16
+    image_task_timeout: float = 20.0
+    
+    # Processed image store (content-addressed, shared by DU and BUP) and its size limit
+    image_store_dir: str = "./uploads/images"
+    image_store_max_bytes: int = 500 * 1024 * 1024
+    
+    # Browser Pool
+    browser_pool_max_browsers: int = 2
+    browser_pool_contexts_per_browser: int = 4
+    browser_pool_restart_after: int = 50  # Recycle a browser after serving this many contexts
+    browser_pool_health_interval: int = 60  # Seconds between health checks (0 disables)
+    
+    # Jobs actively driving a browser at once (jobs waiting on a human don't count)
+    automation_max_workers: int = 8
+    
+    # Durable job queue: seconds a claimed run stays hidden without a heartbeat,
+    # attempts before giving up on runs whose worker died, and the poll interval
+    job_queue_visibility_timeout: int = 120
+    job_queue_max_attempts: int = 3
+    job_queue_poll_interval: float = 2.0
+    
+    # Restarts: reconcile applications left mid-run on startup, and on shutdown
+    # give running jobs this many seconds to finish or reach a checkpoint
+    job_recovery_on_startup: bool = True
+    shutdown_grace_seconds: int = 30
+    
+    # Queue priority: earliest portal deadline first (ISO datetimes, e.g.
+    # 2026-10-20T23:59:00+06:00; unset portals count as default_horizon_hours
+    # away), each second queued counting as aging_factor seconds of slack, and
+    # optional per-user fair share (JSON weights by BUP user_id, default 1)
+    du_application_deadline: Optional[datetime] = None
+    bup_application_deadline: Optional[datetime] = None
+    job_priority_default_horizon_hours: float = 168
+    job_priority_aging_factor: float = 30.0
+    job_priority_fair_share: bool = False
+    job_priority_fair_share_penalty: int = 3600  # Seconds of slack per run the user already has in progress
+    job_priority_user_weights: Dict[str, float] = {}
+    job_priority_candidates: int = 200  # Oldest claimable items per portal ranked per claim
+    
+    # Status event streams (SSE): tailer poll for changes made by other
+    # instances, keepalive and client retry, per-stream buffer, retention
+    status_events_poll_interval: float = 2.0
+    status_events_keepalive: int = 15
+    status_events_retry_ms: int = 3000
+    status_events_queue_size: int = 100
+    status_events_retention_hours: int = 24
+    
+    # Status cache: seconds an entry is trusted (writes here update it; the TTL
+    # only bounds staleness from writes made by other instances) and max cached applications
+    status_cache_ttl: float = 300.0
+    status_cache_max_entries: int = 10000
+    status_batch_max_ids: int = 500  # Application ids per batch status request
+    
+    # Paused jobs (OTP/payment): seconds a live browser context is kept before
+    # hibernating to a snapshot, max live paused contexts, and the free-memory floor
+    paused_session_live_ttl: int = 120
+    paused_session_max_live: int = 20
+    paused_session_min_free_mb: int = 512
+    
+    # Preload the portal landing page when an application is created; unused
+    # prewarmed contexts are released after the TTL (seconds)
+    prewarm_enabled: bool = False
+    prewarm_ttl: int = 90
+    prewarm_max_contexts: int = 4
+    
+    # Block images, fonts, media and trackers during automation runs
+    request_filter_enabled: bool = True
+    
+    # BUP portal and driver: "browser" (Playwright) or "http" (httpx WebForms
+    # postbacks, borrowing a browser only for CAPTCHAs and unknown pages)
+    bup_base_url: str = "https://admission.bup.edu.bd"
+    bup_driver: str = "browser"
+    
+    # BUP browsers run headless; CAPTCHAs are relayed through the API
+    bup_headless: bool = True
+    bup_captcha_timeout: int = 300
+    
+    # BUP stage checkpoints older than this are not resumed (portal session lifetime)
+    bup_checkpoint_max_age_minutes: int = 20
+    
+    # BUP address gazetteer: index file, fuzzy match cutoff (0-1), and the age
+    # after which it is reported as needing a refresh (POST /api/bup/address/gazetteer/refresh)
+    bup_gazetteer_path: str = "./data/bup_gazetteer.json"
+    bup_gazetteer_cutoff: float = 0.8
+    bup_gazetteer_max_age_days: int = 30
+    
+    # Debug artifacts: "always", "on_error", "sampled" (errors plus a percentage
+    # of successful steps) or "off"; the oldest are deleted past the size cap or age
+    artifact_policy: str = "on_error"
+    artifact_sample_percent: float = 5.0
+    artifact_dir: str = "./uploads/logs"
+    artifact_max_total_mb: int = 200
+    artifact_max_age_days: int = 7
+    artifact_queue_size: int = 64
+    
+    # Learned selector cache (DU form fields)
+    selector_cache_path: str = "./data/selector_cache.json"
+    
     class Config:
         env_file = ".env"
         case_sensitive = False
@@ -1,7 +1,10 @@
 from sqlalchemy.orm import Session
-from models import UniApplication, UniDocument
-from datetime import datetime
+from models import UniApplication, UniDocument, UniJob
+from datetime import datetime, timedelta
 from typing import Optional
+import status_events
+from status_cache import status_cache
+from queue_crud import QUEUED_MESSAGE
 
 
 def create_application(db: Session, app_data: dict) -> UniApplication:
@@ -32,11 +35,58 @@ def update_application_status(
         db_app.current_stage = current_stage
         db_app.stage_message = stage_message
         db_app.updated_at = datetime.utcnow()
+        status_events.record(db, "du", application_id, "stage", {
+            "job_status": job_status, "current_stage": current_stage, "stage_message": stage_message
+        })
         db.commit()
         db.refresh(db_app)
+        status_events.bus.notify()
+        status_cache.update("du", application_id, job_status=job_status, current_stage=current_stage, stage_message=stage_message)
     return db_app
 
 
+def get_application_status(db: Session, application_id: str) -> Optional[dict]:
+    """Status projection for the status cache (None if the application doesn't exist)"""
+    row = db.query(
+        UniApplication.job_status,
+        UniApplication.current_stage,
+        UniApplication.stage_message,
+        UniApplication.sms_code,
+        UniApplication.receipt_path,
+        UniApplication.admit_card_path
+    ).filter(UniApplication.id == application_id).first()
+    return dict(row._mapping) if row else None
+
+
+def get_application_statuses(db: Session, application_ids: list, since: Optional[datetime] = None) -> dict:
+    """Application id -> status projection with updated_at, for those changed since `since`"""
+    if not application_ids:
+        return {}
+    query = db.query(
+        UniApplication.id,
+        UniApplication.job_status,
+        UniApplication.current_stage,
+        UniApplication.stage_message,
+        UniApplication.sms_code,
+        UniApplication.receipt_path,
+        UniApplication.admit_card_path,
+        UniApplication.updated_at
+    ).filter(UniApplication.id.in_(application_ids))
+    if since is not None:
+        query = query.filter(UniApplication.updated_at >= since)
+    return {row.id: dict(row._mapping) for row in query.all()}
+
+
+def get_applications_by_status(db: Session, job_statuses) -> list:
+    """Applications whose job_status is one of job_statuses"""
+    return db.query(UniApplication).filter(UniApplication.job_status.in_(job_statuses)).all()
+
+
+def get_application_by_transaction(db: Session, transaction_id: str) -> Optional[UniApplication]:
+    """Get application by payment transaction ID"""
+    return db.query(UniApplication).filter(UniApplication.transaction_id == transaction_id).first()
+
+
 def update_payment_status(
     db: Session,
     application_id: str,
@@ -49,8 +99,10 @@ def update_payment_status(
         db_app.payment_status = payment_status
         db_app.transaction_id = transaction_id
         db_app.updated_at = datetime.utcnow()
+        status_events.record(db, "du", application_id, "payment", {"payment_status": payment_status})
         db.commit()
         db.refresh(db_app)
+        status_events.bus.notify()
     return db_app
 
 
@@ -76,9 +128,13 @@ def save_document(
         elif document_type == "admit_card":
             db_app.admit_card_path = file_path
         db_app.updated_at = datetime.utcnow()
+    status_events.record(db, "du", application_id, "document", {"document_type": document_type})
     
     db.commit()
     db.refresh(db_doc)
+    status_events.bus.notify()
+    if document_type in ("receipt", "admit_card"):
+        status_cache.update("du", application_id, **{f"{document_type}_path": file_path})
     return db_doc
 
 
@@ -93,13 +149,72 @@ def update_job_id(db: Session, application_id: str, job_id: str) -> Optional[Uni
     return db_app
 
 
+def mark_application_queued(db: Session, application_id: str, job_id: str) -> dict:
+    """Point the application at job_id and mark it queued, without committing; returns the status fields set"""
+    fields = {"job_status": "queued", "current_stage": "queued", "stage_message": QUEUED_MESSAGE}
+    db.query(UniApplication).filter(UniApplication.id == application_id).update(
+        {**fields, "job_id": job_id, "updated_at": datetime.utcnow()}, synchronize_session=False
+    )
+    status_events.record(db, "du", application_id, "stage", fields)
+    return fields
+
+
 def update_sms_code(db: Session, application_id: str, sms_code: str) -> Optional[UniApplication]:
     """Update SMS code for OTP"""
     db_app = get_application(db, application_id)
     if db_app:
         db_app.sms_code = sms_code
         db_app.updated_at = datetime.utcnow()
+        status_events.record(db, "du", application_id, "sms_code", {"sms_code": sms_code})
         db.commit()
         db.refresh(db_app)
+        status_events.bus.notify()
+        status_cache.update("du", application_id, sms_code=sms_code)
     return db_app
 
+
+def create_job(db: Session, job_id: str, application_id: str) -> UniJob:
+    """Create a job record for an automation run"""
+    db_job = UniJob(id=job_id, application_id=application_id, status="running")
+    db.add(db_job)
+    db.commit()
+    db.refresh(db_job)
+    return db_job
+
+
+def get_job(db: Session, job_id: str) -> Optional[UniJob]:
+    """Get job by ID"""
+    return db.query(UniJob).filter(UniJob.id == job_id).first()
+
+
+def save_job_snapshot(db: Session, job_id: str, storage_state: dict, paused_for: str) -> Optional[UniJob]:
+    """Store the paused browser session so the job can resume without a live browser"""
+    db_job = get_job(db, job_id)
+    if db_job:
+        db_job.status = "paused"
+        db_job.storage_state = storage_state
+        db_job.paused_for = paused_for
+        db_job.pause_timestamp = datetime.utcnow()
+        db.commit()
+        db.refresh(db_job)
+    return db_job
+
+
+def update_job_status(db: Session, job_id: str, status: str) -> Optional[UniJob]:
+    """Update job status"""
+    db_job = get_job(db, job_id)
+    if db_job:
+        db_job.status = status
+        if status == "running":
+            db_job.resume_timestamp = datetime.utcnow()
+        elif status in ("completed", "failed", "cancelled"):
+            db_job.completed_at = datetime.utcnow()
+            db_job.storage_state = None
+        db.commit()
+        db.refresh(db_job)
+    return db_job
+
+
+def application_uses_image(db: Session, path: str) -> bool:
+    return db.query(UniApplication.id).filter(UniApplication.photo_path == path).first() is not None
+
@@ -1,8 +1,12 @@
+import logging
 from sqlalchemy import create_engine
+from sqlalchemy.exc import IntegrityError, OperationalError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from config import get_settings
 
+logger = logging.getLogger(__name__)
+
 settings = get_settings()
 
 engine = create_engine(
@@ -26,7 +30,19 @@ def get_db():
 
 def init_db():
     """Initialize database tables"""
-    from models import UniApplication, UniDocument
-    from bup_models import BUPApplication, BUPJob, BUPDocument, BUPPayment
-    Base.metadata.create_all(bind=engine)
-
+    from models import UniApplication, UniDocument, UniJob, AutomationQueueItem, AutomationMessage, StatusEvent, ProcessedImage
+    from bup_models import BUPApplication, BUPJob, BUPDocument, BUPPayment, BUPCheckpoint
+    try:
+        Base.metadata.create_all(bind=engine)
+    except OperationalError:
+        # Another worker process created the tables at the same moment
+        Base.metadata.create_all(bind=engine)
+    
+    # create_all skips indexes of tables that already exist
+    for index in AutomationQueueItem.__table__.indexes:
+        try:
+            index.create(bind=engine, checkfirst=True)
+        except OperationalError:
+            pass  # Created by another worker process
+        except IntegrityError:
+            logger.warning(f"Index {index.name} not created: automation_queue has duplicate active items")
@@ -0,0 +1,45 @@
+"""
+Processed Image CRUD Operations
+Database operations for the processed image store index (processed_images)
+"""
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from models import ProcessedImage
+from datetime import datetime
+from typing import Optional
+
+
+def get_processed_image(db: Session, source_hash: str, spec: str) -> Optional[ProcessedImage]:
+    """Image store entry for an upload processed to spec, marking it used"""
+    image = db.query(ProcessedImage).filter(
+        ProcessedImage.source_hash == source_hash,
+        ProcessedImage.spec == spec
+    ).first()
+    if image:
+        image.last_used_at = datetime.utcnow()
+        db.commit()
+    return image
+
+
+def save_processed_image(db: Session, source_hash: str, spec: str, path: str, size: int, message: str) -> ProcessedImage:
+    image = ProcessedImage(source_hash=source_hash, spec=spec, path=path, size=size, message=message)
+    db.add(image)
+    db.commit()
+    db.refresh(image)
+    return image
+
+
+def processed_image_paths(db: Session) -> list:
+    """(path, size, last used) per stored file, least recently used first"""
+    return db.query(
+        ProcessedImage.path,
+        func.max(ProcessedImage.size),
+        func.max(ProcessedImage.last_used_at).label("last_used_at")
+    ).group_by(ProcessedImage.path).order_by("last_used_at").all()
+
+
+def delete_processed_images(db: Session, path: str):
+    """Drop every image store entry for a stored file"""
+    db.query(ProcessedImage).filter(ProcessedImage.path == path).delete(synchronize_session=False)
+    db.commit()
@@ -0,0 +1,132 @@
+"""
+Image Processing Service
+Runs photo and signature conformance (resize, JPEG encode) in a process pool
+so CPU-heavy image work uses every core and never blocks the API event loop.
+
+At most max_workers tasks run at once and queue_depth more may wait; beyond
+that submit() raises ImageServiceBusy, which the apply endpoints turn into a
+503 so clients back off instead of piling up behind a saturated pool. A task
+that takes longer than task_timeout raises ImageTaskTimeout. Its process
+can't be interrupted, so it keeps counting against the limit until it ends.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, Optional
+from config import get_settings
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+
+class ImageServiceBusy(Exception):
+    """Raised when the pool and its queue are full"""
+
+
+class ImageTaskTimeout(Exception):
+    """Raised when an image task runs past the per-task timeout"""
+
+
+class ImageService:
+    """Bounded process pool for image processing functions (module-level, picklable)"""
+
+    def __init__(
+        self,
+        max_workers: Optional[int] = None,
+        queue_depth: Optional[int] = None,
+        task_timeout: Optional[float] = None
+    ):
+        self.max_workers = max_workers or settings.image_workers or os.cpu_count() or 1
+        self.queue_depth = settings.image_queue_depth if queue_depth is None else queue_depth
+        self.task_timeout = task_timeout or settings.image_task_timeout
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._in_flight = 0
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self._total_seconds = 0.0
+        self._max_seconds = 0.0
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn, not fork: the API process runs threads (automation loop, browsers)
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._pool
+
+    def _finished(self, started: float, future: asyncio.Future):
+        self._in_flight -= 1
+        elapsed = time.monotonic() - started
+        self._total_seconds += elapsed
+        self._max_seconds = max(self._max_seconds, elapsed)
+        if future.cancelled() or future.exception() is not None:
+            self.failed += 1
+        else:
+            self.completed += 1
+
+    async def submit(self, fn: Callable, *args):
+        """Run fn(*args) in the pool and return its result"""
+        if self._in_flight >= self.max_workers + self.queue_depth:
+            self.rejected += 1
+            raise ImageServiceBusy(f"Image processing is busy ({self._in_flight} tasks in flight)")
+
+        loop = asyncio.get_running_loop()
+        try:
+            future = loop.run_in_executor(self._executor(), fn, *args)
+        except BrokenProcessPool:
+            # A worker died (e.g. killed for memory); start a fresh pool
+            logger.warning("Image process pool broken; restarting it")
+            self.shutdown()
+            future = loop.run_in_executor(self._executor(), fn, *args)
+
+        self._in_flight += 1
+        self.submitted += 1
+        future.add_done_callback(lambda f, started=time.monotonic(): self._finished(started, f))
+        try:
+            # shield: a timeout must not cancel the future, or _in_flight would drop early
+            return await asyncio.wait_for(asyncio.shield(future), timeout=self.task_timeout)
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            logger.warning(f"Image task {getattr(fn, '__name__', fn)} timed out after {self.task_timeout}s")
+            raise ImageTaskTimeout(f"Image processing took longer than {self.task_timeout:g}s")
+        except BrokenProcessPool:
+            self.shutdown()
+            raise
+
+    def warm_up(self):
+        """Start the worker processes now, so the first uploads don't pay for spawning them"""
+        pool = self._executor()
+        for _ in range(self.max_workers):
+            pool.submit(os.getpid)
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def stats(self) -> Dict:
+        finished = self.completed + self.failed
+        return {
+            "workers": self.max_workers,
+            "queue_depth": self.queue_depth,
+            "in_flight": self._in_flight,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "avg_ms": round(self._total_seconds / finished * 1000, 1) if finished else None,
+            "max_ms": round(self._max_seconds * 1000, 1)
+        }
+
+
+image_service = ImageService()
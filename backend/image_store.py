@@ -0,0 +1,122 @@
+"""
+Processed Image Store
+Content-addressed store for processed photos and signatures, shared by DU
+and BUP applications.
+
+An upload is keyed by the sha256 of its bytes and the JpegSpec it is
+processed to. A photo already processed to that spec (a re-application
+after a failure, or another application to the same portal) is served from
+the store instead of being decoded and re-encoded. Files are named by the
+hash of the processed output, so identical outputs are stored once, and
+every application's photo_path / signature_path points at the shared file.
+
+The store is bounded by IMAGE_STORE_MAX_BYTES. Beyond that the least
+recently used files are evicted, except files an application still
+references and files used in the last few minutes, which a request in
+flight may be about to reference.
+"""
+
+import hashlib
+import logging
+import os
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+from sqlalchemy.exc import IntegrityError
+from config import get_settings
+from database import SessionLocal
+from photo_utils import JpegSpec
+import crud
+import bup_crud
+import image_crud
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# Files used this recently are never evicted
+EVICTION_GRACE = timedelta(minutes=10)
+
+
+class ImageStore:
+    """Processed images by (upload hash, spec); methods block, so call them off the event loop"""
+
+    def __init__(self, root: Optional[str] = None, max_bytes: Optional[int] = None):
+        self.root = root or settings.image_store_dir
+        self.max_bytes = max_bytes or settings.image_store_max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+
+    def find(self, data: bytes, spec: JpegSpec) -> Tuple[str, Optional[Dict]]:
+        """Hash an upload and look it up: (source_hash, {"path", "message"} or None)"""
+        source_hash = hashlib.sha256(data).hexdigest()
+        db = SessionLocal()
+        try:
+            image = image_crud.get_processed_image(db, source_hash, spec.key)
+            if image and not os.path.exists(image.path):
+                # Deleted outside the store; forget it and process again
+                image_crud.delete_processed_images(db, image.path)
+                image = None
+            if image is None:
+                self.misses += 1
+                return source_hash, None
+            self.hits += 1
+            return source_hash, {"path": image.path, "message": image.message}
+        finally:
+            db.close()
+
+    def temp_path(self) -> str:
+        """Where a processor should write its output before add()"""
+        temp_dir = os.path.join(self.root, "tmp")
+        os.makedirs(temp_dir, exist_ok=True)
+        return os.path.join(temp_dir, f"{uuid.uuid4().hex}.jpg")
+
+    def add(self, source_hash: str, spec: JpegSpec, temp_path: str, message: str) -> str:
+        """Move a processed file into the store and index it; returns its stored path"""
+        with open(temp_path, "rb") as f:
+            output = f.read()
+        output_hash = hashlib.sha256(output).hexdigest()
+        directory = os.path.join(self.root, output_hash[:2])
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{output_hash[:32]}.jpg")
+        if os.path.exists(path):
+            os.remove(temp_path)  # Identical output already stored
+        else:
+            os.replace(temp_path, path)
+
+        db = SessionLocal()
+        try:
+            try:
+                image_crud.save_processed_image(db, source_hash, spec.key, path, len(output), message)
+            except IntegrityError:
+                # A concurrent upload of the same file indexed it first
+                db.rollback()
+            self._evict(db)
+        finally:
+            db.close()
+        return path
+
+    def _evict(self, db):
+        files = image_crud.processed_image_paths(db)
+        total = sum(size for _, size, _ in files)
+        if total <= self.max_bytes:
+            return
+        cutoff = datetime.utcnow() - EVICTION_GRACE
+        for path, size, last_used_at in files:
+            if total <= self.max_bytes or last_used_at > cutoff:
+                break
+            if crud.application_uses_image(db, path) or bup_crud.bup_application_uses_image(db, path):
+                continue
+            image_crud.delete_processed_images(db, path)
+            if os.path.exists(path):
+                os.remove(path)
+            total -= size
+            self.evicted += 1
+        if total > self.max_bytes:
+            logger.warning(f"Image store at {total / 1e6:.1f} MB is over its limit; the rest is in use")
+
+    def stats(self) -> Dict:
+        return {"hits": self.hits, "misses": self.misses, "evicted": self.evicted, "max_bytes": self.max_bytes}
+
+
+image_store = ImageStore()
@@ -0,0 +1,102 @@
+"""
+Queue Priority
+Orders claimable automation runs earliest deadline first, with aging and
+optional per-user fair share, instead of plain arrival order.
+
+A run's score is the slack left before its portal closes, in seconds:
+
+    score = (deadline - now) - aging_factor * waited + fair_share_penalty
+
+The lowest score is claimed first. Aging credits every second spent queued
+as aging_factor seconds closer to the deadline, so a run with a week left is
+still claimed eventually while last-day runs keep arriving. With fair share
+on, each run the same user already has in progress adds a penalty divided by
+that user's weight, so one account can't crowd out everyone else. Portals
+without a configured deadline are treated as closing default_horizon_hours out.
+"""
+
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+from sqlalchemy.orm import Session
+from config import get_settings
+import bup_crud
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+
+def _utc_naive(value: Optional[datetime]) -> Optional[datetime]:
+    """Deadlines may be configured with an offset; queue timestamps are naive UTC"""
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+class PriorityPolicy:
+    """Scores and ranks queue items; see the module docstring for the formula"""
+
+    def deadline(self, portal: str) -> Optional[datetime]:
+        if portal == "du":
+            return _utc_naive(settings.du_application_deadline)
+        if portal == "bup":
+            return _utc_naive(settings.bup_application_deadline)
+        return None
+
+    def _user_keys(self, db: Session, items) -> Dict[str, str]:
+        """Application id -> user key for BUP applications with a user_id"""
+        app_ids = [item.application_id for item in items if item.portal == "bup"]
+        return {app_id: str(user_id) for app_id, user_id in bup_crud.get_bup_user_ids(db, app_ids).items()}
+
+    def rank(self, db: Session, candidates, in_progress=(), now: Optional[datetime] = None) -> List[Dict]:
+        """
+        Score candidates, lowest (most urgent) first
+
+        in_progress are running items, counted per user for fair share.
+        """
+        now = now or datetime.utcnow()
+        default_deadline = now + timedelta(hours=settings.job_priority_default_horizon_hours)
+
+        users: Dict[str, str] = {}
+        active: Dict[str, int] = {}
+        if settings.job_priority_fair_share:
+            users = self._user_keys(db, list(candidates) + list(in_progress))
+            for item in in_progress:
+                user = users.get(item.application_id)
+                if user:
+                    active[user] = active.get(user, 0) + 1
+
+        ranked = []
+        for item in candidates:
+            deadline = self.deadline(item.portal)
+            slack = ((deadline or default_deadline) - now).total_seconds()
+            waited = max(0.0, (now - item.created_at).total_seconds())
+            aging = settings.job_priority_aging_factor * waited
+
+            user = users.get(item.application_id)
+            penalty = 0.0
+            if user and active.get(user):
+                weight = settings.job_priority_user_weights.get(user, 1.0) or 1.0
+                penalty = settings.job_priority_fair_share_penalty * active[user] / weight
+
+            ranked.append({
+                "item": item,
+                "item_id": item.id,
+                "portal": item.portal,
+                "application_id": item.application_id,
+                "job_id": item.job_id,
+                "user": user,
+                "deadline": deadline.isoformat() if deadline else None,
+                "slack_seconds": round(slack),
+                "waited_seconds": round(waited),
+                "aging_credit": round(aging),
+                "fair_share_penalty": round(penalty),
+                "score": round(slack - aging + penalty, 1)
+            })
+
+        # Ties (e.g. the same portal and arrival second) fall back to arrival order
+        ranked.sort(key=lambda entry: (entry["score"], entry["item"].created_at, entry["item_id"]))
+        return ranked
+
+
+priority_policy = PriorityPolicy()
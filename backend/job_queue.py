@@ -0,0 +1,456 @@
+"""
+Automation Job Queue
+Durable queue of automation runs in the automation_queue table.
+
+start-automation only enqueues. A dispatcher on the automation loop claims
+items while the scheduler has a free worker slot, so peak concurrency is
+capped by AUTOMATION_MAX_WORKERS however many requests arrive, and queued
+runs survive a restart. A claimed item is hidden for the visibility timeout
+and kept hidden by heartbeats while it runs; if its worker dies, the item
+becomes claimable again and is retried until it runs out of attempts.
+
+The claim is a lease, so several backend processes can share one database.
+A job parked on OTP or payment stays leased by the worker that ran it, and
+messages for it (send()) go to that worker: delivered directly when it is
+this process, otherwise left in automation_messages for the holder to pick
+up on its next poll. A parked job whose holder stopped heartbeating is
+adopted by whichever worker next has a message for it, and resumed there
+from its session snapshot.
+"""
+
+import asyncio
+import logging
+import os
+import socket
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Optional
+from config import get_settings
+from database import SessionLocal
+from datetime import datetime
+from automation_runtime import run_on_automation_loop, runtime, MESSAGE_TRIGGERS
+from job_scheduler import scheduler
+from job_priority import priority_policy
+from utils import generate_job_id
+import queue_crud
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+
+def _pid_alive(worker_id: str) -> bool:
+    """Whether the process behind a worker id on this host is still running"""
+    try:
+        os.kill(int(worker_id.rsplit(":", 1)[1]), 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, ValueError, IndexError):
+        return True
+    return True
+
+
+def _describe(entry: Dict) -> Dict:
+    return {key: value for key, value in entry.items() if key != "item"}
+
+
+class QueueHandler:
+    """
+    How a portal's queued runs are executed
+
+    - run(application_id, job_id): the automation coroutine
+    - retry(db, application_id, old_job_id, new_job_id): an earlier attempt was
+      abandoned; mark its job failed and point the application at the new job
+    - fail(db, application_id, job_id, message): attempts exhausted
+    - mark_queued(db, application_id, job_id): stage the application's
+      queued status (the portal crud's mark_*_queued); committed together
+      with the queue item
+    - recover(db): optional startup reconciliation of the portal's stuck
+      applications (see JobQueue.recover_job); returns outcome counts
+    """
+
+    def __init__(
+        self,
+        run: Callable[[str, str], Awaitable],
+        retry: Callable,
+        fail: Callable,
+        mark_queued: Callable[..., dict],
+        recover: Optional[Callable] = None
+    ):
+        self.run = run
+        self.retry = retry
+        self.fail = fail
+        self.mark_queued = mark_queued
+        self.recover = recover
+
+
+class JobQueue:
+    """Dispatcher for the durable automation queue; runs on the automation loop"""
+
+    def __init__(self):
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._handlers: Dict[str, QueueHandler] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._heartbeat: Optional[asyncio.Task] = None
+        self._running: Dict[int, asyncio.Task] = {}
+        self._stopping = False
+        self.leases_held = 0
+        self.messages_routed = 0
+        self.adopted = 0
+        self.decisions: Deque[Dict] = deque(maxlen=50)  # Recent claims and what they beat
+        runtime.on_idle(self._job_idle)
+
+    def register(self, portal: str, handler: QueueHandler):
+        self._handlers[portal] = handler
+
+    def enqueue(self, portal: str, application_id: str, job_id: str) -> str:
+        """
+        Persist a run and nudge the dispatcher (call from any thread). Returns
+        the job id that owns the application: job_id, or that of a run already
+        queued, running or parked for it.
+        """
+        db = SessionLocal()
+        try:
+            item = queue_crud.enqueue_job(db, portal, application_id, job_id, self._handlers[portal].mark_queued)
+        finally:
+            db.close()
+        if item.job_id != job_id:
+            logger.info(f"Application {application_id} already has {portal} job {item.job_id} ({item.state})")
+            return item.job_id
+        logger.info(f"Queued {portal} job {job_id} for application {application_id} (item {item.id})")
+        run_on_automation_loop(self._notify())
+        return job_id
+
+    async def _notify(self):
+        if self._wakeup:
+            self._wakeup.set()
+
+    def send(self, portal: str, application_id: str, job_id: str, message: str, **payload):
+        """Deliver a message to a job on whichever worker holds its lease (call from any thread)"""
+        adopted = False
+        db = SessionLocal()
+        try:
+            item = queue_crud.get_queued_job_by_job(db, job_id)
+            if item and item.state in ("running", "parked") and self._stopping:
+                # Draining: leave it for whichever worker takes the job over
+                queue_crud.post_job_message(db, portal, application_id, job_id, message, payload, item.worker_id)
+                logger.info(f"Draining; left {message} for job {job_id} in the message table")
+                return
+            if item and item.state in ("running", "parked") and item.worker_id != self.worker_id:
+                if item.state == "parked" and item.visible_at <= datetime.utcnow():
+                    adopted = self._adopt(db, item)
+                if not adopted and item.visible_at > datetime.utcnow():
+                    queue_crud.post_job_message(db, portal, application_id, job_id, message, payload, item.worker_id)
+                    self.messages_routed += 1
+                    logger.info(f"Routed {message} for job {job_id} to {item.worker_id}")
+                    return
+        finally:
+            db.close()
+        run_on_automation_loop(self._deliver(portal, application_id, job_id, message, payload, adopted))
+
+    def _adopt(self, db, item) -> bool:
+        if not queue_crud.adopt_queued_job(db, item, self.worker_id, settings.job_queue_visibility_timeout):
+            db.refresh(item)
+            return False
+        self.adopted += 1
+        logger.warning(f"Adopted parked job {item.job_id} from {item.worker_id}, whose lease expired")
+        return True
+
+    async def _deliver(self, portal: str, application_id: str, job_id: str, message: str, payload: Dict, adopted: bool):
+        if adopted and message != "cancel":
+            # The job parked on another worker; record it here so the wake-up resumes it
+            scheduler.park(job_id, MESSAGE_TRIGGERS.get(message, message))
+        await runtime.deliver(portal, application_id, job_id, message, payload)
+
+    async def _pump_messages(self):
+        """Deliver messages left for jobs this worker holds or can adopt"""
+        db = SessionLocal()
+        try:
+            for msg, item in queue_crud.pending_job_messages(db, self.worker_id):
+                adopted = False
+                if item.worker_id != self.worker_id:
+                    adopted = self._adopt(db, item)
+                    if not adopted:
+                        continue
+                if queue_crud.mark_job_message_delivered(db, msg.id):
+                    await self._deliver(msg.portal, msg.application_id, msg.job_id, msg.message, msg.payload or {}, adopted)
+        finally:
+            db.close()
+
+    def _job_idle(self, job_id: str):
+        """A job stopped running: keep the lease while it is parked, release it when finished"""
+        db = SessionLocal()
+        try:
+            queue_crud.settle_queued_job(db, job_id, self.worker_id, "parked" if scheduler.is_parked(job_id) else "done")
+        finally:
+            db.close()
+
+    async def start(self):
+        """Start dispatching (idempotent)"""
+        if self._dispatcher is None:
+            self._stopping = False
+            self._wakeup = asyncio.Event()
+            self._dispatcher = asyncio.create_task(self._dispatch())
+            self._heartbeat = asyncio.create_task(self._renew_leases())
+            logger.info(f"Job queue dispatcher started ({self.worker_id})")
+
+    async def _dispatch(self):
+        while not self._stopping:
+            try:
+                await self._pump_messages()
+                while scheduler.has_capacity() and await self._claim_one():
+                    # Let the new run take its slot before checking capacity again
+                    await asyncio.sleep(0)
+            except Exception as e:
+                logger.error(f"Job queue dispatch error: {str(e)}")
+
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=settings.job_queue_poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def _claim_next(self, db):
+        """Claim the most urgent claimable item (see job_priority) and record why it won"""
+        candidates = queue_crud.claimable_queued_jobs(db, settings.job_priority_candidates)
+        if not candidates:
+            return None
+        ranked = priority_policy.rank(db, candidates, queue_crud.in_progress_queued_jobs(db))
+        for position, entry in enumerate(ranked):
+            if queue_crud.try_claim_queued_job(db, entry["item"], self.worker_id, settings.job_queue_visibility_timeout):
+                self.decisions.append({
+                    "at": datetime.utcnow().isoformat(),
+                    "claimed": _describe(entry),
+                    "position": position,
+                    "passed_over": [_describe(other) for other in ranked[:position + 6] if other is not entry][:5]
+                })
+                return entry["item"]
+        return None
+
+    async def _claim_one(self) -> bool:
+        db = SessionLocal()
+        try:
+            item = self._claim_next(db)
+            if item is None:
+                return False
+
+            handler = self._handlers.get(item.portal)
+            if handler is None:
+                queue_crud.update_queued_job(db, item.id, state="failed", last_error=f"No handler for portal {item.portal}")
+                return True
+
+            job_id = item.job_id
+            if item.attempts > settings.job_queue_max_attempts:
+                message = f"Gave up after {item.attempts - 1} abandoned attempts"
+                logger.error(f"Queue item {item.id} ({job_id}): {message}")
+                handler.fail(db, item.application_id, job_id, message)
+                queue_crud.update_queued_job(db, item.id, state="failed", last_error=message)
+                return True
+            if item.attempts > 1:
+                # The previous attempt's worker stopped heartbeating
+                job_id = generate_job_id()
+                logger.warning(
+                    f"Queue item {item.id}: attempt {item.attempts - 1} ({item.job_id}) was abandoned, retrying as {job_id}"
+                )
+                handler.retry(db, item.application_id, item.job_id, job_id)
+                queue_crud.update_queued_job(db, item.id, job_id=job_id)
+
+            self._running[item.id] = asyncio.create_task(self._run(item.id, handler, item.application_id, job_id))
+            return True
+        finally:
+            db.close()
+
+    async def _run(self, item_id: int, handler: QueueHandler, application_id: str, job_id: str):
+        # Parked or done is recorded by _job_idle when the job lets go of its slot
+        state, error = None, None
+        try:
+            await scheduler.run(job_id, handler.run(application_id, job_id))
+        except asyncio.CancelledError:
+            if runtime.draining:
+                # Interrupted by shutdown: keep it running under the lease drain() releases, so it is retried
+                logger.info(f"Queued job {job_id} interrupted by shutdown")
+                state = "running"
+            else:
+                logger.info(f"Queued job {job_id} was cancelled")
+                state = "cancelled"
+        except Exception as e:
+            logger.error(f"Queued job {job_id} crashed: {str(e)}")
+            state, error = "failed", str(e)
+        finally:
+            self._running.pop(item_id, None)
+            if state:
+                db = SessionLocal()
+                try:
+                    queue_crud.update_queued_job(db, item_id, state=state, last_error=error)
+                finally:
+                    db.close()
+            if self._wakeup:
+                self._wakeup.set()
+
+    async def _renew_leases(self):
+        """One heartbeat for every running and parked item this worker holds"""
+        interval = max(1, settings.job_queue_visibility_timeout // 3)
+        while True:
+            await asyncio.sleep(interval)
+            db = SessionLocal()
+            try:
+                self.leases_held = queue_crud.renew_leases(db, self.worker_id, settings.job_queue_visibility_timeout)
+            except Exception as e:
+                logger.warning(f"Lease renewal failed: {str(e)}")
+            finally:
+                db.close()
+
+    def recover(self) -> Dict:
+        """
+        Startup reconciliation (call before start): release the leases of dead
+        worker processes on this host so their jobs are taken over now rather
+        than after the visibility timeout, then let each portal reconcile its
+        applications left mid-run
+        """
+        outcomes: Dict[str, Dict] = {}
+        db = SessionLocal()
+        try:
+            host = self.worker_id.rsplit(":", 1)[0]
+            for worker_id in queue_crud.queue_lease_holders(db):
+                if worker_id != self.worker_id and worker_id.rsplit(":", 1)[0] == host and not _pid_alive(worker_id):
+                    released = queue_crud.release_leases(db, worker_id)
+                    logger.warning(f"Released {released} leases of dead worker {worker_id}")
+
+            for portal, handler in self._handlers.items():
+                if handler.recover:
+                    outcomes[portal] = handler.recover(db)
+                    if any(outcomes[portal].values()):
+                        logger.warning(f"Recovered stuck {portal} applications: {outcomes[portal]}")
+        finally:
+            db.close()
+        return outcomes
+
+    def recover_job(
+        self,
+        db,
+        portal: str,
+        application_id: str,
+        job_id: Optional[str],
+        paused_for: Optional[str] = None,
+        payment_done: bool = False
+    ) -> str:
+        """
+        Reconcile one application whose status says a job is in progress
+
+        Returns what was done: "left" (the queue already owns it), "parked"
+        (re-parked from its session snapshot; the next OTP/payment message
+        resumes it), "redelivered" (re-parked, and the payment it was already
+        handling is sent again), "requeued" (a fresh attempt; BUP resumes from
+        its checkpoints) or "failed" (out of attempts)
+        """
+        handler = self._handlers[portal]
+        item = queue_crud.get_queued_job_by_job(db, job_id) if job_id else None
+        if item and item.state in ("queued", "running"):
+            # Claimed again once its lease expires, like any abandoned run
+            return "left"
+        if item and item.state == "parked" and item.visible_at > datetime.utcnow():
+            return "left"
+
+        if job_id and paused_for:
+            if item is None or item.state != "parked":
+                item = queue_crud.enqueue_parked_job(db, portal, application_id, job_id)
+            if paused_for == "payment" and payment_done and not queue_crud.has_pending_job_message(db, job_id):
+                queue_crud.post_job_message(db, portal, application_id, job_id, "payment_verified", {}, item.worker_id)
+                return "redelivered"
+            return "parked"
+
+        attempts = queue_crud.count_queued_jobs_for_application(db, application_id)
+        if attempts >= settings.job_queue_max_attempts:
+            handler.fail(db, application_id, job_id, f"Interrupted by restarts {attempts} times")
+            return "failed"
+
+        new_job_id = generate_job_id()
+        handler.retry(db, application_id, job_id, new_job_id)
+        queue_crud.enqueue_job(db, portal, application_id, new_job_id, handler.mark_queued)
+        return "requeued"
+
+    async def drain(self, grace: float):
+        """
+        Graceful shutdown: stop claiming, give running jobs up to `grace`
+        seconds to finish or park (BUP jobs stop at their next stage
+        checkpoint), then cancel the rest and release every lease so another
+        worker, or this one after a restart, takes the jobs over right away
+        """
+        self._stopping = True
+        runtime.draining = True
+        if self._dispatcher:
+            self._dispatcher.cancel()
+            try:
+                await self._dispatcher
+            except asyncio.CancelledError:
+                pass
+            self._dispatcher = None
+
+        runs = set(self._running.values())
+        busy = runs | set(runtime.tasks().values())
+        if busy:
+            logger.info(f"Draining {len(busy)} running jobs (up to {grace}s)")
+            done, busy = await asyncio.wait(busy, timeout=grace)
+
+        # Continuations (OTP/payment) cut short go back to waiting on their snapshot;
+        # first runs cut short are retried (_run keeps them running under a released lease)
+        interrupted = [job_id for job_id, task in runtime.tasks().items() if task in busy and task not in runs]
+        for task in busy:
+            task.cancel()
+        if busy:
+            logger.warning(f"Cancelling {len(busy)} jobs still running after the grace period")
+            await asyncio.gather(*busy, return_exceptions=True)
+
+        db = SessionLocal()
+        try:
+            for job_id in interrupted:
+                queue_crud.release_queued_job(db, job_id, "parked")
+            released = queue_crud.release_leases(db, self.worker_id)
+        finally:
+            db.close()
+        logger.info(f"Drained; released {released} leases")
+
+        if self._heartbeat:
+            self._heartbeat.cancel()
+            try:
+                await self._heartbeat
+            except asyncio.CancelledError:
+                pass
+            self._heartbeat = None
+
+    def ordering(self, limit: int = 50) -> Dict:
+        """Current claim order of waiting items with their scores, and recent claim decisions"""
+        db = SessionLocal()
+        try:
+            candidates = queue_crud.claimable_queued_jobs(db, settings.job_priority_candidates)
+            ranked = priority_policy.rank(db, candidates, queue_crud.in_progress_queued_jobs(db))
+        finally:
+            db.close()
+        return {
+            "fair_share": settings.job_priority_fair_share,
+            "aging_factor": settings.job_priority_aging_factor,
+            "deadlines": {portal: (d.isoformat() if d else None) for portal, d in (
+                ("du", priority_policy.deadline("du")),
+                ("bup", priority_policy.deadline("bup"))
+            )},
+            "waiting": [_describe(entry) for entry in ranked[:limit]],
+            "recent_decisions": list(self.decisions)[::-1]
+        }
+
+    def stats(self) -> Dict:
+        db = SessionLocal()
+        try:
+            counts = queue_crud.queue_counts(db)
+        finally:
+            db.close()
+        return {
+            "worker_id": self.worker_id,
+            "dispatching": self._dispatcher is not None,
+            "running_here": len(self._running),
+            "leases_held": self.leases_held,
+            "messages_routed": self.messages_routed,
+            "adopted": self.adopted,
+            "items": counts
+        }
+
+
+job_queue = JobQueue()
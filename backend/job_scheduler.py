@@ -0,0 +1,153 @@
+"""
+Automation Scheduler
+Bounds how many jobs are actively driving a browser at once.
+
+A job holds a worker slot only while it is doing browser work. When it waits
+on a human (CAPTCHA answer, OTP, payment) it gives the slot back and is parked
+until a wake-up trigger resumes it on the next free slot, so throughput
+depends on active jobs rather than on how quickly people respond.
+"""
+
+import asyncio
+import contextvars
+import logging
+import time
+from concurrent.futures import Future
+from contextlib import asynccontextmanager
+from typing import Coroutine, Dict, Optional
+from config import get_settings
+from automation_runtime import run_on_automation_loop, runtime
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# Job whose slot the current task holds (set inside AutomationScheduler.slot)
+_current_job: contextvars.ContextVar = contextvars.ContextVar("current_job", default=None)
+
+
+class AutomationScheduler:
+    """
+    Worker slots for automation jobs; all state lives on the automation loop
+
+    - submit(): run a new job once a slot is free
+    - parked(): context manager that releases the current job's slot while it waits
+    - park() / resume(): a job that ended its run waiting for OTP or payment is
+      parked, and the trigger (OTP submit, payment verification) resumes it;
+      triggers arrive as messages through automation_runtime
+    """
+
+    def __init__(self, max_workers: Optional[int] = None):
+        self.max_workers = max_workers or settings.automation_max_workers
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._queued: Dict[str, float] = {}
+        self._running: Dict[str, float] = {}
+        self._parked: Dict[str, Dict] = {}
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_workers)
+        return self._slots
+
+    async def _acquire(self, job_id: str):
+        self._queued[job_id] = time.monotonic()
+        try:
+            await self._semaphore().acquire()
+        finally:
+            self._queued.pop(job_id, None)
+        self._running[job_id] = time.monotonic()
+
+    def _release(self, job_id: str):
+        if self._running.pop(job_id, None) is not None:
+            self._semaphore().release()
+
+    @asynccontextmanager
+    async def slot(self, job_id: str):
+        """Hold a worker slot for the duration of the block"""
+        await self._acquire(job_id)
+        token = _current_job.set(job_id)
+        task = asyncio.current_task()
+        runtime.attach(job_id, task)
+        try:
+            yield
+        finally:
+            _current_job.reset(token)
+            self._release(job_id)
+            runtime.detach(job_id, task)
+
+    @asynccontextmanager
+    async def parked(self, waiting_for: str):
+        """
+        Give the current job's slot back while waiting on a human,
+        and take a slot again (queueing if none is free) afterwards
+        """
+        job_id = _current_job.get()
+        if job_id is None or job_id not in self._running:
+            yield
+            return
+
+        self._release(job_id)
+        self.park(job_id, waiting_for)
+        cancelled = False
+        try:
+            yield
+        except asyncio.CancelledError:
+            # A cancelled job must not queue for a slot on its way out
+            cancelled = True
+            raise
+        finally:
+            self._parked.pop(job_id, None)
+            if not cancelled:
+                await self._acquire(job_id)
+
+    async def run(self, job_id: str, coro: Coroutine):
+        try:
+            async with self.slot(job_id):
+                return await coro
+        except asyncio.CancelledError:
+            # Cancelled while still waiting for a slot: the job never started
+            coro.close()
+            raise
+
+    def submit(self, job_id: str, coro: Coroutine) -> Future:
+        """Schedule a job from any thread; it starts when a slot is free"""
+        return run_on_automation_loop(self.run(job_id, coro))
+
+    def has_capacity(self) -> bool:
+        """True if a new job would get a slot without queueing"""
+        return len(self._running) + len(self._queued) < self.max_workers
+
+    def park(self, job_id: str, waiting_for: str):
+        """Record that a job is waiting for `waiting_for` and holds no slot"""
+        self._parked[job_id] = {"waiting_for": waiting_for, "since": time.monotonic()}
+        logger.info(f"Job {job_id} parked waiting for {waiting_for}")
+
+    def unpark(self, job_id: str):
+        self._parked.pop(job_id, None)
+
+    def is_parked(self, job_id: str) -> bool:
+        return job_id in self._parked
+
+    async def resume(self, job_id: str, trigger: str, coro: Coroutine):
+        """Run a parked job's continuation once a slot is free (on the automation loop)"""
+        parked = self._parked.pop(job_id, None)
+        if parked is None:
+            logger.warning(f"Waking job {job_id} on {trigger}, but it was not parked")
+        elif parked["waiting_for"] != trigger:
+            logger.warning(f"Job {job_id} was waiting for {parked['waiting_for']}, woken by {trigger}")
+        return await self.run(job_id, coro)
+
+    def stats(self) -> Dict:
+        """Slot usage and parked jobs by what they are waiting for"""
+        waiting_for: Dict[str, int] = {}
+        for parked in list(self._parked.values()):
+            waiting_for[parked["waiting_for"]] = waiting_for.get(parked["waiting_for"], 0) + 1
+        return {
+            "max_workers": self.max_workers,
+            "running": len(self._running),
+            "queued": len(self._queued),
+            "parked": len(self._parked),
+            "parked_by_reason": waiting_for
+        }
+
+
+scheduler = AutomationScheduler()
@@ -5,17 +5,18 @@ import asyncio
 if sys.platform == 'win32':
     asyncio.set_event_loop_policy(asyncio.WindowsProactorEventLoopPolicy())
 
-from fastapi import FastAPI, File, UploadFile, Form, Depends, HTTPException, Query
+from fastapi import FastAPI, File, UploadFile, Form, Depends, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, FileResponse, RedirectResponse
+from fastapi.responses import JSONResponse, FileResponse, RedirectResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from typing import Optional
+from datetime import datetime, timezone
 import os
-import shutil
 import logging
 
-from database import get_db, init_db
+from database import get_db, init_db, SessionLocal
 from config import get_settings
 import crud
 import schemas
@@ -26,15 +27,27 @@ from utils import (
     setup_logging,
     ensure_upload_dirs
 )
-from photo_utils import validate_photo, process_photo
+from photo_utils import validate_photo, process_photo, sniff_image_format, DU_PHOTO
 from ssl_commerz import init_payment, verify_payment
 from tasks import (
     start_automation_background,
-    resume_automation_after_otp,
-    complete_automation_after_payment,
-    active_jobs,
-    otp_waiting_jobs
+    wake_automation_with_otp,
+    wake_automation_after_payment,
+    cancel_automation,
+    active_jobs
 )
+from automation_runtime import run_on_automation_loop, runtime
+from browser_pool import shutdown_browser_pools
+from artifacts import writer as artifact_writer
+from selector_resolver import get_selector_stats
+from job_scheduler import scheduler
+from prewarm import prewarm_registry
+from job_queue import job_queue
+from session_store import paused_sessions
+from status_events import bus as status_bus
+from status_cache import status_cache, etag
+from image_service import image_service, ImageServiceBusy, ImageTaskTimeout
+from image_store import image_store
 import asyncio
 from contextlib import asynccontextmanager
 
@@ -50,9 +63,23 @@ async def lifespan(app: FastAPI):
     logger.info("Initializing database...")
     init_db()
     logger.info("Database initialized successfully")
+    if settings.job_recovery_on_startup:
+        job_queue.recover()
+    run_on_automation_loop(job_queue.start()).result(timeout=10)
+    image_service.warm_up()
     yield
-    # Cleanup on shutdown (if needed)
     logger.info("Shutting down...")
+    try:
+        # Finish or checkpoint in-flight jobs before any browser goes away
+        grace = settings.shutdown_grace_seconds
+        run_on_automation_loop(job_queue.drain(grace)).result(timeout=grace + 30)
+        run_on_automation_loop(prewarm_registry.close_all()).result(timeout=10)
+        run_on_automation_loop(paused_sessions.hibernate_all()).result(timeout=30)
+        run_on_automation_loop(shutdown_browser_pools()).result(timeout=30)
+    except Exception as e:
+        logger.error(f"Error closing browser pools: {str(e)}")
+    artifact_writer.flush()
+    image_service.shutdown()
 
 
 # Initialize FastAPI app
@@ -92,6 +119,86 @@ async def health_check():
     return {"status": "healthy"}
 
 
+@app.get("/api/automation/selectors")
+async def selector_stats():
+    """Learned DU selectors and their hit/miss counters (a miss spike means the portal layout changed)"""
+    return get_selector_stats()
+
+
+@app.get("/api/automation/scheduler")
+async def scheduler_stats():
+    """Worker slot usage; parked jobs (waiting on CAPTCHA, OTP or payment) hold no slot"""
+    stats = scheduler.stats()
+    stats["prewarm"] = prewarm_registry.stats()
+    stats["queue"] = job_queue.stats()
+    stats["runtime"] = runtime.stats()
+    stats["status_streams"] = status_bus.stats()
+    stats["status_cache"] = status_cache.stats()
+    stats["images"] = image_service.stats()
+    stats["image_store"] = image_store.stats()
+    return stats
+
+
+@app.get("/api/automation/queue")
+async def queue_ordering(limit: int = Query(50, ge=1, le=500)):
+    """Claim order of waiting runs (deadline slack, aging, fair share) and recent claim decisions"""
+    return job_queue.ordering(limit)
+
+
+async def _read_image_upload(upload: UploadFile, label: str, formats=("JPEG",)) -> bytes:
+    """
+    Read an uploaded image into memory, rejecting oversized or non-image files
+    from the declared size and the first bytes before reading the rest
+    """
+    max_bytes = settings.upload_max_image_bytes
+    if upload.size is not None and upload.size > max_bytes:
+        raise HTTPException(status_code=413, detail=f"{label} is larger than {max_bytes // 1024} KB")
+    
+    header = await upload.read(16)
+    image_format = sniff_image_format(header)
+    if image_format not in formats:
+        raise HTTPException(status_code=400, detail=f"{label} must be a {'/'.join(formats)} image")
+    
+    data = header + await upload.read(max_bytes + 1 - len(header))
+    if len(data) > max_bytes:
+        raise HTTPException(status_code=413, detail=f"{label} is larger than {max_bytes // 1024} KB")
+    return data
+
+
+async def _process_image(fn, *args):
+    """Run an image processing function in the image pool, mapping saturation to 503"""
+    try:
+        return await image_service.submit(fn, *args)
+    except ImageServiceBusy:
+        raise HTTPException(
+            status_code=503,
+            detail="Image processing is busy, please retry shortly",
+            headers={"Retry-After": "5"}
+        )
+    except ImageTaskTimeout as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+
+
+async def _store_image(fn, data: bytes, spec) -> tuple:
+    """
+    Processed image path for an upload: from the image store when this file was
+    already processed to spec, else processed by fn in the image pool and added
+    """
+    source_hash, stored = await run_in_threadpool(image_store.find, data, spec)
+    if stored:
+        return stored["path"], f"{stored['message']} [reused]"
+    
+    temp_path = await run_in_threadpool(image_store.temp_path)
+    result = await _process_image(fn, data, temp_path)
+    success, message = result[0], result[1]
+    if not success:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise HTTPException(status_code=400, detail=message)
+    path = await run_in_threadpool(image_store.add, source_hash, spec, temp_path, message)
+    return path, message
+
+
 @app.post("/api/uni/apply", response_model=schemas.ApplicationResponse)
 async def create_application(
     # Student Credentials
@@ -142,32 +249,16 @@ async def create_application(
         # Generate application ID
         app_id = generate_application_id()
         
-        # Save uploaded photo
-        photo_dir = "./uploads/photos"
-        os.makedirs(photo_dir, exist_ok=True)
-        
-        temp_photo_path = os.path.join(photo_dir, f"{app_id}_temp.jpg")
-        final_photo_path = os.path.join(photo_dir, f"{app_id}.jpg")
-        
-        # Save uploaded file
-        with open(temp_photo_path, "wb") as buffer:
-            shutil.copyfileobj(photo.file, buffer)
+        # Read uploaded photo (checked for type and size before the full read)
+        photo_data = await _read_image_upload(photo, "Photo")
         
         # Validate photo
-        is_valid, error_msg = validate_photo(temp_photo_path)
+        is_valid, error_msg = await run_in_threadpool(validate_photo, photo_data)
         if not is_valid:
-            os.remove(temp_photo_path)
             raise HTTPException(status_code=400, detail=error_msg)
         
-        # Process photo (resize and compress)
-        success, message = process_photo(temp_photo_path, final_photo_path)
-        
-        # Remove temp file
-        if os.path.exists(temp_photo_path):
-            os.remove(temp_photo_path)
-        
-        if not success:
-            raise HTTPException(status_code=400, detail=message)
+        # Process photo (resize and compress) in the image pool, or reuse it from the image store
+        final_photo_path, message = await _store_image(process_photo, photo_data, DU_PHOTO)
         
         logger.info(f"Photo processed: {message}")
         
@@ -207,6 +298,7 @@ async def create_application(
         db_app = crud.create_application(db, app_data)
         
         logger.info(f"Application created: {app_id}")
+        prewarm_registry.start(app_id, "du")
         
         return db_app
         
@@ -234,7 +326,7 @@ async def start_automation(
             raise HTTPException(status_code=404, detail="Application not found")
         
         # Check if already running
-        if app.job_status in ["login", "form_fill", "otp_required", "payment", "downloading"]:
+        if app.job_status in ["queued", "login", "form_fill", "otp_required", "payment", "downloading"]:
             return {
                 "application_id": application_id,
                 "job_id": app.job_id,
@@ -245,18 +337,22 @@ async def start_automation(
         # Generate job ID
         job_id = generate_job_id()
         
-        # Update job ID in database
-        crud.update_job_id(db, application_id, job_id)
-        
-        # Start automation in background
-        start_automation_background(application_id, job_id)
+        # Queue automation; this also records the job ID and marks the application queued
+        queued_job_id = start_automation_background(application_id, job_id)
+        if queued_job_id != job_id:
+            return {
+                "application_id": application_id,
+                "job_id": queued_job_id,
+                "stage": "queued",
+                "message": "Automation already in progress"
+            }
         
         logger.info(f"Started automation for application {application_id}, job {job_id}")
         
         return {
             "application_id": application_id,
             "job_id": job_id,
-            "stage": "login",
+            "stage": "queued",
             "message": "Automation started successfully"
         }
         
@@ -267,46 +363,73 @@ async def start_automation(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def _du_status_payload(application_id: str, status: dict) -> dict:
+    """Status response body for a DU application (also the SSE snapshot)"""
+    # Determine next step
+    next_step = None
+    if status["job_status"] == "otp_required":
+        next_step = "Please enter the OTP sent to your mobile number"
+    elif status["job_status"] == "payment":
+        next_step = "Please complete the payment"
+    elif status["job_status"] == "completed":
+        next_step = "Application completed successfully"
+    
+    # Get documents if available
+    documents = None
+    if status["receipt_path"] or status["admit_card_path"]:
+        documents = {
+            "receipt": status["receipt_path"],
+            "admit_card": status["admit_card_path"]
+        }
+    
+    return {
+        "application_id": application_id,
+        "job_status": status["job_status"],
+        "current_stage": status["current_stage"],
+        "stage_message": status["stage_message"],
+        "next_step": next_step,
+        "sms_code": status["sms_code"],  # Include SMS code for OTP
+        "documents": documents
+    }
+
+
+def _cached_status(portal: str, application_id: str, load) -> Optional[dict]:
+    """Status projection from the status cache, loading it with load(db, id) on a miss"""
+    def load_status():
+        db = SessionLocal()
+        try:
+            return load(db, application_id)
+        finally:
+            db.close()
+    return status_cache.get(portal, application_id, load_status)
+
+
+def _conditional_response(payload: dict, request: Request, response: Response):
+    """304 when the client's If-None-Match is current, else the payload with its ETag"""
+    tag = etag(payload)
+    if_none_match = request.headers.get("if-none-match", "")
+    if tag in [value.strip() for value in if_none_match.split(",")]:
+        return Response(status_code=304, headers={"ETag": tag, "Cache-Control": "no-cache"})
+    response.headers["ETag"] = tag
+    response.headers["Cache-Control"] = "no-cache"
+    return payload
+
+
 @app.get("/api/uni/status/{application_id}", response_model=schemas.StatusResponse)
 async def get_status(
     application_id: str,
-    db: Session = Depends(get_db)
+    request: Request,
+    response: Response
 ):
     """
-    Get current automation status
+    Get current automation status (served from the status cache; supports If-None-Match)
     """
     try:
-        app = crud.get_application(db, application_id)
-        if not app:
+        status = _cached_status("du", application_id, crud.get_application_status)
+        if not status:
             raise HTTPException(status_code=404, detail="Application not found")
         
-        # Determine next step
-        next_step = None
-        if app.job_status == "otp_required":
-            next_step = "Please enter the OTP sent to your mobile number"
-        elif app.job_status == "payment":
-            next_step = "Please complete the payment"
-        elif app.job_status == "completed":
-            next_step = "Application completed successfully"
-        
-        # Get documents if available
-        documents = None
-        if app.receipt_path or app.admit_card_path:
-            documents = {
-                "receipt": app.receipt_path,
-                "admit_card": app.admit_card_path
-            }
-        
-        return {
-            "application_id": application_id,
-            "job_status": app.job_status,
-            "current_stage": app.current_stage,
-            "stage_message": app.stage_message,
-            "next_step": next_step,
-            "sms_code": app.sms_code,  # Include SMS code for OTP
-            "documents": documents
-        }
-
+        return _conditional_response(_du_status_payload(application_id, status), request, response)
         
     except HTTPException:
         raise
@@ -315,6 +438,36 @@ async def get_status(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def _event_stream_response(application_id: str, request: Request, last_event_id: Optional[int], snapshot) -> StreamingResponse:
+    """SSE response resuming after the Last-Event-ID header (or ?last_event_id=) when given"""
+    header = request.headers.get("last-event-id")
+    if header and header.isdigit():
+        last_event_id = int(header)
+    return StreamingResponse(
+        status_bus.stream(application_id, last_event_id, snapshot),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.get("/api/uni/status/{application_id}/events")
+async def stream_status(
+    application_id: str,
+    request: Request,
+    last_event_id: Optional[int] = Query(None)
+):
+    """
+    Server-Sent Events stream of stage changes, the SMS code, payment and documents
+    """
+    if not _cached_status("du", application_id, crud.get_application_status):
+        raise HTTPException(status_code=404, detail="Application not found")
+    
+    def snapshot():
+        return _du_status_payload(application_id, _cached_status("du", application_id, crud.get_application_status))
+    
+    return _event_stream_response(application_id, request, last_event_id, snapshot)
+
+
 @app.post("/api/uni/submit-otp")
 async def submit_otp(
     request: schemas.OTPSubmit,
@@ -340,8 +493,8 @@ async def submit_otp(
         # Resume automation with OTP
         logger.info(f"Resuming automation with OTP for {application_id}")
         
-        # Run in background
-        asyncio.create_task(resume_automation_after_otp(application_id, job_id, otp_code))
+        # Wake the parked job; it resumes on the next free worker slot
+        wake_automation_with_otp(application_id, job_id, otp_code)
         
         return {
             "status": "resumed",
@@ -356,6 +509,30 @@ async def submit_otp(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/api/uni/cancel/{application_id}")
+async def cancel_application_automation(
+    application_id: str,
+    db: Session = Depends(get_db)
+):
+    """
+    Cancel the application's automation, whether queued, running or waiting
+    """
+    app = crud.get_application(db, application_id)
+    if not app:
+        raise HTTPException(status_code=404, detail="Application not found")
+    
+    if not app.job_id or app.job_status in ["completed", "failed", "cancelled"]:
+        raise HTTPException(status_code=400, detail="No automation in progress")
+    
+    cancel_automation(application_id, app.job_id)
+    
+    return {
+        "status": "cancelling",
+        "job_id": app.job_id,
+        "message": "Cancelling automation..."
+    }
+
+
 @app.get("/api/uni/get-payment-url", response_model=schemas.PaymentURLResponse)
 async def get_payment_url(
     application_id: str = Query(...),
@@ -420,14 +597,17 @@ async def payment_callback(
             
             if verification.get('success'):
                 # Find application by transaction ID
-                # Note: This is simplified - in production, you'd query by transaction_id
-                # For now, we'll need to pass application_id in the callback
+                app = crud.get_application_by_transaction(db, tran_id)
+                if not app:
+                    logger.error(f"No application for transaction {tran_id}")
+                    return RedirectResponse(url=f"{settings.frontend_url}/applications?payment=error")
                 
                 # Update payment status
-                # crud.update_payment_status(db, application_id, "completed", tran_id)
+                crud.update_payment_status(db, app.id, "completed", tran_id)
                 
                 # Resume automation to download documents
-                # asyncio.create_task(complete_automation_after_payment(application_id, job_id))
+                if app.job_id:
+                    wake_automation_after_payment(app.id, app.job_id)
                 
                 logger.info(f"Payment verified successfully: {tran_id}")
                 
@@ -513,7 +693,19 @@ async def download_document(
 import bup_crud
 import bup_schemas
 from bup_photo_utils import process_bup_photo, process_bup_signature
-from bup_tasks import start_bup_automation_background, complete_bup_automation_after_payment
+from photo_utils import BUP_PHOTO, BUP_SIGNATURE
+from bup_tasks import (
+    start_bup_automation_background,
+    wake_bup_automation_after_payment,
+    cancel_bup_automation,
+    start_gazetteer_refresh,
+    GAZETTEER_CAPTCHA_PREFIX
+)
+from bup_captcha import captcha_relay
+from bup_gazetteer import gazetteer
+
+# BUP converts photos/signatures to JPEG itself, so PNG uploads are accepted too
+BUP_IMAGE_FORMATS = ("JPEG", "PNG")
 
 
 @app.post("/api/bup/apply", response_model=bup_schemas.BUPApplicationResponse)
@@ -576,45 +768,36 @@ async def create_bup_application(
     try:
         logger.info(f"Creating BUP application for {candidate_name}")
         
+        # Resolve addresses against the portal's dropdown options before doing any work
+        present = gazetteer.resolve(present_division, present_district, present_thana)
+        if not present["success"]:
+            raise HTTPException(status_code=400, detail=f"Present address: {present['message']}")
+        present_division, present_district, present_thana = present["division"], present["district"], present["thana"]
+        
+        if not same_as_present and (permanent_division or permanent_district or permanent_thana):
+            permanent = gazetteer.resolve(
+                permanent_division or present_division,
+                permanent_district or present_district,
+                permanent_thana or present_thana
+            )
+            if not permanent["success"]:
+                raise HTTPException(status_code=400, detail=f"Permanent address: {permanent['message']}")
+            permanent_division, permanent_district, permanent_thana = (
+                permanent["division"], permanent["district"], permanent["thana"]
+            )
+        
         # Generate application ID
         app_id = f"BUP-{generate_application_id()}"
         
-        # Process and save photo
-        photo_dir = "./uploads/photos"
-        os.makedirs(photo_dir, exist_ok=True)
-        
-        temp_photo_path = os.path.join(photo_dir, f"{app_id}_temp_photo.jpg")
-        final_photo_path = os.path.join(photo_dir, f"{app_id}_photo.jpg")
-        
-        with open(temp_photo_path, "wb") as buffer:
-            shutil.copyfileobj(photo.file, buffer)
-        
-        success, message, size = process_bup_photo(temp_photo_path, final_photo_path)
-        if os.path.exists(temp_photo_path):
-            os.remove(temp_photo_path)
-        
-        if not success:
-            raise HTTPException(status_code=400, detail=message)
+        # Read uploads (checked for type and size before the full read)
+        photo_data = await _read_image_upload(photo, "Photo", BUP_IMAGE_FORMATS)
+        signature_data = await _read_image_upload(signature, "Signature", BUP_IMAGE_FORMATS)
         
+        # Process photo and signature in the image pool, or reuse them from the image store
+        final_photo_path, message = await _store_image(process_bup_photo, photo_data, BUP_PHOTO)
         logger.info(f"Photo processed: {message}")
         
-        # Process and save signature
-        sig_dir = "./uploads/signatures"
-        os.makedirs(sig_dir, exist_ok=True)
-        
-        temp_sig_path = os.path.join(sig_dir, f"{app_id}_temp_sig.jpg")
-        final_sig_path = os.path.join(sig_dir, f"{app_id}_signature.jpg")
-        
-        with open(temp_sig_path, "wb") as buffer:
-            shutil.copyfileobj(signature.file, buffer)
-        
-        success, message, size = process_bup_signature(temp_sig_path, final_sig_path)
-        if os.path.exists(temp_sig_path):
-            os.remove(temp_sig_path)
-        
-        if not success:
-            raise HTTPException(status_code=400, detail=message)
-        
+        final_sig_path, message = await _store_image(process_bup_signature, signature_data, BUP_SIGNATURE)
         logger.info(f"Signature processed: {message}")
         
         # Parse date of birth
@@ -679,6 +862,7 @@ async def create_bup_application(
         db_app = bup_crud.create_bup_application(db, app_data)
         
         logger.info(f"BUP application created: {app_id}")
+        prewarm_registry.start(app_id, "bup")
         
         return db_app
         
@@ -706,7 +890,7 @@ async def start_bup_automation(
             raise HTTPException(status_code=404, detail="Application not found")
         
         # Check if already running
-        if app.job_status in ["running", "payment_pending"]:
+        if app.job_status in ["queued", "running", "captcha_required", "payment_pending", "downloading"]:
             return {
                 "application_id": application_id,
                 "job_id": app.job_id,
@@ -717,18 +901,22 @@ async def start_bup_automation(
         # Generate job ID
         job_id = generate_job_id()
         
-        # Update job ID in database
-        bup_crud.update_bup_job_id(db, application_id, job_id)
-        
-        # Start automation in background
-        start_bup_automation_background(application_id, job_id)
+        # Queue automation; this also records the job ID and marks the application queued
+        queued_job_id = start_bup_automation_background(application_id, job_id)
+        if queued_job_id != job_id:
+            return {
+                "application_id": application_id,
+                "job_id": queued_job_id,
+                "stage": "queued",
+                "message": "Automation already in progress"
+            }
         
         logger.info(f"Started BUP automation for application {application_id}, job {job_id}")
         
         return {
             "application_id": application_id,
             "job_id": job_id,
-            "stage": "initialization",
+            "stage": "queued",
             "message": "BUP automation started successfully"
         }
         
@@ -739,42 +927,54 @@ async def start_bup_automation(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def _bup_status_payload(application_id: str, status: dict) -> dict:
+    """Status response body for a BUP application (also the SSE snapshot)"""
+    # Determine next step
+    next_step = None
+    captcha_url = None
+    if status["job_status"] == "payment_pending":
+        next_step = "Please complete the payment to continue"
+    elif status["job_status"] == "captcha_required":
+        next_step = "Please solve the CAPTCHA to continue"
+        if captcha_relay.get(application_id):
+            captcha_url = f"/api/bup/captcha/{application_id}"
+    elif status["job_status"] == "completed":
+        next_step = "Application completed successfully"
+    
+    # Get documents if available
+    documents = None
+    if status["admission_slip_path"] or status["receipt_path"]:
+        documents = {
+            "admission_slip": status["admission_slip_path"],
+            "receipt": status["receipt_path"]
+        }
+    
+    return {
+        "application_id": application_id,
+        "job_status": status["job_status"],
+        "current_stage": status["current_stage"],
+        "stage_message": status["stage_message"],
+        "next_step": next_step,
+        "documents": documents,
+        "captcha_url": captcha_url
+    }
+
+
 @app.get("/api/bup/status/{application_id}", response_model=bup_schemas.BUPStatusResponse)
 async def get_bup_status(
     application_id: str,
-    db: Session = Depends(get_db)
+    request: Request,
+    response: Response
 ):
     """
-    Get current BUP automation status
+    Get current BUP automation status (served from the status cache; supports If-None-Match)
     """
     try:
-        app = bup_crud.get_bup_application(db, application_id)
-        if not app:
+        status = _cached_status("bup", application_id, bup_crud.get_bup_application_status)
+        if not status:
             raise HTTPException(status_code=404, detail="Application not found")
         
-        # Determine next step
-        next_step = None
-        if app.job_status == "payment_pending":
-            next_step = "Please complete the payment to continue"
-        elif app.job_status == "completed":
-            next_step = "Application completed successfully"
-        
-        # Get documents if available
-        documents = None
-        if app.admission_slip_path or app.receipt_path:
-            documents = {
-                "admission_slip": app.admission_slip_path,
-                "receipt": app.receipt_path
-            }
-        
-        return {
-            "application_id": application_id,
-            "job_status": app.job_status,
-            "current_stage": app.current_stage,
-            "stage_message": app.stage_message,
-            "next_step": next_step,
-            "documents": documents
-        }
+        return _conditional_response(_bup_status_payload(application_id, status), request, response)
         
     except HTTPException:
         raise
@@ -783,6 +983,169 @@ async def get_bup_status(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/api/bup/status/{application_id}/events")
+async def stream_bup_status(
+    application_id: str,
+    request: Request,
+    last_event_id: Optional[int] = Query(None)
+):
+    """
+    Server-Sent Events stream of BUP stage changes, payment and documents
+    """
+    if not _cached_status("bup", application_id, bup_crud.get_bup_application_status):
+        raise HTTPException(status_code=404, detail="Application not found")
+    
+    def snapshot():
+        return _bup_status_payload(application_id, _cached_status("bup", application_id, bup_crud.get_bup_application_status))
+    
+    return _event_stream_response(application_id, request, last_event_id, snapshot)
+
+
+@app.post("/api/status/batch")
+async def get_status_batch(
+    request: schemas.StatusBatchRequest,
+    db: Session = Depends(get_db)
+):
+    """
+    Statuses of many DU and BUP applications in one request (one query per portal)
+    
+    With `since`, only applications updated at or after it are returned; pass the
+    previous response's `as_of` to poll for changes. Unknown ids are left out.
+    """
+    try:
+        du_ids = list(dict.fromkeys(request.du))
+        bup_ids = list(dict.fromkeys(request.bup))
+        if len(du_ids) + len(bup_ids) > settings.status_batch_max_ids:
+            raise HTTPException(
+                status_code=400,
+                detail=f"At most {settings.status_batch_max_ids} application ids per request"
+            )
+        
+        since = request.since
+        if since is not None and since.tzinfo is not None:
+            since = since.astimezone(timezone.utc).replace(tzinfo=None)
+        as_of = datetime.utcnow()
+        
+        statuses = {"du": {}, "bup": {}}
+        for app_id, status in crud.get_application_statuses(db, du_ids, since).items():
+            statuses["du"][app_id] = {**_du_status_payload(app_id, status), "updated_at": status["updated_at"]}
+        for app_id, status in bup_crud.get_bup_application_statuses(db, bup_ids, since).items():
+            statuses["bup"][app_id] = {**_bup_status_payload(app_id, status), "updated_at": status["updated_at"]}
+        
+        return {"as_of": as_of.isoformat(), **statuses}
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error getting batch status: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/api/bup/address/resolve")
+async def resolve_bup_address(
+    division: str = Query(...),
+    district: str = Query(...),
+    thana: str = Query(...)
+):
+    """
+    Check an address against the BUP portal's division/district/thana options
+    """
+    return gazetteer.resolve(division, district, thana)
+
+
+@app.get("/api/bup/address/gazetteer")
+async def bup_gazetteer_stats():
+    """Size and age of the BUP address index"""
+    return {**gazetteer.stats(), "needs_refresh": gazetteer.needs_refresh()}
+
+
+@app.post("/api/bup/address/gazetteer/refresh")
+async def refresh_bup_gazetteer(
+    application_id: str = Query(...),
+    db: Session = Depends(get_db)
+):
+    """
+    Rebuild the BUP address index from the portal (maintenance)
+    The address form is only reachable after SSC/HSC verification, so the
+    refresh uses this application's exam details in a separate portal session;
+    the application itself is not submitted or changed. If the portal shows a
+    CAPTCHA, it is relayed under the returned captcha_key.
+    """
+    if not bup_crud.get_bup_application(db, application_id):
+        raise HTTPException(status_code=404, detail="Application not found")
+    
+    job_id = start_gazetteer_refresh(application_id)
+    if job_id is None:
+        raise HTTPException(status_code=409, detail="A gazetteer refresh is already running")
+    
+    return {
+        "status": "refreshing",
+        "job_id": job_id,
+        "captcha_key": f"{GAZETTEER_CAPTCHA_PREFIX}{application_id}",
+        "message": "Gazetteer refresh started"
+    }
+
+
+@app.get("/api/bup/captcha/{application_id}")
+async def get_bup_captcha(application_id: str):
+    """
+    Get the CAPTCHA image the automation is waiting on (PNG)
+    """
+    challenge = captcha_relay.get(application_id)
+    if not challenge:
+        raise HTTPException(status_code=404, detail="No CAPTCHA pending for this application")
+    
+    return Response(
+        content=challenge.image,
+        media_type="image/png",
+        headers={
+            "Cache-Control": "no-store",
+            "X-Captcha-Type": challenge.captcha_type,
+            "X-Captcha-Attempt": str(challenge.attempt)
+        }
+    )
+
+
+@app.post("/api/bup/captcha/submit")
+async def submit_bup_captcha(request: bup_schemas.BUPCaptchaSubmit):
+    """
+    Submit a CAPTCHA solution to resume automation
+    """
+    if not captcha_relay.submit(request.application_id, request.solution.strip()):
+        raise HTTPException(status_code=404, detail="No CAPTCHA pending for this application")
+    
+    logger.info(f"CAPTCHA solution submitted for {request.application_id}")
+    return {
+        "status": "submitted",
+        "stage": "captcha",
+        "message": "CAPTCHA submitted, verifying..."
+    }
+
+
+@app.post("/api/bup/cancel/{application_id}")
+async def cancel_bup_application_automation(
+    application_id: str,
+    db: Session = Depends(get_db)
+):
+    """
+    Cancel the BUP application's automation, whether queued, running or waiting
+    """
+    app = bup_crud.get_bup_application(db, application_id)
+    if not app:
+        raise HTTPException(status_code=404, detail="Application not found")
+    
+    if not app.job_id or app.job_status in ["completed", "failed", "cancelled"]:
+        raise HTTPException(status_code=400, detail="No automation in progress")
+    
+    cancel_bup_automation(application_id, app.job_id)
+    
+    return {
+        "status": "cancelling",
+        "job_id": app.job_id,
+        "message": "Cancelling automation..."
+    }
+
+
 @app.get("/api/bup/get-payment-url", response_model=bup_schemas.BUPPaymentURLResponse)
 async def get_bup_payment_url(
     application_id: str = Query(...),
@@ -847,11 +1210,17 @@ async def bup_payment_callback(
             
             if verification.get('success'):
                 # Find application by transaction ID
+                app = bup_crud.get_bup_application_by_transaction(db, tran_id)
+                if not app:
+                    logger.error(f"No BUP application for transaction {tran_id}")
+                    return RedirectResponse(url=f"{settings.frontend_url}/applications?payment=error")
+                
                 # Update payment status
-                bup_crud.update_bup_payment_status(db, application_id, "completed", tran_id)
+                bup_crud.update_bup_payment_status(db, app.id, "completed", tran_id)
                 
                 # Resume automation to download documents
-                # asyncio.create_task(complete_bup_automation_after_payment(application_id, job_id))
+                if app.job_id:
+                    wake_bup_automation_after_payment(app.id, app.job_id)
                 
                 logger.info(f"BUP payment verified successfully: {tran_id}")
                 
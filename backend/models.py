@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, Float, Boolean, DateTime, ForeignKey, Text
+from sqlalchemy import Column, String, Integer, Float, Boolean, DateTime, ForeignKey, Text, JSON, UniqueConstraint, Index, text
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from database import Base
@@ -82,3 +82,102 @@ class UniDocument(Base):
     
     # Relationships
     application = relationship("UniApplication", back_populates="documents")
+
+
+class UniJob(Base):
+    """DU automation job and its paused browser session"""
+    __tablename__ = "uni_jobs"
+    
+    id = Column(String, primary_key=True, index=True)
+    application_id = Column(String, ForeignKey("uni_applications.id"), nullable=False)
+    
+    status = Column(String, default="running")  # running, paused, completed, failed
+    
+    # Session snapshot (Playwright storage_state plus the page URL and HTML)
+    storage_state = Column(JSON, nullable=True)
+    
+    # Pause/Resume
+    paused_for = Column(String, nullable=True)  # otp, payment
+    pause_timestamp = Column(DateTime, nullable=True)
+    resume_timestamp = Column(DateTime, nullable=True)
+    
+    # Timestamps
+    created_at = Column(DateTime, default=datetime.utcnow)
+    completed_at = Column(DateTime, nullable=True)
+
+
+class AutomationQueueItem(Base):
+    """Durable automation job queue entry (DU and BUP)"""
+    __tablename__ = "automation_queue"
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    portal = Column(String, nullable=False)  # du, bup
+    application_id = Column(String, nullable=False, index=True)
+    job_id = Column(String, nullable=False, index=True)  # job of the current attempt
+    
+    state = Column(String, default="queued", index=True)  # queued, running, parked, done, failed, cancelled
+    attempts = Column(Integer, default=0)
+    
+    # Lease: a queued item becomes claimable at visible_at; a running or parked
+    # one belongs to worker_id until visible_at passes without a heartbeat
+    visible_at = Column(DateTime, default=datetime.utcnow, index=True)
+    worker_id = Column(String, nullable=True)
+    last_error = Column(Text, nullable=True)
+    
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+    
+    # At most one queued, running or parked item per application
+    __table_args__ = (
+        Index(
+            "uq_automation_queue_active_application", "application_id", unique=True,
+            sqlite_where=text("state IN ('queued', 'running', 'parked')")
+        ),
+    )
+
+
+class AutomationMessage(Base):
+    """A message (OTP, payment, cancel) for a job leased by another worker"""
+    __tablename__ = "automation_messages"
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    portal = Column(String, nullable=False)
+    application_id = Column(String, nullable=False)
+    job_id = Column(String, nullable=False, index=True)
+    message = Column(String, nullable=False)  # otp_submitted, payment_verified, cancel
+    payload = Column(JSON, nullable=True)
+    
+    worker_id = Column(String, nullable=True, index=True)  # lease holder when it was sent
+    state = Column(String, default="pending", index=True)  # pending, delivered
+    
+    created_at = Column(DateTime, default=datetime.utcnow)
+    delivered_at = Column(DateTime, nullable=True)
+
+
+class StatusEvent(Base):
+    """An application status change, streamed to clients over SSE (id is the event id)"""
+    __tablename__ = "status_events"
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    portal = Column(String, nullable=False)  # du, bup
+    application_id = Column(String, nullable=False, index=True)
+    event = Column(String, nullable=False)  # stage, sms_code, document, payment
+    data = Column(JSON, nullable=True)
+    
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+
+class ProcessedImage(Base):
+    """A processed photo/signature in the image store, keyed by upload hash and output spec"""
+    __tablename__ = "processed_images"
+    __table_args__ = (UniqueConstraint("source_hash", "spec"),)
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    source_hash = Column(String, nullable=False)  # sha256 of the uploaded bytes
+    spec = Column(String, nullable=False)  # JpegSpec.key the output was made for
+    path = Column(String, nullable=False, index=True)  # Named by the output's hash, so shared by identical outputs
+    size = Column(Integer, nullable=False)
+    message = Column(String, nullable=True)  # Processor message from when it was made
+    
+    created_at = Column(DateTime, default=datetime.utcnow)
+    last_used_at = Column(DateTime, default=datetime.utcnow, index=True)
@@ -1,15 +1,212 @@
-from PIL import Image
+from PIL import Image, ImageOps, ExifTags
+import io
 import os
-from typing import Tuple
+from typing import Optional, Tuple, Union
+from config import get_settings
 
+settings = get_settings()
 
-def validate_photo(file_path: str) -> Tuple[bool, str]:
+# Decode to at least this multiple of the output size before the LANCZOS
+# resize: fast, and visually the same as resizing from the full image
+REDUCING_GAP = 2.0
+
+# EXIF orientations that rotate the image a quarter turn (width and height swap)
+TRANSPOSED_ORIENTATIONS = (5, 6, 7, 8)
+
+# Leading bytes of the image formats uploads may be in
+IMAGE_SIGNATURES = {
+    "JPEG": b"\xff\xd8\xff",
+    "PNG": b"\x89PNG\r\n\x1a\n",
+}
+
+
+def sniff_image_format(header: bytes) -> Optional[str]:
+    """Image format from the first bytes of a file, or None if not a known image"""
+    for image_format, signature in IMAGE_SIGNATURES.items():
+        if header.startswith(signature):
+            return image_format
+    return None
+
+
+def open_image(source: Union[str, bytes]) -> Image.Image:
+    """Open an image from a file path or from uploaded bytes"""
+    if isinstance(source, bytes):
+        return Image.open(io.BytesIO(source))
+    return Image.open(source)
+
+
+def load_image(source: Union[str, bytes], size: Tuple[int, int]) -> Image.Image:
+    """
+    Open an image decoded at only the resolution needed for an output of size
+    
+    Images over UPLOAD_MAX_IMAGE_PIXELS are refused from the header, before
+    decoding. JPEGs decode with DCT scaling (draft) to about REDUCING_GAP
+    times size, so a 4000x3000 photo decodes at a quarter or an eighth of its
+    resolution. EXIF orientation is applied, and the result is RGB.
+    """
+    img = open_image(source)
+    pixels = img.width * img.height
+    if pixels > settings.upload_max_image_pixels:
+        raise ValueError(
+            f"image is {img.width}x{img.height} "
+            f"(max {settings.upload_max_image_pixels / 1_000_000:g} megapixels)"
+        )
+    
+    # draft works on the stored (unrotated) image, so swap the box for quarter turns
+    width, height = size
+    if img.getexif().get(ExifTags.Base.Orientation, 1) in TRANSPOSED_ORIENTATIONS:
+        width, height = height, width
+    img.draft('RGB', (int(width * REDUCING_GAP), int(height * REDUCING_GAP)))
+    
+    img = ImageOps.exif_transpose(img)
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    return img
+
+
+def write_file(output_path: str, data: bytes):
+    """Write a processed image in one go"""
+    with open(output_path, 'wb') as f:
+        f.write(data)
+
+
+class JpegSpec:
+    """Output requirements for a processed image"""
+    
+    def __init__(self, name: str, width: int, height: int, max_kb: float, min_kb: float = 0, quality: int = 95):
+        self.name = name
+        self.width = width
+        self.height = height
+        self.max_bytes = int(max_kb * 1024)
+        self.min_bytes = int(min_kb * 1024)
+        self.quality = quality  # Preferred quality; searched away from only when the size is out of range
+    
+    @property
+    def key(self) -> str:
+        """Identifies the output for the image store; changes whenever the requirements do"""
+        return f"{self.name}:{self.width}x{self.height}:{self.min_bytes}-{self.max_bytes}:q{self.quality}"
+
+
+DU_PHOTO = JpegSpec("du_photo", 470, 610, max_kb=200, min_kb=30, quality=85)
+BUP_PHOTO = JpegSpec("bup_photo", 300, 300, max_kb=100)
+BUP_SIGNATURE = JpegSpec("bup_signature", 300, 80, max_kb=60)
+
+# Qualities the search may use: the same 5-point grid the encoder always
+# stepped through, so outputs match the old linear walk
+QUALITY_GRID = list(range(50, 100, 5))
+
+# Typical JPEG size at each quality relative to quality 85 (measured on photos
+# with Pillow's encoder, optimize=True); seeds the quality search
+RELATIVE_SIZE = {
+    50: 0.45, 55: 0.49, 60: 0.54, 65: 0.60, 70: 0.66, 75: 0.74,
+    80: 0.86, 85: 1.00, 90: 1.22, 95: 1.60
+}
+
+
+class JpegResult:
+    def __init__(self, data: Optional[bytes], quality: int, size: int, passes: int):
+        self.data = data  # None when no quality in range meets the spec
+        self.quality = quality
+        self.size = size
+        self.passes = passes
+
+
+def _predict(grid: list, lo: int, hi: int, target: int, sizes: dict, highest: bool) -> int:
+    """
+    Index in grid[lo..hi] the size model expects to land closest to target on
+    the allowed side: interpolated between the encoded qualities either side
+    of the range when both exist, else scaled from RELATIVE_SIZE
+    """
+    below = grid[lo - 1] if lo > 0 else None
+    above = grid[hi + 1] if hi + 1 < len(grid) else None
+    if below in sizes and above in sizes and sizes[above] > sizes[below]:
+        def predicted(quality):
+            return sizes[below] + (sizes[above] - sizes[below]) * (quality - below) / (above - below)
+    else:
+        nearest = below if below in sizes else above
+        scale = sizes[nearest] / RELATIVE_SIZE[nearest]
+        
+        def predicted(quality):
+            return scale * RELATIVE_SIZE[quality]
+    
+    indexes = range(hi, lo - 1, -1) if highest else range(lo, hi + 1)
+    for index in indexes:
+        if (predicted(grid[index]) <= target) if highest else (predicted(grid[index]) >= target):
+            return index
+    return lo if highest else hi
+
+
+def encode_jpeg(img: Image.Image, spec: JpegSpec, predict: bool = True) -> JpegResult:
+    """
+    Encode img as JPEG within spec's size range, in memory
+    
+    Tries the spec's preferred quality first. If that is too large, binary
+    searches QUALITY_GRID for the highest quality that fits; if too small,
+    for the lowest that is big enough. predict picks each probe from a size
+    model instead of the midpoint, falling back to the midpoint whenever a
+    model probe fails to halve the range, so it never does much worse than
+    plain bisection. passes counts the encodes, for comparing strategies.
+    """
+    grid = QUALITY_GRID
+    sizes: dict = {}
+    encoded: dict = {}
+    
+    def size_at(quality: int) -> int:
+        if quality not in sizes:
+            buffer = io.BytesIO()
+            img.save(buffer, 'JPEG', quality=quality, optimize=True)
+            encoded[quality] = buffer.getvalue()
+            sizes[quality] = len(encoded[quality])
+        return sizes[quality]
+    
+    def fits(quality: int) -> bool:
+        return spec.min_bytes <= size_at(quality) <= spec.max_bytes
+    
+    best = spec.quality if fits(spec.quality) else None
+    too_large = sizes[spec.quality] > spec.max_bytes
+    if best is None:
+        # Too large: highest quality whose size is at most max_bytes.
+        # Too small: lowest quality whose size is at least min_bytes.
+        start = grid.index(spec.quality)
+        if too_large:
+            lo, hi, target = 0, start - 1, spec.max_bytes
+        else:
+            lo, hi, target = start + 1, len(grid) - 1, spec.min_bytes
+        use_model = predict
+        while lo <= hi:
+            width = hi - lo + 1
+            if use_model:
+                index = _predict(grid, lo, hi, target, sizes, too_large)
+            else:
+                index = (lo + hi + too_large) // 2
+            quality = grid[index]
+            
+            if too_large and size_at(quality) <= target:
+                lo = index + 1
+            elif too_large:
+                hi = index - 1
+            elif size_at(quality) >= target:
+                hi = index - 1
+            else:
+                lo = index + 1
+            if fits(quality) and (best is None or (quality > best if too_large else quality < best)):
+                best = quality
+            use_model = predict and (hi - lo + 1) <= width // 2
+    
+    if best is None:
+        # Report the attempt that came closest (smallest when too large, largest when too small)
+        closest = (min if too_large else max)(sizes, key=sizes.get)
+        return JpegResult(None, closest, sizes[closest], len(sizes))
+    return JpegResult(encoded[best], best, sizes[best], len(sizes))
+
+
+def validate_photo(source: Union[str, bytes]) -> Tuple[bool, str]:
     """
     Validate photo file type
     Returns: (is_valid, error_message)
     """
     try:
-        img = Image.open(file_path)
+        img = open_image(source)
         if img.format not in ['JPEG', 'JPG']:
             return False, "Only JPEG/JPG images are allowed"
         return True, ""
@@ -17,7 +214,7 @@ def validate_photo(file_path: str) -> Tuple[bool, str]:
         return False, f"Invalid image file: {str(e)}"
 
 
-def process_photo(input_path: str, output_path: str) -> Tuple[bool, str]:
+def process_photo(source: Union[str, bytes], output_path: str) -> Tuple[bool, str]:
     """
     Process photo to meet DU requirements:
     - Width: 460-480 px
@@ -28,16 +225,12 @@ def process_photo(input_path: str, output_path: str) -> Tuple[bool, str]:
     Returns: (success, message)
     """
     try:
-        # Open image
-        img = Image.open(input_path)
-        
-        # Convert to RGB if necessary (for PNG with transparency, etc.)
-        if img.mode != 'RGB':
-            img = img.convert('RGB')
+        # Open image, decoded near the target size, upright, in RGB
+        img = load_image(source, (DU_PHOTO.width, DU_PHOTO.height))
         
         # Target dimensions (middle of the range)
-        target_width = 470
-        target_height = 610
+        target_width = DU_PHOTO.width
+        target_height = DU_PHOTO.height
         
         # Resize image maintaining aspect ratio, then crop to exact size
         img_ratio = img.width / img.height
@@ -52,7 +245,7 @@ def process_photo(input_path: str, output_path: str) -> Tuple[bool, str]:
             new_width = target_width
             new_height = int(target_width / img_ratio)
         
-        img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
+        img = img.resize((new_width, new_height), Image.Resampling.LANCZOS, reducing_gap=REDUCING_GAP)
         
         # Crop to exact dimensions (center crop)
         left = (new_width - target_width) // 2
@@ -61,30 +254,18 @@ def process_photo(input_path: str, output_path: str) -> Tuple[bool, str]:
         bottom = top + target_height
         img = img.crop((left, top, right, bottom))
         
-        # Save with compression to meet size requirements (30-200 KB)
-        quality = 85
-        img.save(output_path, 'JPEG', quality=quality, optimize=True)
-        
-        # Check file size and adjust quality if needed
-        file_size_kb = os.path.getsize(output_path) / 1024
-        
-        # If too large, reduce quality
-        while file_size_kb > 200 and quality > 50:
-            quality -= 5
-            img.save(output_path, 'JPEG', quality=quality, optimize=True)
-            file_size_kb = os.path.getsize(output_path) / 1024
-        
-        # If too small, increase quality
-        while file_size_kb < 30 and quality < 95:
-            quality += 5
-            img.save(output_path, 'JPEG', quality=quality, optimize=True)
-            file_size_kb = os.path.getsize(output_path) / 1024
-        
-        # Final check
-        if file_size_kb < 30 or file_size_kb > 200:
+        # Compress in memory to meet size requirements (30-200 KB)
+        result = encode_jpeg(img, DU_PHOTO)
+        file_size_kb = result.size / 1024
+        if result.data is None:
             return False, f"Unable to compress image to required size (current: {file_size_kb:.1f} KB)"
         
-        return True, f"Photo processed successfully ({file_size_kb:.1f} KB, {target_width}x{target_height}px)"
+        # Only the final image touches the disk
+        write_file(output_path, result.data)
+        return True, (
+            f"Photo processed successfully ({file_size_kb:.1f} KB, {target_width}x{target_height}px, "
+            f"quality {result.quality}, encodes: {result.passes})"
+        )
         
     except Exception as e:
         return False, f"Error processing photo: {str(e)}"
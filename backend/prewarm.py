@@ -0,0 +1,148 @@
+"""
+Speculative Prewarm
+Loads the portal's landing page for an application as soon as it is created,
+while the user is still on the confirmation screen, so start-automation
+begins from an already loaded page instead of a cold context and goto.
+
+Prewarmed automations hold a pooled context, so they expire after a TTL, are
+capped in number, and are the first thing given back when the pool is full.
+"""
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict
+from config import get_settings
+from automation_runtime import run_on_automation_loop
+from browser_pool import register_pressure_hook
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+
+def _new_automation(portal: str):
+    if portal == "du":
+        from rpa import DUAutomation
+        return DUAutomation()
+    from bup_http import create_bup_automation
+    return create_bup_automation()
+
+
+class PrewarmEntry:
+    """An automation being (or already) warmed for an application"""
+
+    def __init__(self, portal: str, automation, task: asyncio.Task):
+        self.portal = portal
+        self.automation = automation
+        self.task = task
+        self.created_at = time.monotonic()
+
+
+class PrewarmRegistry:
+    """
+    Prewarmed automations by application id; all state lives on the automation loop
+
+    - start(): warm an automation for a new application (from any thread)
+    - claim(): hand it to the job that starts the application, waiting for a
+      preload still in flight; None if there is nothing usable
+    """
+
+    def __init__(self):
+        self._entries: "OrderedDict[str, PrewarmEntry]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+
+    def start(self, application_id: str, portal: str):
+        """Schedule a prewarm if enabled (call from any thread)"""
+        if settings.prewarm_enabled:
+            run_on_automation_loop(self._start(application_id, portal))
+
+    async def _start(self, application_id: str, portal: str):
+        if application_id in self._entries:
+            return
+        while len(self._entries) >= settings.prewarm_max_contexts:
+            if not await self._discard_oldest():
+                return
+
+        automation = _new_automation(portal)
+        task = asyncio.create_task(self._warm(application_id, automation))
+        self._entries[application_id] = PrewarmEntry(portal, automation, task)
+        asyncio.get_running_loop().call_later(
+            settings.prewarm_ttl, lambda: asyncio.create_task(self._expire(application_id, task))
+        )
+
+    async def _warm(self, application_id: str, automation) -> bool:
+        try:
+            await automation.initialize()
+            await automation.preload()
+            logger.info(f"[{application_id}] Prewarmed portal landing page")
+            return True
+        except Exception as e:
+            logger.warning(f"[{application_id}] Prewarm failed: {str(e)}")
+            return False
+
+    async def claim(self, application_id: str, portal: str):
+        """Take the prewarmed automation for an application, or None"""
+        entry = self._entries.pop(application_id, None)
+        if entry is None or entry.portal != portal:
+            if entry:
+                await self._close(entry)
+            self.misses += 1
+            return None
+        if await entry.task:
+            self.hits += 1
+            logger.info(f"[{application_id}] Using prewarmed page ({time.monotonic() - entry.created_at:.1f}s old)")
+            return entry.automation
+        await self._close(entry)
+        self.misses += 1
+        return None
+
+    async def _expire(self, application_id: str, task: asyncio.Task):
+        entry = self._entries.get(application_id)
+        if entry is None or entry.task is not task:
+            return
+        del self._entries[application_id]
+        self.expired += 1
+        logger.info(f"[{application_id}] Prewarmed context expired unused")
+        await self._close(entry)
+
+    async def _discard_oldest(self) -> bool:
+        if not self._entries:
+            return False
+        _, entry = self._entries.popitem(last=False)
+        self.expired += 1
+        await self._close(entry)
+        return True
+
+    async def _close(self, entry: PrewarmEntry):
+        # A preload still waiting for a context is cancelled rather than awaited
+        if not entry.task.done():
+            entry.task.cancel()
+        try:
+            await entry.task
+        except (asyncio.CancelledError, Exception):
+            pass
+        await entry.automation.close()
+
+    async def relieve_pressure(self) -> bool:
+        """Pool pressure hook: give back the oldest prewarmed context"""
+        return await self._discard_oldest()
+
+    async def close_all(self):
+        while await self._discard_oldest():
+            pass
+
+    def stats(self) -> Dict:
+        return {
+            "enabled": settings.prewarm_enabled,
+            "warm": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "expired": self.expired
+        }
+
+
+prewarm_registry = PrewarmRegistry()
+register_pressure_hook(prewarm_registry.relieve_pressure)
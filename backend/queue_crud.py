@@ -0,0 +1,275 @@
+"""
+Automation Queue CRUD Operations
+Database operations for the durable automation queue (automation_queue) and
+the job messages routed between workers (automation_messages), shared by
+the DU and BUP portals
+"""
+
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from models import AutomationQueueItem, AutomationMessage
+from datetime import datetime, timedelta
+from typing import Callable, Optional
+import status_events
+from status_cache import status_cache
+
+
+# Stage message of an application waiting in the queue
+QUEUED_MESSAGE = "Waiting for a free automation worker..."
+
+
+def get_active_queued_job(db: Session, application_id: str) -> Optional[AutomationQueueItem]:
+    """The application's queued, running or parked item, if it has one"""
+    return db.query(AutomationQueueItem).filter(
+        AutomationQueueItem.application_id == application_id,
+        AutomationQueueItem.state.in_(("queued", "running", "parked"))
+    ).order_by(AutomationQueueItem.id.desc()).first()
+
+
+def enqueue_job(
+    db: Session,
+    portal: str,
+    application_id: str,
+    job_id: str,
+    mark_queued: Callable[[Session, str, str], dict]
+) -> AutomationQueueItem:
+    """
+    Add an automation run to the durable queue. mark_queued (the portal
+    crud's mark_*_queued) points the application at job_id and marks it
+    queued in the same transaction. If the application already has a queued,
+    running or parked item, that item is returned and nothing changes.
+    """
+    existing = get_active_queued_job(db, application_id)
+    if existing:
+        return existing
+
+    fields = mark_queued(db, application_id, job_id)
+    item = AutomationQueueItem(portal=portal, application_id=application_id, job_id=job_id)
+    db.add(item)
+    try:
+        db.commit()
+    except IntegrityError:
+        # Enqueued concurrently (uq_automation_queue_active_application)
+        db.rollback()
+        return get_active_queued_job(db, application_id)
+    db.refresh(item)
+    status_events.bus.notify()
+    status_cache.update(portal, application_id, **fields)
+    return item
+
+
+def claimable_queued_jobs(db: Session, limit_per_portal: int) -> list:
+    """
+    Items a worker may claim: queued and visible, or running with an expired
+    lease (its worker died). The oldest limit_per_portal of each portal are
+    returned, since deadlines are per portal: a run for a portal closing soon
+    is a candidate however many older runs of other portals are waiting.
+    """
+    now = datetime.utcnow()
+    claimable = db.query(AutomationQueueItem).filter(
+        AutomationQueueItem.state.in_(("queued", "running")),
+        AutomationQueueItem.visible_at <= now
+    )
+    portals = [portal for (portal,) in claimable.with_entities(AutomationQueueItem.portal).distinct().all()]
+    items = []
+    for portal in portals:
+        items.extend(claimable.filter(AutomationQueueItem.portal == portal).order_by(
+            AutomationQueueItem.created_at, AutomationQueueItem.id
+        ).limit(limit_per_portal).all())
+    return items
+
+
+def in_progress_queued_jobs(db: Session) -> list:
+    """Items currently running under a live lease"""
+    return db.query(AutomationQueueItem).filter(
+        AutomationQueueItem.state == "running",
+        AutomationQueueItem.visible_at > datetime.utcnow()
+    ).all()
+
+
+def try_claim_queued_job(db: Session, item: AutomationQueueItem, worker_id: str, visibility_timeout: int) -> bool:
+    """
+    Claim an item returned by claimable_queued_jobs. Compare-and-swap on state
+    and attempts, so concurrent claimers never get the same item.
+    """
+    now = datetime.utcnow()
+    claimed = db.query(AutomationQueueItem).filter(
+        AutomationQueueItem.id == item.id,
+        AutomationQueueItem.state == item.state,
+        AutomationQueueItem.attempts == item.attempts,
+        AutomationQueueItem.visible_at <= now
+    ).update({
+        "state": "running",
+        "attempts": item.attempts + 1,
+        "visible_at": now + timedelta(seconds=visibility_timeout),
+        "worker_id": worker_id,
+        "updated_at": now
+    }, synchronize_session=False)
+    db.commit()
+    if claimed:
+        db.refresh(item)
+    return bool(claimed)
+
+
+def renew_leases(db: Session, worker_id: str, visibility_timeout: int) -> int:
+    """Heartbeat: push back the lease of every running or parked item this worker holds"""
+    now = datetime.utcnow()
+    renewed = db.query(AutomationQueueItem).filter(
+        AutomationQueueItem.state.in_(("running", "parked")),
+        AutomationQueueItem.worker_id == worker_id
+    ).update({
+        "visible_at": now + timedelta(seconds=visibility_timeout),
+        "updated_at": now
+    }, synchronize_session=False)
+    db.commit()
+    return renewed
+
+
+def adopt_queued_job(db: Session, item: AutomationQueueItem, worker_id: str, visibility_timeout: int) -> bool:
+    """Take over a parked item whose lease expired (its worker died); compare-and-swap on the old holder"""
+    now = datetime.utcnow()
+    holder = AutomationQueueItem.worker_id.is_(None) if item.worker_id is None else AutomationQueueItem.worker_id == item.worker_id
+    adopted = db.query(AutomationQueueItem).filter(
+        AutomationQueueItem.id == item.id,
+        AutomationQueueItem.state == "parked",
+        holder,
+        AutomationQueueItem.visible_at <= now
+    ).update({
+        "worker_id": worker_id,
+        "visible_at": now + timedelta(seconds=visibility_timeout),
+        "updated_at": now
+    }, synchronize_session=False)
+    db.commit()
+    return bool(adopted)
+
+
+def release_leases(db: Session, worker_id: str) -> int:
+    """Expire every lease a worker holds so others take its jobs over immediately"""
+    now = datetime.utcnow()
+    released = db.query(AutomationQueueItem).filter(
+        AutomationQueueItem.state.in_(("running", "parked")),
+        AutomationQueueItem.worker_id == worker_id
+    ).update({"visible_at": now, "updated_at": now}, synchronize_session=False)
+    db.commit()
+    return released
+
+
+def release_queued_job(db: Session, job_id: str, state: str):
+    """Put a job's item in `state` with its lease expired"""
+    now = datetime.utcnow()
+    db.query(AutomationQueueItem).filter(AutomationQueueItem.job_id == job_id).update(
+        {"state": state, "visible_at": now, "updated_at": now}, synchronize_session=False
+    )
+    db.commit()
+
+
+def queue_lease_holders(db: Session) -> list:
+    """Worker ids holding running or parked items"""
+    rows = db.query(AutomationQueueItem.worker_id).filter(
+        AutomationQueueItem.state.in_(("running", "parked")),
+        AutomationQueueItem.worker_id.isnot(None)
+    ).distinct().all()
+    return [worker_id for (worker_id,) in rows]
+
+
+def enqueue_parked_job(db: Session, portal: str, application_id: str, job_id: str) -> AutomationQueueItem:
+    """Queue item for a job that is already paused on a snapshot; any worker may adopt it"""
+    item = AutomationQueueItem(portal=portal, application_id=application_id, job_id=job_id, state="parked", attempts=1)
+    db.add(item)
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        return get_active_queued_job(db, application_id)
+    db.refresh(item)
+    return item
+
+
+def count_queued_jobs_for_application(db: Session, application_id: str) -> int:
+    """Queue items (attempts) ever created for an application"""
+    return db.query(AutomationQueueItem).filter(AutomationQueueItem.application_id == application_id).count()
+
+
+def get_queued_job_by_job(db: Session, job_id: str) -> Optional[AutomationQueueItem]:
+    """Get the queue item whose current attempt is job_id"""
+    return db.query(AutomationQueueItem).filter(AutomationQueueItem.job_id == job_id).first()
+
+
+def settle_queued_job(db: Session, job_id: str, worker_id: str, state: str):
+    """Record that a job this worker holds has parked or finished"""
+    db.query(AutomationQueueItem).filter(
+        AutomationQueueItem.job_id == job_id,
+        AutomationQueueItem.worker_id == worker_id,
+        AutomationQueueItem.state.in_(("running", "parked"))
+    ).update({"state": state, "updated_at": datetime.utcnow()}, synchronize_session=False)
+    db.commit()
+
+
+def update_queued_job(db: Session, item_id: int, **fields):
+    """Update a queue item (state, job_id, last_error, ...)"""
+    fields["updated_at"] = datetime.utcnow()
+    db.query(AutomationQueueItem).filter(AutomationQueueItem.id == item_id).update(fields, synchronize_session=False)
+    db.commit()
+
+
+def cancel_queued_job(db: Session, job_id: str) -> bool:
+    """Withdraw a run whether queued, running or parked, so it is never claimed or retried"""
+    updated = db.query(AutomationQueueItem).filter(
+        AutomationQueueItem.job_id == job_id,
+        AutomationQueueItem.state.in_(("queued", "running", "parked"))
+    ).update({"state": "cancelled", "updated_at": datetime.utcnow()}, synchronize_session=False)
+    db.commit()
+    return bool(updated)
+
+
+def queue_counts(db: Session) -> dict:
+    """Number of queue items per state"""
+    rows = db.query(AutomationQueueItem.state, func.count(AutomationQueueItem.id)).group_by(AutomationQueueItem.state).all()
+    return {state: count for state, count in rows}
+
+
+def post_job_message(db: Session, portal: str, application_id: str, job_id: str, message: str, payload: dict, worker_id: str) -> AutomationMessage:
+    """Leave a message for the worker holding a job's lease"""
+    msg = AutomationMessage(
+        portal=portal,
+        application_id=application_id,
+        job_id=job_id,
+        message=message,
+        payload=payload,
+        worker_id=worker_id
+    )
+    db.add(msg)
+    db.commit()
+    db.refresh(msg)
+    return msg
+
+
+def pending_job_messages(db: Session, worker_id: str) -> list:
+    """Undelivered messages for jobs this worker holds, or parked jobs whose holder's lease expired"""
+    now = datetime.utcnow()
+    return db.query(AutomationMessage, AutomationQueueItem).join(
+        AutomationQueueItem, AutomationQueueItem.job_id == AutomationMessage.job_id
+    ).filter(
+        AutomationMessage.state == "pending",
+        (AutomationQueueItem.worker_id == worker_id) | (
+            (AutomationQueueItem.state == "parked") & (AutomationQueueItem.visible_at <= now)
+        )
+    ).order_by(AutomationMessage.id).all()
+
+
+def has_pending_job_message(db: Session, job_id: str) -> bool:
+    return db.query(AutomationMessage).filter(
+        AutomationMessage.job_id == job_id,
+        AutomationMessage.state == "pending"
+    ).first() is not None
+
+
+def mark_job_message_delivered(db: Session, message_id: int) -> bool:
+    """Compare-and-swap a message from pending to delivered; False if another worker took it"""
+    updated = db.query(AutomationMessage).filter(
+        AutomationMessage.id == message_id,
+        AutomationMessage.state == "pending"
+    ).update({"state": "delivered", "delivered_at": datetime.utcnow()}, synchronize_session=False)
+    db.commit()
+    return bool(updated)
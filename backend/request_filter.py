@@ -0,0 +1,160 @@
+"""
+Request Filtering
+Per-portal route interception that keeps images, fonts, media and analytics
+beacons off the critical path of headless automation runs.
+"""
+
+import re
+import logging
+from typing import Dict, Iterable, Optional
+from playwright.async_api import BrowserContext, Route, Request, Response
+from config import get_settings
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# Typical transfer sizes, used to estimate bytes saved by requests that were never made
+ESTIMATED_BYTES = {
+    'image': 40 * 1024,
+    'font': 60 * 1024,
+    'media': 500 * 1024,
+    'script': 50 * 1024,
+    'stylesheet': 20 * 1024,
+}
+DEFAULT_ESTIMATED_BYTES = 5 * 1024
+
+# Third-party trackers and font CDNs neither portal needs to render its forms
+THIRD_PARTY_PATTERNS = [
+    r'google-analytics\.com',
+    r'googletagmanager\.com',
+    r'doubleclick\.net',
+    r'connect\.facebook\.net',
+    r'facebook\.com/tr',
+    r'hotjar\.com',
+    r'clarity\.ms',
+    r'fonts\.googleapis\.com',
+    r'fonts\.gstatic\.com',
+]
+
+
+class RequestPolicy:
+    """
+    Which requests a portal's automation is allowed to make
+
+    - allow_patterns always win (CAPTCHA images, ASP.NET script handlers, ...)
+    - stub_patterns are answered locally with an empty 200 so page scripts keep working
+    - block_types / block_patterns are aborted
+    """
+
+    def __init__(
+        self,
+        block_types: Iterable[str] = (),
+        block_patterns: Iterable[str] = (),
+        stub_patterns: Iterable[str] = (),
+        allow_patterns: Iterable[str] = ()
+    ):
+        self.block_types = set(block_types)
+        self.block_patterns = [re.compile(p, re.IGNORECASE) for p in block_patterns]
+        self.stub_patterns = [re.compile(p, re.IGNORECASE) for p in stub_patterns]
+        self.allow_patterns = [re.compile(p, re.IGNORECASE) for p in allow_patterns]
+
+    def decide(self, url: str, resource_type: str) -> str:
+        """Return 'allow', 'stub' or 'block' for a request"""
+        if any(p.search(url) for p in self.allow_patterns):
+            return 'allow'
+        if any(p.search(url) for p in self.stub_patterns):
+            return 'stub'
+        if resource_type in self.block_types or any(p.search(url) for p in self.block_patterns):
+            return 'block'
+        return 'allow'
+
+
+PORTAL_POLICIES: Dict[str, RequestPolicy] = {
+    "du": RequestPolicy(
+        block_types={'image', 'media', 'font'},
+        stub_patterns=THIRD_PARTY_PATTERNS,
+        allow_patterns=[r'captcha']
+    ),
+    "bup": RequestPolicy(
+        block_types={'image', 'media', 'font'},
+        stub_patterns=THIRD_PARTY_PATTERNS,
+        # CAPTCHA images must still load, and WebForms needs its script handlers
+        allow_patterns=[r'captcha', r'WebResource\.axd', r'ScriptResource\.axd']
+    ),
+}
+
+STUB_CONTENT_TYPES = {
+    'script': 'application/javascript',
+    'stylesheet': 'text/css',
+}
+
+
+class RequestStats:
+    """Per-job request counters"""
+
+    def __init__(self, portal: str):
+        self.portal = portal
+        self.requests = 0
+        self.blocked = 0
+        self.stubbed = 0
+        self.bytes_received = 0
+        self.bytes_saved_estimate = 0
+        self.skipped_by_type: Dict[str, int] = {}
+
+    def summary(self) -> Dict:
+        return {
+            "portal": self.portal,
+            "requests": self.requests,
+            "blocked": self.blocked,
+            "stubbed": self.stubbed,
+            "skipped_by_type": self.skipped_by_type,
+            "bytes_received": self.bytes_received,
+            "bytes_saved_estimate": self.bytes_saved_estimate
+        }
+
+    def _skipped(self, resource_type: str):
+        self.skipped_by_type[resource_type] = self.skipped_by_type.get(resource_type, 0) + 1
+        self.bytes_saved_estimate += ESTIMATED_BYTES.get(resource_type, DEFAULT_ESTIMATED_BYTES)
+
+
+async def attach_request_filter(context: BrowserContext, portal: str) -> Optional[RequestStats]:
+    """
+    Install the portal's request policy on a browser context
+    Returns the stats object that accumulates for the lifetime of the context
+    """
+    policy = PORTAL_POLICIES.get(portal)
+    if not settings.request_filter_enabled or policy is None:
+        return None
+
+    stats = RequestStats(portal)
+
+    async def handle(route: Route, request: Request):
+        stats.requests += 1
+        decision = policy.decide(request.url, request.resource_type)
+        try:
+            if decision == 'block':
+                stats.blocked += 1
+                stats._skipped(request.resource_type)
+                await route.abort('blockedbyclient')
+            elif decision == 'stub':
+                stats.stubbed += 1
+                stats._skipped(request.resource_type)
+                await route.fulfill(
+                    status=200,
+                    content_type=STUB_CONTENT_TYPES.get(request.resource_type, 'text/plain'),
+                    body=''
+                )
+            else:
+                await route.continue_()
+        except Exception as e:
+            # The page may have navigated away while the route was pending
+            logger.debug(f"Route handling error for {request.url}: {str(e)}")
+
+    def on_response(response: Response):
+        length = response.headers.get('content-length')
+        if length and length.isdigit():
+            stats.bytes_received += int(length)
+
+    await context.route('**/*', handle)
+    context.on('response', on_response)
+    return stats
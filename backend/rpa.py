@@ -5,8 +5,12 @@ import asyncio
 if sys.platform == 'win32':
     asyncio.set_event_loop_policy(asyncio.WindowsProactorEventLoopPolicy())
 
-from playwright.async_api import async_playwright, Page, Browser
+from playwright.async_api import Page, BrowserContext
 from config import get_settings
+from browser_pool import get_browser_pool
+from selector_resolver import SelectorResolver
+from request_filter import attach_request_filter
+from artifacts import capture
 import logging
 from typing import Optional, Dict
 import os
@@ -19,19 +23,67 @@ class DUAutomation:
     """Playwright automation for DU admission process"""
     
     def __init__(self):
-        self.browser: Optional[Browser] = None
+        self.context: Optional[BrowserContext] = None
         self.page: Optional[Page] = None
+        self.selectors = SelectorResolver("du")
+        self.request_stats = None
+        self.preloaded_url: Optional[str] = None
         
     async def initialize(self):
-        """Initialize browser and page"""
-        playwright = await async_playwright().start()
-        self.browser = await playwright.chromium.launch(headless=True)
-        self.page = await self.browser.new_page()
+        """Lease an isolated browser context from the shared pool and open a page"""
+        self.context = await get_browser_pool().acquire()
+        self.request_stats = await attach_request_filter(self.context, "du")
+        self.page = await self.context.new_page()
+        
+    async def preload(self):
+        """Open the login page ahead of time (prewarm); du_login then skips its navigation"""
+        await self.page.goto(settings.du_login_url, wait_until='networkidle', timeout=60000)
+        self.preloaded_url = settings.du_login_url
+        
+    async def snapshot(self) -> Dict:
+        """Capture cookies, local storage, the current URL and page so the session can be restored later"""
+        state = await self.context.storage_state()
+        state["url"] = self.page.url
+        state["html"] = await self.page.content()
+        return state
+        
+    async def restore(self, snapshot: Dict):
+        """Start a fresh pooled context from a snapshot and reopen the paused page"""
+        storage_state = {"cookies": snapshot.get("cookies", []), "origins": snapshot.get("origins", [])}
+        self.context = await get_browser_pool().acquire(storage_state=storage_state)
+        self.request_stats = await attach_request_filter(self.context, "du")
+        self.page = await self.context.new_page()
+        if snapshot.get("html"):
+            await self.open_page(snapshot["url"], snapshot["html"])
+        else:
+            await self.page.goto(snapshot["url"], wait_until='domcontentloaded', timeout=60000)
+        logger.info(f"DU session restored at {snapshot['url']}")
+        
+    async def open_page(self, url: str, html: str):
+        """
+        Show a page as it was when the job paused (e.g. the OTP form after the
+        application was submitted), which a fresh GET of its URL may not reproduce
+        """
+        def is_page(request_url: str) -> bool:
+            return request_url == url
+        
+        async def serve(route):
+            await route.fulfill(status=200, content_type='text/html; charset=utf-8', body=html)
+        
+        await self.page.route(is_page, serve)
+        try:
+            await self.page.goto(url, wait_until='domcontentloaded', timeout=60000)
+        finally:
+            await self.page.unroute(is_page, serve)
         
     async def close(self):
-        """Close browser"""
-        if self.browser:
-            await self.browser.close()
+        """Return the browser context to the pool"""
+        if self.request_stats:
+            logger.info(f"Request filter: {self.request_stats.summary()}")
+        if self.context:
+            await get_browser_pool().release(self.context)
+            self.context = None
+            self.page = None
     
     async def du_login(self, hsc_roll: str, hsc_board: str, ssc_roll: str) -> Dict:
         """
@@ -39,8 +91,12 @@ class DUAutomation:
         Returns: {success: bool, message: str}
         """
         try:
-            logger.info(f"Navigating to DU login page...")
-            await self.page.goto(settings.du_login_url, wait_until='networkidle', timeout=60000)
+            if self.preloaded_url == settings.du_login_url:
+                logger.info("Using preloaded DU login page")
+            else:
+                logger.info(f"Navigating to DU login page...")
+                await self.page.goto(settings.du_login_url, wait_until='networkidle', timeout=60000)
+            self.preloaded_url = None
             
             # Wait for login form to load
             await self.page.wait_for_selector('input', timeout=30000)
@@ -57,13 +113,8 @@ class DUAutomation:
                 'input[placeholder*="Roll"]'
             ]
             
-            for selector in hsc_roll_selectors:
-                try:
-                    await self.page.fill(selector, hsc_roll, timeout=5000)
-                    logger.info(f"Filled HSC roll using selector: {selector}")
-                    break
-                except:
-                    continue
+            if await self.selectors.fill(self.page, "login_hsc_roll", hsc_roll_selectors, hsc_roll):
+                logger.info("Filled HSC roll")
             
             # Fill HSC board
             board_selectors = [
@@ -72,17 +123,13 @@ class DUAutomation:
                 'input[name="board"]'
             ]
             
-            for selector in board_selectors:
-                try:
+            selector = await self.selectors.resolve(self.page, "login_hsc_board", board_selectors)
+            if selector:
+                if selector.startswith('select'):
                     await self.page.select_option(selector, hsc_board, timeout=5000)
-                    logger.info(f"Selected HSC board using selector: {selector}")
-                    break
-                except:
-                    try:
-                        await self.page.fill(selector, hsc_board, timeout=5000)
-                        break
-                    except:
-                        continue
+                else:
+                    await self.page.fill(selector, hsc_board, timeout=5000)
+                logger.info(f"Selected HSC board using selector: {selector}")
             
             # Fill SSC roll
             ssc_roll_selectors = [
@@ -91,13 +138,8 @@ class DUAutomation:
                 'input[placeholder*="SSC"]'
             ]
             
-            for selector in ssc_roll_selectors:
-                try:
-                    await self.page.fill(selector, ssc_roll, timeout=5000)
-                    logger.info(f"Filled SSC roll using selector: {selector}")
-                    break
-                except:
-                    continue
+            if await self.selectors.fill(self.page, "login_ssc_roll", ssc_roll_selectors, ssc_roll):
+                logger.info("Filled SSC roll")
             
             # Click login/submit button
             submit_selectors = [
@@ -107,13 +149,8 @@ class DUAutomation:
                 'button:has-text("Submit")'
             ]
             
-            for selector in submit_selectors:
-                try:
-                    await self.page.click(selector, timeout=5000)
-                    logger.info(f"Clicked submit using selector: {selector}")
-                    break
-                except:
-                    continue
+            if await self.selectors.click(self.page, "login_submit", submit_selectors):
+                logger.info("Clicked login submit")
             
             # Wait for navigation
             await self.page.wait_for_load_state('networkidle', timeout=30000)
@@ -122,13 +159,7 @@ class DUAutomation:
             
         except Exception as e:
             logger.error(f"Login error: {str(e)}")
-            # Take screenshot on error
-            try:
-                screenshot_path = f"./uploads/logs/error_login_{int(asyncio.get_event_loop().time())}.png"
-                await self.page.screenshot(path=screenshot_path)
-                logger.info(f"Error screenshot saved: {screenshot_path}")
-            except:
-                pass
+            await capture(self.page, "du_login_error", error=True)
             return {"success": False, "message": f"Login failed: {str(e)}"}
     
     async def du_fill_form(self, application_data: Dict) -> Dict:
@@ -169,13 +200,8 @@ class DUAutomation:
                     f'textarea[id="{field_name}"]'
                 ]
                 
-                for selector in selectors:
-                    try:
-                        await self.page.fill(selector, str(field_value), timeout=3000)
-                        logger.info(f"Filled {field_name}")
-                        break
-                    except:
-                        continue
+                if await self.selectors.fill(self.page, f"form_{field_name}", selectors, str(field_value), timeout=3000):
+                    logger.info(f"Filled {field_name}")
             
             # Handle select fields (quota, exam center, etc.)
             if application_data.get('quota'):
@@ -204,24 +230,6 @@ class DUAutomation:
         try:
             logger.info(f"Uploading photo: {photo_path}")
             
-            # Take screenshot before upload attempt
-            screenshot_path = f"./uploads/logs/photo_upload_page_{int(asyncio.get_event_loop().time())}.png"
-            try:
-                await self.page.screenshot(path=screenshot_path, full_page=True)
-                logger.info(f"Photo upload page screenshot: {screenshot_path}")
-            except:
-                pass
-            
-            # Save HTML for debugging
-            try:
-                page_content = await self.page.content()
-                html_path = f"./uploads/logs/photo_upload_page_{int(asyncio.get_event_loop().time())}.html"
-                with open(html_path, 'w', encoding='utf-8') as f:
-                    f.write(page_content)
-                logger.info(f"Photo upload page HTML saved: {html_path}")
-            except:
-                pass
-            
             # Find file input - try multiple selectors
             file_input_selectors = [
                 'input[type="file"]',
@@ -245,24 +253,23 @@ class DUAutomation:
             except:
                 logger.warning("Could not query for file inputs")
             
-            for selector in file_input_selectors:
-                try:
-                    # Check if element exists first
-                    element = await self.page.query_selector(selector)
-                    if element:
-                        logger.info(f"Found file input with selector: {selector}")
-                        await self.page.set_input_files(selector, photo_path, timeout=10000)
-                        logger.info(f"Photo uploaded successfully using selector: {selector}")
-                        
-                        # Wait a bit for upload to process
-                        await asyncio.sleep(2)
-                        
-                        return {"success": True, "message": "Photo uploaded successfully"}
-                except Exception as e:
-                    logger.debug(f"Selector {selector} failed: {str(e)}")
-                    continue
+            # File inputs are often hidden behind a styled button, so only require attachment
+            selector = await self.selectors.resolve(
+                self.page, "photo_input", file_input_selectors, timeout=3000, state='attached'
+            )
+            if selector:
+                logger.info(f"Found file input with selector: {selector}")
+                await self.page.set_input_files(selector, photo_path, timeout=10000)
+                logger.info(f"Photo uploaded successfully using selector: {selector}")
+                
+                # Wait a bit for upload to process
+                await asyncio.sleep(2)
+                
+                await capture(self.page, "du_photo_upload", selector='form')
+                return {"success": True, "message": "Photo uploaded successfully"}
             
             # If we get here, no selector worked
+            screenshot_path = (await capture(self.page, "du_photo_upload_error", error=True))["screenshot_path"]
             logger.warning(f"Could not find photo upload field. Check screenshot: {screenshot_path}")
             return {
                 "success": False, 
@@ -272,6 +279,7 @@ class DUAutomation:
             
         except Exception as e:
             logger.error(f"Photo upload error: {str(e)}")
+            await capture(self.page, "du_photo_upload_error", error=True)
             return {"success": False, "message": f"Photo upload failed: {str(e)}"}
 
     
@@ -291,13 +299,8 @@ class DUAutomation:
                 'button:has-text("Next")'
             ]
             
-            for selector in submit_selectors:
-                try:
-                    await self.page.click(selector, timeout=5000)
-                    logger.info(f"Clicked submit using selector: {selector}")
-                    break
-                except:
-                    continue
+            if await self.selectors.click(self.page, "form_submit", submit_selectors):
+                logger.info("Clicked form submit")
             
             # Wait for page to load
             await self.page.wait_for_load_state('networkidle', timeout=60000)
@@ -349,14 +352,6 @@ class DUAutomation:
             logger.info("Final wait to ensure page is fully rendered...")
             await asyncio.sleep(5)
             
-            # Take screenshot for debugging
-            screenshot_path = f"./uploads/logs/sms_code_page_{int(asyncio.get_event_loop().time())}.png"
-            try:
-                await self.page.screenshot(path=screenshot_path, full_page=True)
-                logger.info(f"Screenshot saved: {screenshot_path}")
-            except:
-                pass
-            
             # Extract SMS code (8-character alphanumeric code)
             sms_code = None
             try:
@@ -365,15 +360,6 @@ class DUAutomation:
                 # Get page content
                 page_content = await self.page.content()
                 
-                # Save HTML for debugging
-                html_path = f"./uploads/logs/sms_code_page_{int(asyncio.get_event_loop().time())}.html"
-                try:
-                    with open(html_path, 'w', encoding='utf-8') as f:
-                        f.write(page_content)
-                    logger.info(f"HTML saved: {html_path}")
-                except:
-                    pass
-                
                 # Strategy 1: Look for code near "16321" text
                 # Split content into lines and find lines containing 16321
                 lines = page_content.split('\n')
@@ -440,14 +426,16 @@ class DUAutomation:
                     except:
                         pass
                 
-                # Log what we found for debugging
-                if not sms_code:
-                    logger.warning(f"Could not extract SMS code. Check screenshot: {screenshot_path}")
-                    logger.warning(f"Check HTML: {html_path}")
-                
             except Exception as e:
                 logger.warning(f"Could not extract SMS code: {str(e)}")
             
+            # The candidate reads the code off the screenshot if it could not be extracted
+            artifacts = await capture(self.page, "du_sms_code_page", force=not sms_code, full_page=not sms_code)
+            screenshot_path = artifacts["screenshot_path"]
+            if not sms_code:
+                logger.warning(f"Could not extract SMS code. Check screenshot: {screenshot_path}")
+                logger.warning(f"Check HTML: {artifacts['html_path']}")
+            
             if sms_code:
                 return {
                     "success": True,
@@ -468,6 +456,7 @@ class DUAutomation:
             
         except Exception as e:
             logger.error(f"Form submit error: {str(e)}")
+            await capture(self.page, "du_submit_error", error=True)
             return {"success": False, "message": f"Form submit failed: {str(e)}", "otp_required": False, "sms_code": None}
 
     
@@ -487,13 +476,8 @@ class DUAutomation:
                 'input[type="text"]'
             ]
             
-            for selector in otp_selectors:
-                try:
-                    await self.page.fill(selector, otp_code, timeout=5000)
-                    logger.info(f"Filled OTP using selector: {selector}")
-                    break
-                except:
-                    continue
+            if await self.selectors.fill(self.page, "otp_input", otp_selectors, otp_code):
+                logger.info("Filled OTP")
             
             # Click verify/submit button
             verify_selectors = [
@@ -502,13 +486,8 @@ class DUAutomation:
                 'button[type="submit"]'
             ]
             
-            for selector in verify_selectors:
-                try:
-                    await self.page.click(selector, timeout=5000)
-                    logger.info(f"Clicked verify using selector: {selector}")
-                    break
-                except:
-                    continue
+            if await self.selectors.click(self.page, "otp_verify", verify_selectors):
+                logger.info("Clicked OTP verify")
             
             # Wait for navigation
             await self.page.wait_for_load_state('networkidle', timeout=30000)
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, EmailStr
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
 
 
@@ -67,6 +67,12 @@ class StatusResponse(BaseModel):
     documents: Optional[dict] = None
 
 
+class StatusBatchRequest(BaseModel):
+    du: List[str] = []
+    bup: List[str] = []
+    since: Optional[datetime] = None  # Only applications updated at or after this (the previous as_of)
+
+
 
 class OTPSubmit(BaseModel):
     application_id: str
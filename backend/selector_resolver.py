@@ -0,0 +1,162 @@
+"""
+Selector Resolver
+Races candidate selectors for a form field in parallel and remembers which one
+won per portal, so later jobs try the learned selector first.
+"""
+
+import asyncio
+import json
+import logging
+import os
+from threading import Lock
+from typing import Dict, List, Optional
+from playwright.async_api import Page
+from config import get_settings
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# Learned winners {portal: {field: selector}}, shared by every resolver in the process
+_cache: Optional[Dict[str, Dict[str, str]]] = None
+_cache_lock = Lock()
+
+# Counters {portal: {field: {"hits": n, "misses": n, "failures": n}}}
+_stats: Dict[str, Dict[str, Dict[str, int]]] = {}
+
+
+def _load_cache() -> Dict[str, Dict[str, str]]:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            try:
+                with open(settings.selector_cache_path, 'r', encoding='utf-8') as f:
+                    _cache = json.load(f)
+            except FileNotFoundError:
+                _cache = {}
+            except Exception as e:
+                logger.warning(f"Could not read selector cache, starting empty: {str(e)}")
+                _cache = {}
+        return _cache
+
+
+def _save_winner(portal: str, field: str, selector: str):
+    cache = _load_cache()
+    with _cache_lock:
+        if cache.get(portal, {}).get(field) == selector:
+            return
+        cache.setdefault(portal, {})[field] = selector
+        try:
+            os.makedirs(os.path.dirname(settings.selector_cache_path) or '.', exist_ok=True)
+            tmp_path = f"{settings.selector_cache_path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(cache, f, indent=2, sort_keys=True)
+            os.replace(tmp_path, settings.selector_cache_path)
+        except Exception as e:
+            logger.warning(f"Could not write selector cache: {str(e)}")
+
+
+def _count(portal: str, field: str, outcome: str):
+    counters = _stats.setdefault(portal, {}).setdefault(field, {"hits": 0, "misses": 0, "failures": 0})
+    counters[outcome] += 1
+
+
+def get_selector_stats() -> Dict:
+    """Hit/miss/failure counters per portal and field, plus the learned selectors"""
+    return {"learned": _load_cache(), "counters": _stats}
+
+
+class SelectorResolver:
+    """
+    Resolve a field to the first candidate selector that matches on the page
+
+    - hit: the learned selector for this field is already on the page
+    - miss: no learned selector, or it no longer matches (portal layout changed);
+      all candidates are raced in parallel and the winner is learned
+    - failure: no candidate matched before the timeout
+    """
+
+    def __init__(self, portal: str):
+        self.portal = portal
+
+    async def resolve(
+        self,
+        page: Page,
+        field: str,
+        candidates: List[str],
+        timeout: int = 5000,
+        state: str = 'visible'
+    ) -> Optional[str]:
+        learned = _load_cache().get(self.portal, {}).get(field)
+
+        if learned and learned in candidates:
+            if await self._present(page, learned, state):
+                _count(self.portal, field, "hits")
+                return learned
+            logger.info(f"Learned selector for {self.portal}.{field} not on page yet: {learned}")
+            # Keep the learned selector first so it wins ties
+            candidates = [learned] + [c for c in candidates if c != learned]
+
+        winner = await self._race(page, candidates, timeout, state)
+        if winner is None:
+            _count(self.portal, field, "failures")
+            logger.warning(f"No selector matched for {self.portal}.{field}")
+            return None
+
+        if learned and winner != learned:
+            logger.warning(f"Selector for {self.portal}.{field} changed: {learned} -> {winner}")
+        _count(self.portal, field, "hits" if winner == learned else "misses")
+        _save_winner(self.portal, field, winner)
+        return winner
+
+    async def fill(self, page: Page, field: str, candidates: List[str], value: str, timeout: int = 5000) -> bool:
+        selector = await self.resolve(page, field, candidates, timeout)
+        if not selector:
+            return False
+        await page.fill(selector, value, timeout=timeout)
+        return True
+
+    async def click(self, page: Page, field: str, candidates: List[str], timeout: int = 5000) -> bool:
+        selector = await self.resolve(page, field, candidates, timeout)
+        if not selector:
+            return False
+        await page.click(selector, timeout=timeout)
+        return True
+
+    async def _present(self, page: Page, selector: str, state: str) -> bool:
+        try:
+            element = await page.query_selector(selector)
+            if not element:
+                return False
+            return state != 'visible' or await element.is_visible()
+        except Exception:
+            return False
+
+    async def _race(self, page: Page, candidates: List[str], timeout: int, state: str) -> Optional[str]:
+        """
+        Wait for all candidates at once. Once one matches, the earliest-listed
+        candidate present on the page wins, so a generic fallback that happens
+        to resolve first never beats the specific selector listed before it.
+        """
+        tasks = {
+            asyncio.create_task(page.wait_for_selector(selector, state=state, timeout=timeout)): selector
+            for selector in candidates
+        }
+        pending = set(tasks)
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                matched = [
+                    tasks[task] for task in done
+                    if not task.cancelled() and task.exception() is None
+                ]
+                if matched:
+                    first = min(matched, key=candidates.index)
+                    for selector in candidates[:candidates.index(first)]:
+                        if await self._present(page, selector, state):
+                            return selector
+                    return first
+            return None
+        finally:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
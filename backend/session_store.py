@@ -0,0 +1,191 @@
+"""
+Paused Session Store
+Holds DU/BUP jobs that are waiting on a human (OTP, payment) without keeping
+a browser open for hours.
+
+A paused job is snapshotted to the database as soon as it parks. Its live
+context is kept for a short grace period so quick replies resume instantly,
+then it is hibernated (context closed) once idle past the TTL, or earlier,
+least recently used first, when too many are live or memory runs low.
+Resuming a hibernated job starts a fresh pooled context from the snapshot.
+Live paused contexts are also hibernated whenever the browser pool is full,
+so waiting jobs never keep active ones from getting a browser.
+"""
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+from config import get_settings
+from database import SessionLocal
+from browser_pool import register_pressure_hook
+from job_scheduler import scheduler
+import crud
+import bup_crud
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+
+class PausedSession:
+    """A parked job and (while live) its automation instance"""
+
+    def __init__(self, job_id: str, application_id: str, portal: str, automation, paused_for: str):
+        self.job_id = job_id
+        self.application_id = application_id
+        self.portal = portal
+        self.automation = automation
+        self.paused_for = paused_for
+        self.last_used = time.monotonic()
+
+
+def _new_automation(portal: str, snapshot: Dict):
+    if portal == "du":
+        from rpa import DUAutomation
+        return DUAutomation()
+    from bup_http import create_bup_automation
+    return create_bup_automation(snapshot)
+
+
+def _save_snapshot(portal: str, job_id: str, snapshot: Dict, paused_for: str):
+    db = SessionLocal()
+    try:
+        if portal == "du":
+            crud.save_job_snapshot(db, job_id, snapshot, paused_for)
+        else:
+            bup_crud.save_bup_job_snapshot(db, job_id, snapshot, paused_for)
+    finally:
+        db.close()
+
+
+def _load_snapshot(portal: str, job_id: str) -> Optional[Dict]:
+    db = SessionLocal()
+    try:
+        job = crud.get_job(db, job_id) if portal == "du" else bup_crud.get_bup_job(db, job_id)
+        return job.storage_state if job else None
+    finally:
+        db.close()
+
+
+def _available_memory_mb() -> Optional[float]:
+    """MemAvailable from /proc/meminfo (None where unavailable)"""
+    try:
+        with open('/proc/meminfo', 'r') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) / 1024
+    except Exception:
+        pass
+    return None
+
+
+class PausedSessionStore:
+    """LRU of paused sessions; all methods run on the automation loop"""
+
+    def __init__(
+        self,
+        live_ttl: Optional[int] = None,
+        max_live: Optional[int] = None,
+        min_free_mb: Optional[int] = None
+    ):
+        self.live_ttl = settings.paused_session_live_ttl if live_ttl is None else live_ttl
+        self.max_live = settings.paused_session_max_live if max_live is None else max_live
+        self.min_free_mb = settings.paused_session_min_free_mb if min_free_mb is None else min_free_mb
+        self._sessions: "OrderedDict[str, PausedSession]" = OrderedDict()
+        self._sweeper: Optional[asyncio.Task] = None
+
+    async def park(self, job_id: str, application_id: str, portal: str, automation, paused_for: str):
+        """Snapshot a paused job; keep it live only while there is room"""
+        snapshot = await automation.snapshot()
+        _save_snapshot(portal, job_id, snapshot, paused_for)
+
+        self._sessions[job_id] = PausedSession(job_id, application_id, portal, automation, paused_for)
+        self._sessions.move_to_end(job_id)
+        scheduler.park(job_id, paused_for)
+        logger.info(f"[{application_id}] Parked job {job_id} waiting for {paused_for}")
+
+        if self.live_ttl <= 0:
+            await self._hibernate(self._sessions[job_id])
+        await self.enforce_limits()
+        self._ensure_sweeper()
+
+    async def resume(self, job_id: str, portal: str):
+        """Return a live automation for a parked job, restoring it from its snapshot if hibernated"""
+        session = self._sessions.pop(job_id, None)
+        if session and session.automation:
+            logger.info(f"[{session.application_id}] Resuming live session for job {job_id}")
+            return session.automation
+
+        snapshot = _load_snapshot(portal, job_id)
+        if not snapshot:
+            raise Exception("Job not found or already completed")
+
+        automation = _new_automation(portal, snapshot)
+        await automation.restore(snapshot)
+        logger.info(f"Restored job {job_id} from session snapshot")
+        return automation
+
+    async def discard(self, job_id: str):
+        """Drop a parked job, closing its browser context if still live"""
+        session = self._sessions.pop(job_id, None)
+        scheduler.unpark(job_id)
+        if session and session.automation:
+            await session.automation.close()
+
+    def is_parked(self, job_id: str) -> bool:
+        return job_id in self._sessions
+
+    def stats(self) -> Dict:
+        live = sum(1 for s in self._sessions.values() if s.automation)
+        return {"parked": len(self._sessions), "live": live, "hibernated": len(self._sessions) - live}
+
+    async def enforce_limits(self):
+        """Hibernate idle sessions past the TTL, then LRU sessions while over capacity or short on memory"""
+        now = time.monotonic()
+        for session in list(self._sessions.values()):
+            if session.automation and now - session.last_used >= self.live_ttl:
+                await self._hibernate(session)
+
+        live = [s for s in self._sessions.values() if s.automation]
+        while live and (len(live) > self.max_live or self._memory_tight()):
+            await self._hibernate(live.pop(0))
+
+    async def hibernate_oldest(self) -> bool:
+        """Free the least recently used live context (browser pool pressure hook)"""
+        for session in self._sessions.values():
+            if session.automation:
+                await self._hibernate(session)
+                return True
+        return False
+
+    async def hibernate_all(self):
+        """Close every live paused context (shutdown); the snapshots stay in the database"""
+        while await self.hibernate_oldest():
+            pass
+
+    def _memory_tight(self) -> bool:
+        available = _available_memory_mb()
+        return available is not None and available < self.min_free_mb
+
+    async def _hibernate(self, session: PausedSession):
+        automation, session.automation = session.automation, None
+        if automation:
+            await automation.close()
+            logger.info(f"[{session.application_id}] Hibernated paused job {session.job_id}")
+
+    def _ensure_sweeper(self):
+        if self._sweeper is None or self._sweeper.done():
+            self._sweeper = asyncio.create_task(self._sweep())
+
+    async def _sweep(self):
+        while any(s.automation for s in self._sessions.values()):
+            await asyncio.sleep(max(1, min(self.live_ttl, 30)))
+            try:
+                await self.enforce_limits()
+            except Exception as e:
+                logger.error(f"Paused session sweep error: {str(e)}")
+
+
+paused_sessions = PausedSessionStore()
+register_pressure_hook(paused_sessions.hibernate_oldest)
@@ -0,0 +1,96 @@
+"""
+Application Status Cache
+Serves status polls from memory instead of loading the application row.
+
+Entries are a small projection of the application (status, stage, message,
+SMS code, document paths) in an LRU keyed by portal and application id. crud and bup_crud update cached entries on every status
+write, so a poll only reads the database on a miss. Entries also expire
+after a long TTL, a safety net that bounds how stale a status can be when
+another backend instance made the change.
+"""
+
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Callable, Dict, Optional, Tuple
+from config import get_settings
+
+settings = get_settings()
+
+
+class StatusEntry:
+    def __init__(self, status: Dict):
+        self.status = status
+        self.loaded_at = time.monotonic()
+
+
+def etag(payload: Dict) -> str:
+    """Strong ETag for a status response body"""
+    digest = hashlib.sha1(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+    return f'"{digest[:20]}"'
+
+
+class StatusCache:
+    """LRU of status projections; safe to use from the API and automation threads"""
+
+    def __init__(self, max_entries: Optional[int] = None, ttl: Optional[float] = None):
+        self.max_entries = max_entries or settings.status_cache_max_entries
+        self.ttl = settings.status_cache_ttl if ttl is None else ttl
+        self._entries: "OrderedDict[Tuple[str, str], StatusEntry]" = OrderedDict()
+        self._lock = Lock()
+        # Per key with a load in flight: write generation (bumped by update, so a
+        # load racing a write isn't cached) and number of loads in flight
+        self._generations: Dict[Tuple[str, str], int] = {}
+        self._loading: Dict[Tuple[str, str], int] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, portal: str, application_id: str, load: Callable[[], Optional[Dict]]) -> Optional[Dict]:
+        """Cached status, or load() it (None if the application doesn't exist)"""
+        key = (portal, application_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and time.monotonic() - entry.loaded_at < self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry.status
+            self.misses += 1
+            generation = self._generations.setdefault(key, 0)
+            self._loading[key] = self._loading.get(key, 0) + 1
+
+        status = None
+        try:
+            status = load()
+        finally:
+            with self._lock:
+                if status is not None and self._generations[key] == generation:
+                    self._store(key, StatusEntry(status))
+                self._loading[key] -= 1
+                if not self._loading[key]:
+                    del self._loading[key]
+                    del self._generations[key]
+        return status
+
+    def update(self, portal: str, application_id: str, **fields):
+        """Write-through from crud: apply changed fields to a cached entry, if any"""
+        key = (portal, application_id)
+        with self._lock:
+            if key in self._generations:
+                self._generations[key] += 1
+            entry = self._entries.pop(key, None)
+            if entry and time.monotonic() - entry.loaded_at < self.ttl:
+                self._store(key, StatusEntry({**entry.status, **fields}))
+
+    def _store(self, key: Tuple[str, str], entry: StatusEntry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> Dict:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+status_cache = StatusCache()
@@ -0,0 +1,180 @@
+"""
+Application Status Events
+Pushes status changes to clients over Server-Sent Events instead of having
+every open dashboard poll the status endpoints.
+
+crud and bup_crud record an event row in the same commit as each status
+change (stage, SMS code, payment, document), so events are durable and seen
+by every backend instance. Each process runs one tailer that reads new rows,
+waking at once for local changes and polling for changes made by other
+instances, and fans them out to its subscribers: a change costs one query
+however many streams are open. Event ids are row ids, so a client that
+reconnects with Last-Event-ID is replayed everything it missed.
+"""
+
+import asyncio
+import json
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Callable, Dict, Optional, Set
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from config import get_settings
+from database import SessionLocal
+from models import StatusEvent
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+
+def record(db: Session, portal: str, application_id: str, event: str, data: Dict):
+    """Add an event to the caller's transaction; call bus.notify() after committing"""
+    db.add(StatusEvent(portal=portal, application_id=application_id, event=event, data=data))
+
+
+def _format(event_id: int, event: str, data: Dict) -> str:
+    return f"id: {event_id}\nevent: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+class _Subscriber:
+    def __init__(self):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=settings.status_events_queue_size)
+
+
+class StatusEventBus:
+    """Per-process fan-out of status events to SSE streams; runs on the API event loop"""
+
+    def __init__(self):
+        self._subscribers: Dict[str, Set[_Subscriber]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._tailer: Optional[asyncio.Task] = None
+        self._last_id = 0
+        self._last_prune = 0.0
+
+    def notify(self):
+        """Wake the tailer (call from any thread after committing events)"""
+        loop, wakeup = self._loop, self._wakeup
+        if loop and wakeup and not loop.is_closed():
+            loop.call_soon_threadsafe(wakeup.set)
+
+    def _ensure_tailer(self):
+        if self._tailer is None or self._tailer.done():
+            self._loop = asyncio.get_running_loop()
+            self._wakeup = asyncio.Event()
+            db = SessionLocal()
+            try:
+                self._last_id = db.query(func.max(StatusEvent.id)).scalar() or 0
+            finally:
+                db.close()
+            self._tailer = asyncio.create_task(self._tail())
+
+    async def _tail(self):
+        # Ends when the last stream closes; the next subscriber starts a new one
+        while self._subscribers:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=settings.status_events_poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                self._fan_out()
+                self._prune()
+            except Exception as e:
+                logger.error(f"Status event tailer error: {str(e)}")
+
+    def _fan_out(self):
+        db = SessionLocal()
+        try:
+            rows = db.query(StatusEvent).filter(StatusEvent.id > self._last_id).order_by(StatusEvent.id).limit(1000).all()
+        finally:
+            db.close()
+        for row in rows:
+            self._last_id = row.id
+            for subscriber in list(self._subscribers.get(row.application_id, ())):
+                try:
+                    subscriber.queue.put_nowait(row)
+                except asyncio.QueueFull:
+                    # Too slow to keep up: end its stream; it reconnects and replays from the table
+                    while not subscriber.queue.empty():
+                        subscriber.queue.get_nowait()
+                    subscriber.queue.put_nowait(None)
+
+    def _prune(self):
+        if time.monotonic() - self._last_prune < 3600:
+            return
+        self._last_prune = time.monotonic()
+        cutoff = datetime.utcnow() - timedelta(hours=settings.status_events_retention_hours)
+        db = SessionLocal()
+        try:
+            deleted = db.query(StatusEvent).filter(StatusEvent.created_at < cutoff).delete(synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+        if deleted:
+            logger.info(f"Pruned {deleted} status events")
+
+    async def stream(
+        self,
+        application_id: str,
+        last_event_id: Optional[int],
+        snapshot: Callable[[], Dict]
+    ) -> AsyncIterator[str]:
+        """
+        SSE stream for one application: the events after last_event_id, or the
+        current status as a "snapshot" event, then changes as they happen
+        """
+        subscriber = _Subscriber()
+        self._subscribers.setdefault(application_id, set()).add(subscriber)
+        try:
+            self._ensure_tailer()
+            yield f"retry: {settings.status_events_retry_ms}\n\n"
+
+            db = SessionLocal()
+            try:
+                if last_event_id is not None:
+                    missed = db.query(StatusEvent).filter(
+                        StatusEvent.application_id == application_id,
+                        StatusEvent.id > last_event_id
+                    ).order_by(StatusEvent.id).all()
+                    replay = [(row.id, row.event, row.data) for row in missed]
+                    last = missed[-1].id if missed else last_event_id
+                else:
+                    last = db.query(func.max(StatusEvent.id)).filter(
+                        StatusEvent.application_id == application_id
+                    ).scalar() or 0
+                    replay = [(last, "snapshot", snapshot())]
+            finally:
+                db.close()
+            for event_id, event, data in replay:
+                yield _format(event_id, event, data or {})
+
+            while True:
+                try:
+                    row = await asyncio.wait_for(subscriber.queue.get(), timeout=settings.status_events_keepalive)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if row is None:
+                    break
+                if row.id <= last:
+                    continue
+                last = row.id
+                yield _format(row.id, row.event, row.data or {})
+        finally:
+            subscribers = self._subscribers.get(application_id)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscribers[application_id]
+
+    def stats(self) -> Dict:
+        return {
+            "applications": len(self._subscribers),
+            "streams": sum(len(s) for s in self._subscribers.values()),
+            "last_event_id": self._last_id
+        }
+
+
+bus = StatusEventBus()
@@ -10,13 +10,16 @@ import logging
 from rpa import DUAutomation
 from database import SessionLocal
 import crud
-from threading import Thread
+import queue_crud
+from session_store import paused_sessions
+from prewarm import prewarm_registry
+from job_queue import job_queue, QueueHandler
+from automation_runtime import runtime
 
 logger = logging.getLogger(__name__)
 
-# In-memory job tracking
+# In-memory job tracking (paused browser sessions live in session_store)
 active_jobs: Dict[str, Dict] = {}
-otp_waiting_jobs: Dict[str, DUAutomation] = {}
 
 
 async def run_du_automation_async(application_id: str, job_id: str):
@@ -28,8 +31,7 @@ async def run_du_automation_async(application_id: str, job_id: str):
     automation = DUAutomation()
     
     try:
-        # Store automation instance for OTP resume
-        otp_waiting_jobs[job_id] = automation
+        crud.create_job(db, job_id, application_id)
         active_jobs[job_id] = {
             "application_id": application_id,
             "status": "running",
@@ -41,9 +43,13 @@ async def run_du_automation_async(application_id: str, job_id: str):
         if not app:
             raise Exception("Application not found")
         
-        # Initialize browser
-        logger.info(f"[{application_id}] Initializing browser...")
-        await automation.initialize()
+        # Initialize browser, or pick up the page prewarmed when the application was created
+        prewarmed = await prewarm_registry.claim(application_id, "du")
+        if prewarmed:
+            automation = prewarmed
+        else:
+            logger.info(f"[{application_id}] Initializing browser...")
+            await automation.initialize()
         crud.update_application_status(
             db, application_id, "login", "login", "Initializing browser..."
         )
@@ -129,11 +135,17 @@ async def run_du_automation_async(application_id: str, job_id: str):
 
         
         active_jobs[job_id]["stage"] = "otp_waiting"
+        if automation.request_stats:
+            active_jobs[job_id]["requests"] = automation.request_stats.summary()
         
         # Automation pauses here - will be resumed by submit_otp endpoint
-        # Keep browser open and wait
+        # The session is snapshotted and the browser context released once idle
+        await paused_sessions.park(job_id, application_id, "du", automation, "otp")
         logger.info(f"[{application_id}] Automation paused, waiting for OTP submission...")
         
+    except asyncio.CancelledError:
+        await automation.close()
+        raise
     except Exception as e:
         logger.error(f"[{application_id}] Automation error: {str(e)}")
         crud.update_application_status(
@@ -144,9 +156,8 @@ async def run_du_automation_async(application_id: str, job_id: str):
             "status": "failed",
             "error": str(e)
         }
+        crud.update_job_status(db, job_id, "failed")
         await automation.close()
-        if job_id in otp_waiting_jobs:
-            del otp_waiting_jobs[job_id]
     finally:
         db.close()
 
@@ -156,13 +167,12 @@ async def resume_automation_after_otp(application_id: str, job_id: str, otp_code
     Resume automation after OTP is submitted
     """
     db = SessionLocal()
+    automation = None
     
     try:
-        # Get the paused automation instance
-        if job_id not in otp_waiting_jobs:
-            raise Exception("Job not found or already completed")
-        
-        automation = otp_waiting_jobs[job_id]
+        # Get the paused automation instance (restored from its snapshot if hibernated)
+        automation = await paused_sessions.resume(job_id, "du")
+        crud.update_job_status(db, job_id, "running")
         
         # Step 6: Enter OTP
         logger.info(f"[{application_id}] Entering OTP...")
@@ -191,18 +201,24 @@ async def resume_automation_after_otp(application_id: str, job_id: str, otp_code
             "Please complete payment to continue."
         )
         
-        active_jobs[job_id]["stage"] = "payment_waiting"
+        if job_id in active_jobs:
+            active_jobs[job_id]["stage"] = "payment_waiting"
         
-        # Keep browser open for document download after payment
+        # Park again until the payment callback; documents are downloaded from this session
+        await paused_sessions.park(job_id, application_id, "du", automation, "payment")
         
+    except asyncio.CancelledError:
+        if automation:
+            await automation.close()
+        raise
     except Exception as e:
         logger.error(f"[{application_id}] OTP resume error: {str(e)}")
         crud.update_application_status(
             db, application_id, "failed", "error", f"OTP verification failed: {str(e)}"
         )
-        await automation.close()
-        if job_id in otp_waiting_jobs:
-            del otp_waiting_jobs[job_id]
+        crud.update_job_status(db, job_id, "failed")
+        if automation:
+            await automation.close()
     finally:
         db.close()
 
@@ -213,14 +229,16 @@ async def complete_automation_after_payment(application_id: str, job_id: str):
     Download documents
     """
     db = SessionLocal()
+    automation = None
     
     try:
-        # Get the paused automation instance
-        if job_id not in otp_waiting_jobs:
+        # Get the paused automation instance (restored from its snapshot if hibernated)
+        try:
+            automation = await paused_sessions.resume(job_id, "du")
+        except Exception:
             logger.warning(f"[{application_id}] Job not found, may have already completed")
             return
-        
-        automation = otp_waiting_jobs[job_id]
+        crud.update_job_status(db, job_id, "running")
         
         # Step 8: Download documents
         logger.info(f"[{application_id}] Downloading documents...")
@@ -244,7 +262,8 @@ async def complete_automation_after_payment(application_id: str, job_id: str):
                 "Application completed successfully! Documents downloaded."
             )
             
-            active_jobs[job_id]["status"] = "completed"
+            if job_id in active_jobs:
+                active_jobs[job_id]["status"] = "completed"
         else:
             logger.warning(f"[{application_id}] Document download failed: {download_result['message']}")
             crud.update_application_status(
@@ -253,34 +272,112 @@ async def complete_automation_after_payment(application_id: str, job_id: str):
             )
         
         # Clean up
+        crud.update_job_status(db, job_id, "completed")
         await automation.close()
-        del otp_waiting_jobs[job_id]
         
+    except asyncio.CancelledError:
+        if automation:
+            await automation.close()
+        raise
     except Exception as e:
         logger.error(f"[{application_id}] Payment completion error: {str(e)}")
         crud.update_application_status(
             db, application_id, "failed", "error", f"Document download failed: {str(e)}"
         )
-        if job_id in otp_waiting_jobs:
-            automation = otp_waiting_jobs[job_id]
+        crud.update_job_status(db, job_id, "failed")
+        if automation:
             await automation.close()
-            del otp_waiting_jobs[job_id]
     finally:
         db.close()
 
 
-def run_du_automation(application_id: str, job_id: str):
+def start_automation_background(application_id: str, job_id: str) -> str:
+    """
+    Queue automation; it starts on the automation loop once a worker slot is free.
+    Returns the job id in charge, which is an earlier one if the application already has a run.
+    """
+    return job_queue.enqueue("du", application_id, job_id)
+
+
+def _retry_abandoned_job(db, application_id: str, old_job_id: str, new_job_id: str):
+    crud.update_job_status(db, old_job_id, "failed")
+    crud.update_job_id(db, application_id, new_job_id)
+
+
+def _fail_abandoned_job(db, application_id: str, job_id: str, message: str):
+    crud.update_job_status(db, job_id, "failed")
+    crud.update_application_status(db, application_id, "failed", "error", f"Automation failed: {message}")
+
+
+# Statuses of an application whose job was in progress when the process stopped
+IN_PROGRESS_STATUSES = ("queued", "login", "form_fill", "otp_required", "otp_verify", "payment", "downloading")
+
+
+def _recover_stuck_jobs(db) -> Dict[str, int]:
+    """Startup: requeue, re-park or fail applications left mid-run by a restart"""
+    outcomes: Dict[str, int] = {}
+    for app in crud.get_applications_by_status(db, IN_PROGRESS_STATUSES):
+        job = crud.get_job(db, app.job_id) if app.job_id else None
+        paused_for = job.paused_for if job and job.storage_state else None
+        outcome = job_queue.recover_job(
+            db, "du", app.id, app.job_id, paused_for, payment_done=app.payment_status == "completed"
+        )
+        if outcome == "parked" and paused_for == "otp" and app.job_status != "otp_required":
+            # The OTP was being verified when the process stopped; it has to be sent again
+            crud.update_application_status(
+                db, app.id, "otp_required", "otp_required",
+                "Verification was interrupted. Please submit the OTP again."
+            )
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+    return outcomes
+
+
+job_queue.register(
+    "du", QueueHandler(
+        run_du_automation_async, _retry_abandoned_job, _fail_abandoned_job,
+        crud.mark_application_queued, _recover_stuck_jobs
+    )
+)
+
+
+async def _cancel_job(application_id: str, job_id: str):
+    """Runs after the job's task (if any) was cancelled: drop its queue item and paused session"""
+    await paused_sessions.discard(job_id)
+    db = SessionLocal()
+    try:
+        queue_crud.cancel_queued_job(db, job_id)
+        crud.update_job_status(db, job_id, "cancelled")
+        crud.update_application_status(db, application_id, "cancelled", "cancelled", "Automation cancelled")
+    finally:
+        db.close()
+    active_jobs.pop(job_id, None)
+    logger.info(f"[{application_id}] Automation cancelled (job {job_id})")
+
+
+runtime.on("du", "otp_submitted", resume_automation_after_otp)
+runtime.on("du", "payment_verified", complete_automation_after_payment)
+runtime.on("du", "cancel", _cancel_job)
+
+
+def wake_automation_with_otp(application_id: str, job_id: str, otp_code: str):
+    """
+    Send the OTP to the job; it resumes on the next free worker slot of the worker holding it
+    """
+    job_queue.send("du", application_id, job_id, "otp_submitted", otp_code=otp_code)
+    logger.info(f"Sent OTP to job {job_id} for application {application_id}")
+
+
+def wake_automation_after_payment(application_id: str, job_id: str):
     """
-    Wrapper to run async automation in a thread
+    Tell the job its payment was verified; it resumes on the next free worker slot of the worker holding it
     """
-    asyncio.run(run_du_automation_async(application_id, job_id))
+    job_queue.send("du", application_id, job_id, "payment_verified")
+    logger.info(f"Sent payment confirmation to job {job_id} for application {application_id}")
 
 
-def start_automation_background(application_id: str, job_id: str):
+def cancel_automation(application_id: str, job_id: str):
     """
-    Start automation in background thread
+    Cancel a job whether it is queued, running or parked, on whichever worker holds it
     """
-    thread = Thread(target=run_du_automation, args=(application_id, job_id))
-    thread.daemon = True
-    thread.start()
-    logger.info(f"Started automation thread for application {application_id}")
+    job_queue.send("du", application_id, job_id, "cancel")
+    logger.info(f"Sent cancel to job {job_id} for application {application_id}")
@@ -11,6 +11,7 @@ import os
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 from bup_rpa import BUPAutomation
+from browser_pool import shutdown_browser_pools
 from datetime import datetime
 import logging
 
@@ -84,7 +85,7 @@ async def test_bup_automation():
         logger.error(f"Signature not found: {signature_path}")
         return
     
-    automation = BUPAutomation()
+    automation = BUPAutomation(headless=False)  # solve any CAPTCHA in the window
     
     try:
         logger.info("=" * 80)
@@ -213,6 +214,7 @@ async def test_bup_automation():
         # Close browser
         logger.info("\nClosing browser...")
         await automation.close()
+        await shutdown_browser_pools()
         logger.info("✓ Browser closed")
 
 
@@ -0,0 +1,152 @@
+"""
+BUP HTTP Driver Stand-in Test
+Run the browserless BUP driver against bup_portal_stub, in process
+
+    python test_bup_http_stub.py
+
+Checks that a valid application goes from program selection to the documents
+over HTTP alone, and that a portal validation message (a 3-digit roll) fails
+the step with that message instead of falling back to a browser.
+"""
+
+import asyncio
+import sys
+import os
+import tempfile
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# Point the driver at the stand-in before settings are loaded
+WORK_DIR = tempfile.mkdtemp(prefix="bup_stub_")
+os.environ["BUP_BASE_URL"] = "http://stub"
+os.environ["BUP_GAZETTEER_PATH"] = os.path.join(WORK_DIR, "bup_gazetteer.json")
+
+import httpx
+from datetime import date
+from PIL import Image
+from bup_http import BUPHttpAutomation
+import bup_portal_stub
+import logging
+
+# Setup logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+STUDENT_DATA = {
+    'faculty': 'Bachelor of Business Administration (General)',
+    'ssc_examination': 'SSC',
+    'ssc_roll': '116735',
+    'ssc_registration': '2014614701',
+    'ssc_passing_year': 2021,
+    'ssc_board': 'CHATTAGRAM',
+    'hsc_examination': 'HSC',
+    'hsc_roll': '120606',
+    'hsc_registration': '2014614701',
+    'hsc_passing_year': 2023,
+    'hsc_board': 'CHATTAGRAM',
+    'date_of_birth': date(2006, 10, 10),
+    'gender': 'MALE',
+    'nationality': 'Bangladeshi',
+    'mobile_number': '01614742727',
+    'email': 'candidate@example.com',
+    'present_division': 'Chattogram',
+    'present_district': 'Chattogram',
+    'present_thana': 'Kotwali',
+    'present_post_office': '',
+    'present_village': 'Agrabad',
+    'present_zip': '4100',
+}
+
+
+def new_automation() -> BUPHttpAutomation:
+    return BUPHttpAutomation(transport=httpx.ASGITransport(app=bup_portal_stub.app))
+
+
+def check(result: dict, step: str):
+    if not result['success']:
+        raise AssertionError(f"{step}: {result['message']}")
+    logger.info(f"✓ {result['message']}")
+
+
+async def fill_until_verified(automation: BUPHttpAutomation, data: dict) -> dict:
+    """Steps up to and including Verify Information; returns the verify result"""
+    check(await automation.navigate_and_select_faculty(data['faculty']), "faculty")
+    check(await automation.select_education_type_ssc_hsc(), "education type")
+    check(await automation.fill_ssc_information({k: v for k, v in data.items() if k.startswith('ssc_')}), "SSC")
+    check(await automation.fill_hsc_information({k: v for k, v in data.items() if k.startswith('hsc_')}), "HSC")
+    return await automation.click_verify_information()
+
+
+async def test_valid_application():
+    """A valid application completes over HTTP without borrowing a browser"""
+    photo_path = os.path.join(WORK_DIR, "photo.jpg")
+    signature_path = os.path.join(WORK_DIR, "signature.jpg")
+    Image.new('RGB', (300, 300), 'white').save(photo_path, 'JPEG')
+    Image.new('RGB', (300, 80), 'white').save(signature_path, 'JPEG')
+    submitted_before = len(bup_portal_stub.submissions)
+
+    automation = new_automation()
+    try:
+        await automation.initialize()
+        check(await fill_until_verified(automation, STUDENT_DATA), "verification")
+        check(await automation.fill_personal_information(STUDENT_DATA), "personal information")
+        check(await automation.fill_present_address(STUDENT_DATA), "present address")
+        check(await automation.handle_permanent_address(STUDENT_DATA, same_as_present=True), "permanent address")
+        check(await automation.upload_photo(photo_path), "photo")
+        check(await automation.upload_signature(signature_path), "signature")
+        check(await automation.submit_application(), "submission")
+
+        payment = await automation.get_payment_info()
+        check(payment, "payment info")
+        assert payment['amount'] == 1000.00, payment
+
+        os.chdir(WORK_DIR)  # documents are written under ./uploads/docs
+        documents = await automation.download_documents("STUB-TEST")
+        check(documents, "documents")
+        assert documents['admission_slip_path'] and documents['receipt_path'], documents
+
+        assert len(bup_portal_stub.submissions) == submitted_before + 1, "the stand-in did not record a submission"
+        submitted = bup_portal_stub.submissions[-1]['fields']
+        assert submitted['ctl00$MainContent$ddlPresentThana'] == '222', submitted
+        assert automation.browser is None, "a browser was borrowed"
+    finally:
+        await automation.close()
+
+
+async def test_portal_validation_message():
+    """A rejected roll fails verification with the portal's message and no browser fallback"""
+    automation = new_automation()
+    try:
+        await automation.initialize()
+        result = await fill_until_verified(automation, {**STUDENT_DATA, 'ssc_roll': '116'})
+        assert not result['success'], result
+        assert 'Invalid SSC roll' in result['message'], result
+        assert automation.browser is None, "fell back to a browser"
+        logger.info(f"✓ Rejected as expected: {result['message']}")
+    finally:
+        await automation.close()
+
+
+async def main():
+    failed = 0
+    for test in (test_valid_application, test_portal_validation_message):
+        logger.info(f"\n[{test.__name__}] {test.__doc__}")
+        try:
+            await test()
+        except Exception as e:
+            failed += 1
+            logger.error(f"❌ {test.__name__} failed: {str(e)}")
+
+    logger.info("=" * 80)
+    logger.info("ALL STAND-IN TESTS PASSED" if not failed else f"{failed} STAND-IN TEST(S) FAILED")
+    logger.info("=" * 80)
+    return failed
+
+
+if __name__ == "__main__":
+    sys.exit(1 if asyncio.run(main()) else 0)
@@ -0,0 +1,366 @@
+"""
+ASP.NET WebForms Client
+Drives WebForms pages over plain HTTP: parses the page's form, carries
+__VIEWSTATE / __EVENTVALIDATION between requests, and replays postbacks the
+way __doPostBack and submit buttons do in a browser.
+"""
+
+import re
+import time
+import logging
+from html.parser import HTMLParser
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urljoin
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Matches __doPostBack('target','arg'), including the escaped form AutoPostBack
+# controls render inside setTimeout('__doPostBack(\'target\',\'\')', 0)
+POSTBACK_CALL = re.compile(r"__doPostBack\(\s*\\?['\"]([^'\"\\]*)\\?['\"]\s*,\s*\\?['\"]([^'\"\\]*)\\?['\"]\s*\)")
+
+# Controls a browser never serializes with the form
+UNSUBMITTED_INPUT_TYPES = {'submit', 'button', 'image', 'reset', 'file'}
+
+BROWSER_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) '
+                  'Chrome/120.0.0.0 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+    'Accept-Language': 'en-BD,en;q=0.9',
+}
+
+
+class UnknownPage(Exception):
+    """The page does not have the controls the next step expects"""
+
+
+class FormControl:
+    """An input, select or textarea as rendered by the server"""
+
+    def __init__(self, tag: str, attrs: Dict[str, str]):
+        self.tag = tag
+        self.attrs = attrs
+        self.name = attrs.get('name')
+        self.id = attrs.get('id')
+        self.type = (attrs.get('type') or ('text' if tag == 'input' else tag)).lower()
+        self.value = attrs.get('value', '')
+        self.checked = 'checked' in attrs
+        self.disabled = 'disabled' in attrs
+        self.options: List[Tuple[str, str, bool]] = []  # (value, text, selected) for selects
+
+    @property
+    def postback_target(self) -> Optional[str]:
+        """The __doPostBack event target wired to this control, if any"""
+        for handler in ('onchange', 'onclick', 'href'):
+            match = POSTBACK_CALL.search(self.attrs.get(handler) or '')
+            if match:
+                return match.group(1)
+        return None
+
+    def selected_value(self) -> Optional[str]:
+        for value, _, selected in self.options:
+            if selected:
+                return value
+        return self.options[0][0] if self.options else None
+
+
+class _PageParser(HTMLParser):
+    """Collects the first form's controls, links, images and visible text"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.action: Optional[str] = None
+        self.controls: List[FormControl] = []
+        self.links: List[Dict[str, str]] = []
+        self.images: List[Dict[str, str]] = []
+        self.spans: List[Tuple[str, str]] = []  # (class, text)
+        self.text: List[str] = []
+        self._select: Optional[FormControl] = None
+        self._option: Optional[Dict] = None
+        self._textarea: Optional[FormControl] = None
+        self._link: Optional[Dict] = None
+        self._span_stack: List[Dict] = []
+        self._skip = 0  # inside <script>/<style>
+
+    def handle_starttag(self, tag, attrs):
+        attrs = {k: (v if v is not None else '') for k, v in attrs}
+        if tag in ('script', 'style'):
+            self._skip += 1
+        elif tag == 'form' and self.action is None:
+            self.action = attrs.get('action', '')
+        elif tag == 'input':
+            self.controls.append(FormControl(tag, attrs))
+        elif tag == 'select':
+            self._select = FormControl(tag, attrs)
+            self.controls.append(self._select)
+        elif tag == 'option' and self._select is not None:
+            self._close_option()
+            self._option = {"value": attrs.get('value'), "selected": 'selected' in attrs, "text": []}
+        elif tag == 'textarea':
+            self._textarea = FormControl(tag, attrs)
+            self.controls.append(self._textarea)
+        elif tag == 'a':
+            self._link = {"href": attrs.get('href', ''), "id": attrs.get('id', ''), "text": []}
+        elif tag == 'img':
+            self.images.append({"src": attrs.get('src', ''), "id": attrs.get('id', '')})
+        elif tag == 'span':
+            self._span_stack.append({"class": attrs.get('class', ''), "text": []})
+
+    def handle_endtag(self, tag):
+        if tag in ('script', 'style'):
+            self._skip = max(0, self._skip - 1)
+        elif tag == 'option':
+            self._close_option()
+        elif tag == 'select':
+            self._close_option()
+            self._select = None
+        elif tag == 'textarea':
+            self._textarea = None
+        elif tag == 'a' and self._link is not None:
+            self._link["text"] = ' '.join(''.join(self._link["text"]).split())
+            self.links.append(self._link)
+            self._link = None
+        elif tag == 'span' and self._span_stack:
+            span = self._span_stack.pop()
+            self.spans.append((span["class"], ' '.join(''.join(span["text"]).split())))
+
+    def handle_data(self, data):
+        if self._skip:
+            return
+        if self._option is not None:
+            self._option["text"].append(data)
+            return
+        if self._textarea is not None:
+            self._textarea.value += data
+            return
+        if self._link is not None:
+            self._link["text"].append(data)
+        for span in self._span_stack:
+            span["text"].append(data)
+        self.text.append(data)
+
+    def _close_option(self):
+        if self._option is None:
+            return
+        text = ' '.join(''.join(self._option["text"]).split())
+        value = self._option["value"] if self._option["value"] is not None else text
+        self._select.options.append((value, text, self._option["selected"]))
+        self._option = None
+
+
+class WebFormsPage:
+    """A parsed WebForms response"""
+
+    def __init__(self, url: str, html: str):
+        self.url = url
+        self.html = html
+        parser = _PageParser()
+        parser.feed(html)
+        parser.close()
+        self.action = urljoin(url, parser.action) if parser.action is not None else url
+        self.controls = parser.controls
+        self.links = parser.links
+        self.images = parser.images
+        self.spans = parser.spans
+        self.text = ' '.join(' '.join(parser.text).split())
+        self._by_id = {c.id: c for c in self.controls if c.id}
+        self._by_name = {c.name: c for c in self.controls if c.name}
+
+    def control(self, key: str) -> Optional[FormControl]:
+        """Look a control up by client id (MainContent_txtRollSSC) or name (ctl00$MainContent$txtRollSSC)"""
+        return self._by_id.get(key) or self._by_name.get(key)
+
+    def require(self, key: str) -> FormControl:
+        control = self.control(key)
+        if control is None:
+            raise UnknownPage(f"Control {key} not found on {self.url}")
+        return control
+
+    def has(self, key: str) -> bool:
+        return self.control(key) is not None
+
+    def options(self, key: str) -> Dict[str, str]:
+        control = self.control(key)
+        return {value: text for value, text, _ in control.options} if control else {}
+
+    def find_controls(self, type_: Optional[str] = None, id_contains: str = '') -> List[FormControl]:
+        return [
+            c for c in self.controls
+            if (type_ is None or c.type == type_) and id_contains in (c.id or '')
+        ]
+
+    def form_fields(self, overrides: Dict[str, Optional[str]]) -> List[Tuple[str, str]]:
+        """Serialize the form like a browser would, with `overrides` applied (None = omit)"""
+        fields = []
+        for control in self.controls:
+            name = control.name
+            if not name or control.disabled or control.type in UNSUBMITTED_INPUT_TYPES:
+                continue
+            if name in overrides:
+                if overrides[name] is not None and (control.type != 'radio' or overrides[name] == control.value):
+                    if (name, overrides[name]) not in fields:
+                        fields.append((name, overrides[name]))
+                continue
+            if control.type in ('checkbox', 'radio'):
+                if control.checked:
+                    fields.append((name, control.value or 'on'))
+            elif control.tag == 'select':
+                value = control.selected_value()
+                if value is not None:
+                    fields.append((name, value))
+            else:
+                fields.append((name, control.value))
+        return fields
+
+
+class WebFormsClient:
+    """
+    Stateful HTTP session against a WebForms site
+
+    Values set with set()/check()/attach() are posted with the next postback
+    or click, after which the server's re-rendered page becomes current.
+    """
+
+    def __init__(self, transport: Optional[httpx.AsyncBaseTransport] = None, timeout: float = 60.0, recorder=None):
+        self.http = httpx.AsyncClient(
+            headers=BROWSER_HEADERS,
+            follow_redirects=True,
+            timeout=timeout,
+            transport=transport
+        )
+        self.page: Optional[WebFormsPage] = None
+        self.recorder = recorder
+        self.requests = 0
+        self.bytes_received = 0
+        self._values: Dict[str, Optional[str]] = {}
+        self._files: Dict[str, Tuple[str, bytes, str]] = {}
+
+    async def get(self, url: str, name: str = "get") -> WebFormsPage:
+        response = await self._send(name, 'GET', url)
+        return self._load_response(response)
+
+    def load(self, url: str, html: str) -> WebFormsPage:
+        """Make an already fetched page current (e.g. taken over from a browser)"""
+        self.page = WebFormsPage(url, html)
+        self._values.clear()
+        self._files.clear()
+        return self.page
+
+    def set(self, key: str, value: str):
+        control = self._require(key)
+        self._values[control.name] = value
+
+    def check(self, key: str, checked: bool = True):
+        control = self._require(key)
+        self._values[control.name] = (control.value or 'on') if checked else None
+
+    def attach(self, key: str, path: str, content_type: str = 'image/jpeg'):
+        control = self._require(key)
+        with open(path, 'rb') as f:
+            self._files[control.name] = (path.replace('\\', '/').rsplit('/', 1)[-1], f.read(), content_type)
+
+    async def postback(self, key: str, argument: str = '', name: str = "postback") -> httpx.Response:
+        """Replay __doPostBack for a control (AutoPostBack dropdown, checkbox, LinkButton)"""
+        control = self.page.control(key)
+        target = (control.postback_target or control.name) if control else key
+        return await self._submit(name, {'__EVENTTARGET': target, '__EVENTARGUMENT': argument})
+
+    async def click(self, key: str, name: str = "click") -> httpx.Response:
+        """Submit the form with a submit button"""
+        control = self._require(key)
+        if control.disabled:
+            raise UnknownPage(f"Button {key} is disabled on {self.page.url}")
+        if control.postback_target and control.type not in ('submit', 'image'):
+            return await self.postback(key, name=name)
+        return await self._submit(name, {'__EVENTTARGET': '', '__EVENTARGUMENT': '', control.name: control.value})
+
+    async def fetch(self, url: str, name: str = "fetch") -> httpx.Response:
+        """GET a resource (e.g. a document link) without changing the current page"""
+        return await self._send(name, 'GET', urljoin(self.page.url if self.page else url, url))
+
+    def cookies(self) -> List[Dict]:
+        """Session cookies in Playwright's storage_state format"""
+        cookies = []
+        for cookie in self.http.cookies.jar:
+            cookies.append({
+                "name": cookie.name,
+                "value": cookie.value,
+                "domain": cookie.domain,
+                "path": cookie.path or '/',
+                "expires": cookie.expires if cookie.expires else -1,
+                "httpOnly": bool(cookie.has_nonstandard_attr('HttpOnly')),
+                "secure": bool(cookie.secure),
+                "sameSite": "Lax"
+            })
+        return cookies
+
+    def set_cookies(self, cookies: List[Dict]):
+        for cookie in cookies:
+            self.http.cookies.set(
+                cookie["name"], cookie["value"],
+                domain=cookie.get("domain", ''), path=cookie.get("path", '/')
+            )
+
+    async def close(self):
+        await self.http.aclose()
+
+    def _require(self, key: str) -> FormControl:
+        if self.page is None:
+            raise UnknownPage("No page loaded")
+        return self.page.require(key)
+
+    async def _submit(self, name: str, extra: Dict[str, str]) -> httpx.Response:
+        if self.page is None:
+            raise UnknownPage("No page loaded")
+        overrides = dict(self._values)
+        overrides.update(extra)
+        fields = self.page.form_fields(overrides)
+        for key, value in extra.items():
+            if not any(field == key for field, _ in fields):
+                fields.append((key, value))
+
+        if self._files:
+            response = await self._send(name, 'POST', self.page.action, data=_as_form_dict(fields), files=self._files)
+        else:
+            response = await self._send(name, 'POST', self.page.action, data=_as_form_dict(fields))
+
+        if _is_html(response):
+            self._load_response(response)
+        return response
+
+    async def _send(self, name: str, method: str, url: str, **kwargs) -> httpx.Response:
+        started = time.monotonic()
+        ok = False
+        try:
+            response = await self.http.request(method, url, **kwargs)
+            self.requests += 1
+            self.bytes_received += len(response.content)
+            ok = response.status_code < 400
+            if response.status_code >= 500:
+                raise UnknownPage(f"{method} {url} returned HTTP {response.status_code}")
+            return response
+        finally:
+            if self.recorder:
+                self.recorder.record(name, started, ok)
+
+    def _load_response(self, response: httpx.Response) -> WebFormsPage:
+        self.page = WebFormsPage(str(response.url), response.text)
+        self._values.clear()
+        self._files.clear()
+        return self.page
+
+
+def _as_form_dict(fields: List[Tuple[str, str]]) -> Dict:
+    """httpx form data, keeping repeated names (multi-selects) as lists"""
+    data: Dict = {}
+    for name, value in fields:
+        if name in data:
+            data[name] = data[name] if isinstance(data[name], list) else [data[name]]
+            data[name].append(value)
+        else:
+            data[name] = value
+    return data
+
+
+def _is_html(response: httpx.Response) -> bool:
+    return 'html' in response.headers.get('content-type', '')